@@ -1,6 +1,5 @@
 from flask import Flask
 from flask_cors import CORS
-from app.routes.main import main_routes
 import os
 
 def create_app():
@@ -9,7 +8,20 @@ def create_app():
     app = Flask(__name__, template_folder=template_dir)
     CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-    # Registra el blueprint
+    # Logs estructurados en JSON escritos por un hilo aparte (antes de que Flask cree app.logger)
+    from app.modules.event_log import setup_logging
+    setup_logging()
+
+    # Registra el blueprint (import diferido para que app.modules se pueda usar sin cargar las rutas)
+    from app.routes.main import main_routes
     app.register_blueprint(main_routes)
 
+    # Latencia por ruta y solicitudes en curso para /metrics
+    from app.modules.metrics import instrument_app
+    instrument_app(app)
+
+    # Tareas de fondo registradas por las rutas (scraper de Wikiloc, parser HTML)
+    from app.modules.startup import start_warmup
+    start_warmup()
+
     return app
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os
+
+# Modo de servicio: "gevent" (E/S cooperativa: un worker mantiene decenas de llamadas
+# a x.ai, Azure, OpenWeather o NewsAPI en espera a la vez) o "sync" (un request por worker)
+SERVING_MODE = os.getenv("SERVING_MODE", "gevent")
+
+# Workers de gunicorn en esta instancia (gunicorn.conf.py lo exporta a los workers): los hilos de
+# precarga de cada worker se reparten entre todos la cuota de las APIs externas
+GUNICORN_WORKERS = max(1, int(os.getenv("GUNICORN_WORKERS", 1)))
+
+# Conexiones HTTP reutilizables por host; debe acompañar a la concurrencia de cada worker
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 64))
+
+# URLs base de los upstreams HTTP (las pruebas de carga de benchmarks/ las apuntan a sustitutos locales)
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+NEWSAPI_BASE_URL = os.getenv("NEWSAPI_BASE_URL", "https://newsapi.org").rstrip("/")
+XAI_BASE_URL = os.getenv("XAI_BASE_URL", "https://api.x.ai").rstrip("/")
+# Vacío: el endpoint regional de Azure (https://{AZURE_REGION}.tts.speech.microsoft.com)
+AZURE_TTS_BASE_URL = os.getenv("AZURE_TTS_BASE_URL", "").rstrip("/")
+
+
+_cooperative_grpc = None
+
+
+def init_cooperative_grpc():
+    """
+    Integra gRPC (Speech-to-Text) con el bucle de gevent.
+    Solo tiene efecto si gunicorn ya parcheó la librería estándar (worker gevent) y
+    debe llamarse antes de crear cualquier cliente gRPC; las llamadas siguientes no hacen nada.
+    """
+    global _cooperative_grpc
+    if _cooperative_grpc is None:
+        _cooperative_grpc = _init_cooperative_grpc()
+    return _cooperative_grpc
+
+
+def _init_cooperative_grpc():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    if not monkey.is_module_patched("socket"):
+        return False
+    from grpc.experimental import gevent as grpc_gevent
+    grpc_gevent.init_gevent()
+    return True
@@ -0,0 +1,133 @@
+import os
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+WIKILOC_URL = os.getenv("WIKILOC_URL", "https://www.wikiloc.com/trails/hiking/brazil/rio-de-janeiro/marica")
+# Las rutas cambian poco: un scrape cada 6 horas; tras un error se reintenta antes
+SCRAPE_INTERVAL = float(os.getenv("SCRAPE_INTERVAL", 6 * 3600))
+SCRAPE_RETRY_INTERVAL = float(os.getenv("SCRAPE_RETRY_INTERVAL", 600))
+SCRAPE_MAX_TRAILS = int(os.getenv("SCRAPE_MAX_TRAILS", 3))
+SCRAPE_ACTIVITIES = os.getenv("SCRAPE_ACTIVITIES", "1") == "1"
+
+# Solo se construye el árbol de los elementos de rutas (y sus hijos), no la página entera
+TRAIL_CLASSES = re.compile(r"^(trail__title|trail-item|trail-link)$")
+_trail_strainer = None
+
+
+def load_parser():
+    """
+    Importa BeautifulSoup/lxml la primera vez (lo usa solo el hilo del scraper) y prepara el filtro.
+    """
+    global _trail_strainer
+    if _trail_strainer is None:
+        from bs4 import SoupStrainer
+        import lxml.etree  # noqa: F401 (carga el parser aquí y no en el primer scrape)
+        _trail_strainer = SoupStrainer(["div", "a"], class_=TRAIL_CLASSES)
+    return _trail_strainer
+
+
+def parse_trails(html, limit=SCRAPE_MAX_TRAILS):
+    """
+    Extrae [{"title", "link"}] de la página de Wikiloc con una pasada lxml restringida a las rutas.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml", parse_only=load_parser())
+    trails = []
+    for element in soup.select("div.trail__title, div.trail-item, a.trail-link"):
+        link_tag = element if element.name == "a" else element.find("a")
+        if not link_tag or "href" not in link_tag.attrs or not link_tag.text.strip():
+            continue
+        link = link_tag["href"]
+        if not link.startswith("http"):
+            link = f"https://www.wikiloc.com{link}"
+        trails.append({"title": link_tag.text.strip(), "link": link})
+        if len(trails) >= limit:
+            break
+    return trails
+
+
+def format_trails(trails):
+    response_text = "Aquí tienes algunas rutas de senderismo en Maricá desde Wikiloc:\n"
+    for trail in trails:
+        response_text += f"- {trail['title']}: {trail['link']}\n"
+    return response_text
+
+
+class TrailCache:
+    """
+    Última lista de rutas obtenida por el scraper, con su fecha y el último error.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trails = []
+        self._updated_at = None
+        self._error = None
+
+    def store(self, trails):
+        with self._lock:
+            self._trails = trails
+            self._updated_at = time.time()
+            self._error = None
+
+    def fail(self, error):
+        with self._lock:
+            self._error = str(error)
+
+    def snapshot(self):
+        with self._lock:
+            updated_at = self._updated_at
+            return {
+                "trails": list(self._trails),
+                "updated_at": datetime.fromtimestamp(updated_at, timezone.utc).isoformat(timespec="seconds") if updated_at else None,
+                "error": self._error,
+            }
+
+
+trail_cache = TrailCache()
+
+_scraper = None
+
+
+def start_trail_scraper(fetch_html, interval=SCRAPE_INTERVAL, delay=0.0):
+    """
+    Scrapea Wikiloc en segundo plano: fetch_html() -> HTML, cada `interval` segundos
+    (SCRAPE_RETRY_INTERVAL tras un error). `delay` es la pausa de cortesía antes de cada
+    scrape, que ya no paga ningún usuario. Un solo hilo por proceso.
+    """
+    global _scraper
+    if _scraper is not None or not SCRAPE_ACTIVITIES:
+        return _scraper
+
+    def run():
+        while True:
+            time.sleep(delay)
+            wait = interval
+            try:
+                trails = parse_trails(fetch_html())
+                trail_cache.store(trails)
+                logger.debug(f"Rutas de Wikiloc actualizadas: {len(trails)}")
+            except Exception as e:
+                logger.error(f"No se pudieron scrapear las rutas de Wikiloc: {e}")
+                trail_cache.fail(e)
+                wait = min(interval, SCRAPE_RETRY_INTERVAL)
+            time.sleep(wait)
+
+    _scraper = threading.Thread(target=run, name="wikiloc-scraper", daemon=True)
+    _scraper.start()
+    return _scraper
+
+
+def _reset_after_fork():
+    global _scraper
+    _scraper = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,332 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, namedtuple
+
+from app.modules.metrics import cache_event
+
+IntentMatch = namedtuple("IntentMatch", ["intent", "keyword", "start", "end"])
+
+# Palabras clave por intención (pt, es, en, fr, it). Se comparan sin mayúsculas ni acentos y como
+# palabras o frases completas ("rain" no coincide en "Ukraine" ni "trail" en "trailer"), así que
+# los plurales que importan se escriben aparte.
+INTENT_KEYWORDS = {
+    "climate": [
+        "clima", "tempo", "temperatura", "chuva", "sol", "nublado", "tiempo", "weather", "calor",
+        "frío", "lluvia", "qué clima", "qué tiempo", "qué tiempo es", "hace en", "météo",
+        "previsão", "forecast", "rain", "raining", "pioggia", "pluie",
+    ],
+    "beach": [
+        "playas", "playa", "bañar", "baño", "plage", "baignade",
+        "praia", "banho de mar", "beach", "spiaggia",
+    ],
+    "time": [
+        "qué hora es", "hora actual", "horas", "quelle heure", "heure actuelle",
+        "hora atual", "what time is it", "current time", "che ore sono", "che ora è",
+    ],
+    "emergency": [
+        "inundação", "incêndio", "emergência", "desastre", "acidente",
+        "inundación", "incendio", "accidente", "flood", "emergency", "accident",
+        "inondation", "incendie", "urgence", "alluvione", "emergenza", "incidente",
+    ],
+    "news": [
+        "actual", "noticias", "noticia", "notícias", "news", "papa", "pope", "pontífice", "presidente",
+        "gobierno", "elección", "evento", "crisis", "conflicto", "falleció",
+        "muerte", "nuevo", "reciente", "hoy", "ayer", "emergência", "segurança",
+        "saúde", "inundação", "incêndio", "festas", "museus", "cultura",
+        "permacultura", "meditação", "yoga", "culto", "ayahuasca", "creyentes",
+        "trilhas", "motos", "crente", "caiçara",
+    ],
+    "activity": [
+        "trilha", "trilhas", "senderismo", "sendero", "senderos", "caminata", "caminatas",
+        "hiking", "trail", "trails", "randonnée", "sentier", "sentiers", "escursione", "escursioni",
+        "sentiero", "sentieri",
+    ],
+    "pope": ["papa", "pope", "pontífice"],
+    "current": ["actual", "atual", "current"],
+    "death": ["falleció", "died"],
+    # Preguntas que dependen del momento (no se guardan en la caché de respuestas)
+    "temporal": [
+        "hoje", "agora", "amanhã", "ontem", "hoy", "ahora", "mañana", "ayer",
+        "today", "right now", "tomorrow", "yesterday", "aujourd'hui", "maintenant", "demain",
+        "oggi", "adesso", "domani", "ieri",
+    ],
+}
+
+# Tipo de emergencia canónico (las claves de los números y consejos están en portugués)
+EMERGENCY_TYPES = {
+    "inundación": "inundação", "flood": "inundação", "inondation": "inundação", "alluvione": "inundação",
+    "incendio": "incêndio", "incendie": "incêndio",
+    "emergency": "emergência", "urgence": "emergência", "emergenza": "emergência",
+    "accidente": "acidente", "accident": "acidente", "incidente": "acidente",
+}
+
+
+# Palabras que solo coinciden con la misma acentuación: "papá" (padre, es) no es "papa" (pontífice)
+ACCENT_SENSITIVE = {"papa"}
+
+
+def _fold(char):
+    """
+    Un carácter en minúsculas y sin acento (siempre un solo carácter, para conservar las posiciones).
+    """
+    lowered = char.lower()
+    if len(lowered) != 1:
+        return char
+    return unicodedata.normalize("NFKD", lowered)[0]
+
+
+def fold_text(text):
+    return "".join(_fold(c) for c in text)
+
+
+def _lower(text):
+    # Minúsculas carácter a carácter sin cambiar la longitud (las posiciones coinciden con fold_text)
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+class IntentMatcher:
+    """
+    Autómata de Aho-Corasick sobre todas las palabras clave de todas las intenciones:
+    recorre el texto una sola vez y devuelve cada coincidencia con su intención y posición.
+    """
+
+    def __init__(self, intent_keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for intent, keywords in intent_keywords.items():
+            for keyword in keywords:
+                self._add(fold_text(keyword), intent, keyword)
+        self._build_failure_links()
+
+    def _add(self, pattern, intent, keyword):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((intent, keyword, len(pattern)))
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def matches(self, text):
+        """
+        Coincidencias de palabras o frases completas: el autómata recorre el texto normalizado
+        una vez y se descartan las que empiezan o terminan dentro de una palabra.
+        """
+        found = []
+        state = 0
+        folded = fold_text(text)
+        lowered = None
+        for position, char in enumerate(folded):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for intent, keyword, length in self._output[state]:
+                start, end = position + 1 - length, position + 1
+                if start > 0 and folded[start - 1].isalnum():
+                    continue
+                if end < len(folded) and folded[end].isalnum():
+                    continue
+                if keyword in ACCENT_SENSITIVE:
+                    if lowered is None:
+                        lowered = _lower(text)
+                    if lowered[start:end] != keyword:
+                        continue
+                found.append(IntentMatch(intent, keyword, start, end))
+        found.sort(key=lambda m: (m.start, -m.end))
+        return found
+
+
+# Autómata construido una sola vez al importar el módulo
+intent_matcher = IntentMatcher(INTENT_KEYWORDS)
+
+
+def classify(text):
+    """
+    Devuelve {intención: [IntentMatch, ...]} con todas las intenciones presentes en el texto,
+    cada lista en orden de aparición.
+    """
+    intents = {}
+    for match in intent_matcher.matches(text):
+        intents.setdefault(match.intent, []).append(match)
+    return intents
+
+
+# Caché de respuestas del modelo para preguntas generales repetidas
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_BYTES = int(os.getenv("ANSWER_CACHE_BYTES", 2 * 1024 * 1024))
+# Intenciones cuyas respuestas nunca se guardan (además de los prompts con ubicación)
+ANSWER_CACHE_SKIP_INTENTS = frozenset(
+    intent.strip() for intent in os.getenv("ANSWER_CACHE_SKIP_INTENTS", "temporal,news,pope").split(",") if intent.strip()
+)
+
+# Muletillas, saludos y nombres de las asistentes: no cambian la pregunta
+FILLER_WORDS = frozenset([
+    "oi", "ola", "hola", "hey", "hi", "hello", "bonjour", "salut", "ciao", "ei",
+    "please", "porfavor", "um", "uh", "eh", "ah", "hmm", "bueno", "pues", "entao", "well",
+    "alors", "allora", "yara", "jenny", "dania", "denise", "isabella", "iuri",
+])
+FILLER_PHRASES = re.compile(r"\b(por favor|per favore|s il vous plait|me diga|dime|tell me)\b")
+
+
+def normalize_question(text):
+    """
+    Forma canónica de una pregunta: sin mayúsculas, acentos, puntuación ni muletillas.
+    """
+    folded = FILLER_PHRASES.sub(" ", " ".join(re.findall(r"\w+", fold_text(text))))
+    return " ".join(word for word in folded.split() if word not in FILLER_WORDS)
+
+
+def answer_cache_key(system_message, language, question):
+    raw = "\x1f".join([system_message, language, normalize_question(question)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(intents, has_location):
+    return not has_location and not ANSWER_CACHE_SKIP_INTENTS.intersection(intents)
+
+
+class AnswerCache:
+    """
+    Respuestas del modelo por (persona, idioma, pregunta normalizada): TTL y LRU limitada por bytes.
+    Cuenta aciertos y la latencia de upstream que se ahorró en cada acierto.
+    """
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_bytes=ANSWER_CACHE_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1].encode("utf-8"))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_ms += entry[2]
+        cache_event("answers", "miss" if entry is None else "hit")
+        return entry[1] if entry is not None else None
+
+    def put(self, key, answer, upstream_ms):
+        size = len(answer.encode("utf-8"))
+        if not answer or size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, answer, upstream_ms)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+                "bytes": self._size,
+                "entries": len(self._entries),
+            }
+
+
+answer_cache = AnswerCache()
+
+
+BOLD_MARKERS = re.compile(r"\*\*.*?\*\*")
+EMOJI = re.compile(r"[\U0001F000-\U0001FFFF]")
+
+
+def clean_answer(text):
+    """
+    Quita las marcas de negrita (**...**) y los emojis de una respuesta completa.
+    """
+    text = BOLD_MARKERS.sub(lambda m: m.group(0).replace("**", ""), text)
+    return EMOJI.sub("", text).strip()
+
+
+class AnswerStreamCleaner:
+    """
+    La misma limpieza que clean_answer aplicada a una respuesta que llega por fragmentos:
+    feed() devuelve el texto que ya se puede mostrar y retiene solo lo que aún es ambiguo
+    (un "*" final o una negrita sin cerrar); finish() entrega el resto.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, delta):
+        text = self._pending + EMOJI.sub("", delta)
+        output = []
+        while True:
+            start = text.find("**")
+            if start < 0:
+                break
+            end = text.find("**", start + 2)
+            newline = text.find("\n", start + 2)
+            if end >= 0 and (newline < 0 or end < newline):
+                output.append(text[:start] + text[start + 2:end])
+                text = text[end + 2:]
+            elif newline >= 0:
+                # Como en la expresión regular, una negrita no cruza líneas: el "**" se queda tal cual
+                output.append(text[:newline + 1])
+                text = text[newline + 1:]
+            else:
+                output.append(text[:start])
+                text = text[start:]
+                self._pending = text
+                return self._emit("".join(output))
+        if text.endswith("*"):
+            output.append(text[:-1])
+            self._pending = "*"
+        else:
+            output.append(text)
+            self._pending = ""
+        return self._emit("".join(output))
+
+    def finish(self):
+        text, self._pending = self._pending, ""
+        return self._emit(text)
@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# Nivel por defecto: con INFO los eventos de depuración solo cuestan una comparación
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Muestreo por evento: "stt.response=0.1,llm.*=0.05,*=1" (los WARNING y ERROR no se muestrean)
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+# Los campos más largos se recortan y llevan un hash del valor completo para poder correlacionarlos
+LOG_MAX_FIELD = int(os.getenv("LOG_MAX_FIELD", 200))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Configuración en caliente compartida por los workers del contenedor (la escribe POST /log-config)
+LOG_CONFIG_FILE = os.getenv("LOG_CONFIG_FILE", "/tmp/voz_log_config.json")
+LOG_CONFIG_CHECK_INTERVAL = float(os.getenv("LOG_CONFIG_CHECK_INTERVAL", 2))
+LOG_ADMIN_TOKEN = os.getenv("LOG_ADMIN_TOKEN")
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+
+def parse_sample_rates(spec):
+    """
+    "evento=tasa,prefijo.*=tasa" -> {evento: tasa}. Las tasas se limitan a [0, 1].
+    """
+    rates = {}
+    for item in spec.split(","):
+        name, sep, rate = item.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def _digest(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8", "replace")
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+def log_field(value):
+    """
+    Valor listo para JSON: escalares tal cual, bytes como tamaño y hash, y el resto como texto
+    recortado a LOG_MAX_FIELD caracteres.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": len(value), "sha1": _digest(bytes(value))}
+    if isinstance(value, BaseException):
+        text = f"{type(value).__name__}: {value}"
+    elif isinstance(value, str):
+        text = value
+    elif isinstance(value, (dict, list, tuple)):
+        text = json.dumps(value, ensure_ascii=False, default=str)
+        if len(text) <= LOG_MAX_FIELD:
+            return value
+    else:
+        text = str(value)
+    if len(text) <= LOG_MAX_FIELD:
+        return text
+    return {"truncated": text[:LOG_MAX_FIELD], "len": len(text), "sha1": _digest(text)}
+
+
+class LogConfig:
+    """
+    Nivel y tasas de muestreo vigentes. Parte de LOG_LEVEL/LOG_SAMPLE_RATES y, si existe,
+    LOG_CONFIG_FILE los sustituye; el fichero se revisa como mucho cada LOG_CONFIG_CHECK_INTERVAL s.
+    """
+
+    def __init__(self, path=LOG_CONFIG_FILE, check_interval=LOG_CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._mtime = None
+        self._apply(LOG_LEVEL, parse_sample_rates(LOG_SAMPLE_RATES))
+
+    def _apply(self, level, sample_rates):
+        self.level = level if level in LEVELS else "INFO"
+        self.sample_rates = sample_rates
+        logging.getLogger().setLevel(self.level)
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            if mtime is None:
+                self._apply(LOG_LEVEL, parse_sample_rates(LOG_SAMPLE_RATES))
+                return
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                self._apply(str(data.get("level", LOG_LEVEL)).upper(), {
+                    name: min(1.0, max(0.0, float(rate))) for name, rate in (data.get("sample_rates") or {}).items()
+                })
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                logging.getLogger(__name__).error(f"Configuración de logs no válida en {self.path}: {e}")
+
+    def update(self, level=None, sample_rates=None):
+        """
+        Guarda la nueva configuración en LOG_CONFIG_FILE (la recogen todos los workers) y la aplica ya.
+        """
+        level = (level or self.level).upper()
+        if level not in LEVELS:
+            raise ValueError(f"Nivel no válido: {level}. Opciones: {', '.join(LEVELS)}")
+        if sample_rates is None:
+            sample_rates = self.sample_rates
+        sample_rates = {str(name): min(1.0, max(0.0, float(rate))) for name, rate in sample_rates.items()}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"level": level, "sample_rates": sample_rates}, f)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._checked_at = 0.0
+        self.refresh()
+
+    def reset(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._checked_at = 0.0
+        self.refresh()
+
+    def sample_rate(self, event):
+        rates = self.sample_rates
+        if not rates:
+            return 1.0
+        rate = rates.get(event)
+        if rate is None:
+            rate = rates.get(event.split(".", 1)[0] + ".*", rates.get("*", 1.0))
+        return rate
+
+    def snapshot(self):
+        return {"level": self.level, "sample_rates": dict(self.sample_rates), "file": self.path}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una línea JSON por registro. Los eventos de EventLogger traen sus campos ya preparados;
+    los registros del logging estándar se escriben con su mensaje.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            entry["event"] = record.msg
+            entry.update(fields)
+        else:
+            entry["message"] = log_field(record.getMessage())
+        if record.exc_text:
+            entry["exception"] = record.exc_text[-2000:]
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Encola el registro sin formatearlo y sin bloquear: si la cola está llena se descarta y se cuenta.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Los campos ya vienen preparados; el mensaje del logging estándar se resuelve aquí
+        # porque sus argumentos podrían cambiar antes de que lo escriba el hilo de salida
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        # La traza se formatea ya (solo en errores) para no retener los frames hasta que se escriba
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+log_config = LogConfig()
+
+_handler = None
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(stream=None):
+    """
+    Envía todo el logging del proceso a una cola; un hilo la vacía escribiendo JSON en stdout.
+    Un solo hilo por proceso (se vuelve a crear tras un fork).
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return _handler
+    with _setup_lock:
+        if _listener is not None:
+            return _handler
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        root = logging.getLogger()
+        if _handler is not None:
+            root.removeHandler(_handler)
+        _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        root.addHandler(_handler)
+        root.setLevel(log_config.level)
+        _listener = QueueListener(_handler.queue, output, respect_handler_level=False)
+        _listener.start()
+    return _handler
+
+
+def _stop_listener():
+    # Al salir se escriben los registros que queden en la cola
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def _reset_after_fork():
+    global _listener
+    _listener = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _request_fields():
+    if not has_request_context():
+        return {}
+    if "request_id" not in g:
+        g.request_id = request.headers.get("X-Request-ID") or os.urandom(6).hex()
+    return {"request_id": g.request_id, "path": request.path}
+
+
+class EventLogger:
+    """
+    Eventos con nombre y campos: `log.debug("stt.response", results=3)`. Si el nivel no está
+    activo o el muestreo descarta el evento no se formatea nada; si se emite, los campos se
+    preparan (recortados o con hash) y la escritura la hace el hilo de la cola.
+    """
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(name)
+
+    def _emit(self, level, event, fields, exc_info=False):
+        log_config.refresh()
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            rate = log_config.sample_rate(event)
+            if rate < 1.0 and random.random() >= rate:
+                return
+        if _listener is None:
+            setup_logging()
+        prepared = _request_fields()
+        for key, value in fields.items():
+            prepared[key] = log_field(value)
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": prepared})
+
+    def debug(self, event, **fields):
+        self._emit(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._emit(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._emit(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._emit(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        """
+        Como error(), con la traza de la excepción que se está gestionando.
+        """
+        self._emit(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_event_logger(name):
+    return EventLogger(name)
+
+
+def log_config_request(method, data, token):
+    """
+    Consulta (GET) o cambia (POST {"level", "sample_rates"} o {"reset": true}) la configuración
+    de logs en caliente; devuelve (payload, status). Requiere LOG_ADMIN_TOKEN.
+    """
+    if not LOG_ADMIN_TOKEN:
+        return {"error": "Configuración de logs en caliente desactivada (falta LOG_ADMIN_TOKEN)"}, 404
+    if token != LOG_ADMIN_TOKEN:
+        return {"error": "Token no válido"}, 403
+    if method == "POST":
+        data = data or {}
+        try:
+            if data.get("reset"):
+                log_config.reset()
+            else:
+                log_config.update(data.get("level"), data.get("sample_rates"))
+        except (ValueError, TypeError, AttributeError) as e:
+            return {"error": str(e)}, 400
+        except OSError as e:
+            return {"error": f"No se pudo guardar la configuración: {e}"}, 500
+    payload = log_config.snapshot()
+    payload["dropped"] = _handler.dropped if _handler is not None else 0
+    return payload, 200
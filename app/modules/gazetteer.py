@@ -0,0 +1,253 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+Place = namedtuple("Place", ["name", "lat", "lon", "country"])
+
+# Lugares conocidos con coordenadas precalculadas: (nombre, lat, lon, país)
+PLACES = [
+    ("Maricá", -22.91889, -42.81889, "BR"),
+    ("Itaipuaçu", -22.9669, -42.9486, "BR"),
+    ("Ponta Negra", -22.9575, -42.6936, "BR"),
+    ("Espraiado", -22.8700, -42.7700, "BR"),
+    ("Pedra de Inoã", -22.9200, -42.9300, "BR"),
+    ("Serra da Tiririca", -22.9300, -43.0200, "BR"),
+    ("Saquarema", -22.9200, -42.5103, "BR"),
+    ("Niterói", -22.8833, -43.1036, "BR"),
+    ("São Gonçalo", -22.8269, -43.0539, "BR"),
+    ("Araruama", -22.8728, -42.3431, "BR"),
+    ("Iguaba Grande", -22.8389, -42.2289, "BR"),
+    ("Búzios", -22.7469, -41.8817, "BR"),
+    ("Cabo Frio", -22.8789, -42.0189, "BR"),
+    ("Arraial do Cabo", -22.9661, -42.0278, "BR"),
+    ("São Pedro da Aldeia", -22.8392, -42.1028, "BR"),
+    ("Rio das Ostras", -22.5269, -41.9450, "BR"),
+    ("Macaé", -22.3708, -41.7869, "BR"),
+    ("Barra de Sana", -22.3167, -42.1833, "BR"),
+    ("Casimiro de Abreu", -22.4806, -42.2042, "BR"),
+    ("Silva Jardim", -22.6508, -42.3917, "BR"),
+    ("Rio Bonito", -22.7081, -42.6086, "BR"),
+    ("Tanguá", -22.7300, -42.7200, "BR"),
+    ("Itaboraí", -22.7445, -42.8597, "BR"),
+    ("Magé", -22.6528, -43.0406, "BR"),
+    ("Guapimirim", -22.5372, -42.9817, "BR"),
+    ("Petrópolis", -22.5050, -43.1786, "BR"),
+    ("Teresópolis", -22.4128, -42.9664, "BR"),
+    ("Nova Friburgo", -22.2819, -42.5311, "BR"),
+    ("São José do Vale do Rio Preto", -22.1522, -42.9244, "BR"),
+    ("Rio de Janeiro", -22.9068, -43.1729, "BR"),
+    ("Copacabana", -22.9711, -43.1822, "BR"),
+    ("Duque de Caxias", -22.7856, -43.3117, "BR"),
+    ("Nova Iguaçu", -22.7592, -43.4511, "BR"),
+    ("Volta Redonda", -22.5231, -44.1042, "BR"),
+    ("Barra Mansa", -22.5444, -44.1714, "BR"),
+    ("Resende", -22.4689, -44.4469, "BR"),
+    ("Itatiaia", -22.4961, -44.5636, "BR"),
+    ("Penedo", -22.4408, -44.5292, "BR"),
+    ("Visconde de Mauá", -22.3336, -44.5386, "BR"),
+    ("Parque Nacional de Itatiaia", -22.4500, -44.6100, "BR"),
+    ("Angra dos Reis", -23.0067, -44.3181, "BR"),
+    ("Paraty", -23.2178, -44.7131, "BR"),
+    ("São Paulo", -23.5505, -46.6333, "BR"),
+    ("Buenos Aires", -34.6037, -58.3816, "AR"),
+    ("Londres", 51.5074, -0.1278, "GB"),
+    ("Grimsby", 53.5675, -0.0800, "GB"),
+    ("Tokio", 35.6762, 139.6503, "JP"),
+]
+
+# Parques, trilhas y otros lugares que se mencionan por nombre pero no se geocodifican aparte
+LANDMARKS = [
+    "Parque Natural Municipal Morada dos Corrêas",
+    "Reserva Natural de Massambaba",
+    "Pedra do Macaco",
+    "Trilha da Pedra do Macaco",
+    "Cachoeira do Segredo em Silvado",
+    "Lagoa de Araruama",
+    "Tribo Nawa Ayahuasca Maricá",
+]
+
+# Gentilicios que aparecen en las preguntas ("praias fluminenses", "o buziano")
+DEMONYMS = ["fluminense", "buziano", "maricaense", "niteroiense", "saquaremense", "cabo-friense"]
+
+# Variantes y gentilicios -> nombre canónico (se buscan también dentro de una frase)
+ALIASES = {
+    "armação dos búzios": "Búzios",
+    "buziano": "Búzios",
+    "maricaense": "Maricá",
+    "niteroiense": "Niterói",
+    "saquaremense": "Saquarema",
+    "cabo-friense": "Cabo Frio",
+    "cabofriense": "Cabo Frio",
+    "itatiaia parque": "Parque Nacional de Itatiaia",
+    "parque nacional do itatiaia": "Parque Nacional de Itatiaia",
+    "parati": "Paraty",
+    "london": "Londres",
+    "tokyo": "Tokio",
+}
+
+# Errores frecuentes de reconocimiento y nombres ambiguos: solo valen cuando son el nombre
+# completo que se quiere resolver ("direi", "rio" o "green" son palabras corrientes en una frase)
+CANDIDATE_ALIASES = {
+    "rio": "Rio de Janeiro",
+    "grisby": "Grimsby",
+    "grinsby": "Grimsby",
+    "direi": "Grimsby",
+    "green": "Grimsby",
+    "greensville": "Grimsby",
+}
+
+
+def normalize(text):
+    """
+    Minúsculas, sin acentos y con la puntuación reducida a espacios.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+_PHONETIC_RULES = [
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"ch|sh"), "x"),
+    (re.compile(r"lh"), "li"),
+    (re.compile(r"nh"), "ni"),
+    (re.compile(r"c(?=[eiy])"), "s"),
+    (re.compile(r"g(?=[eiy])"), "j"),
+    (re.compile(r"qu|k"), "c"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"y"), "i"),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"h"), ""),
+    (re.compile(r"(.)\1+"), r"\1"),
+    (re.compile(r"[aeiou]+$"), ""),
+]
+
+
+# Con las vocales finales fuera, las claves cortas coinciden con palabras corrientes ("rua" -> "r" -> Rio)
+PHONETIC_MIN_KEY = 4
+
+
+def phonetic_key(text):
+    """
+    Clave fonética aproximada para pt/es (ss/ç/z suenan igual, h muda, dobles simples...).
+    """
+    key = normalize(text).replace(" ", "")
+    for pattern, replacement in _PHONETIC_RULES:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def edit_distance(a, b, limit):
+    """
+    Distancia de Levenshtein con corte temprano: devuelve limit + 1 si la supera.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        best = i
+        for j, cb in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            current.append(value)
+            best = min(best, value)
+        if best > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _build_index():
+    places = [Place(*row) for row in PLACES]
+    by_name = {p.name: p for p in places}
+    exact = {}
+    phonetic = {}
+    for place in places:
+        exact[normalize(place.name)] = place
+        phonetic.setdefault(phonetic_key(place.name), place)
+    for alias, name in ALIASES.items():
+        exact[normalize(alias)] = by_name[name]
+        phonetic.setdefault(phonetic_key(alias), by_name[name])
+    candidates = dict(exact)
+    text_phonetic = dict(phonetic)
+    for alias, name in CANDIDATE_ALIASES.items():
+        candidates[normalize(alias)] = by_name[name]
+        phonetic.setdefault(phonetic_key(alias), by_name[name])
+    return (exact, text_phonetic), (candidates, phonetic)
+
+
+# Índices (exacto, fonético) construidos una sola vez al importar el módulo: _TEXT para buscar en
+# frases, _CANDIDATES (con los alias de reconocimiento) para resolver un nombre completo
+_TEXT, _CANDIDATES = _build_index()
+_MAX_WORDS = max(len(name.split()) for name in _TEXT[0])
+
+
+def _fuzzy_limit(length):
+    # Nombres cortos solo por coincidencia exacta o fonética ("Maria" no es "Maricá")
+    if length <= 5:
+        return 0
+    if length <= 8:
+        return 1
+    return max(2, length // 6)
+
+
+def _resolve_approximate(normalized, index):
+    """
+    Coincidencia fonética (con clave de al menos PHONETIC_MIN_KEY letras) y después por distancia de edición.
+    """
+    exact, phonetic = index
+    key = phonetic_key(normalized)
+    if len(key) >= PHONETIC_MIN_KEY and key in phonetic:
+        return phonetic[key]
+    limit = _fuzzy_limit(len(normalized))
+    if limit == 0:
+        return None
+    best, best_distance = None, limit + 1
+    for candidate, candidate_place in exact.items():
+        distance = edit_distance(normalized, candidate, limit)
+        if distance < best_distance:
+            best, best_distance = candidate_place, distance
+    return best
+
+
+def resolve_place(name):
+    """
+    Resuelve un nombre de lugar sin red: coincidencia exacta sin acentos, luego fonética
+    y por último distancia de edición. Devuelve un Place o None si no se reconoce.
+    """
+    normalized = normalize(name)
+    if not normalized:
+        return None
+    return _CANDIDATES[0].get(normalized) or _resolve_approximate(normalized, _CANDIDATES)
+
+
+def _ngrams(words):
+    for size in range(min(_MAX_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            yield " ".join(words[start:start + size])
+
+
+def find_place_in_text(text):
+    """
+    Busca el lugar conocido más largo mencionado en el texto (por grupos de palabras): primero
+    por coincidencia exacta y, si no hay, fonética o por distancia de edición ("tempo em Rezende").
+    Sin los alias de reconocimiento, que son palabras corrientes dentro de una frase.
+    """
+    words = normalize(text).split()
+    for phrase in _ngrams(words):
+        place = _TEXT[0].get(phrase)
+        if place:
+            return place
+    for phrase in _ngrams(words):
+        place = _resolve_approximate(phrase, _TEXT)
+        if place:
+            return place
+    return None
+
+
+def place_phrases():
+    """
+    Nombres de lugares para sesgar el reconocimiento de voz: los lugares con coordenadas,
+    los parques y trilhas y los gentilicios (no los alias, que incluyen errores de reconocimiento).
+    """
+    return [row[0] for row in PLACES] + LANDMARKS + DEMONYMS
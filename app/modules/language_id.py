@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import unicodedata
+
+LANGUAGE_ID_MIN_CONFIDENCE = float(os.getenv("LANGUAGE_ID_MIN_CONFIDENCE", 0.6))
+NGRAM_ORDERS = (1, 2, 3, 4)
+SMOOTHING = 0.5
+
+# Textos de referencia por idioma: frases del dominio del asistente (clima, playas, noticias,
+# horarios, emergencias, paseos) más las palabras funcionales de cada lengua
+CORPORA = {
+    "pt": (
+        "Como está o tempo hoje em Maricá? Vai chover amanhã na praia de Itaipuaçu? "
+        "Qual é a temperatura agora em Niterói e no Rio de Janeiro? Está fazendo muito calor. "
+        "As condições são boas para tomar banho de mar? Quais são as notícias de hoje na cidade? "
+        "Que horas são agora? Eu queria saber onde fica a trilha da pedra do macaco. "
+        "Não encontrei informações sobre este tema, você pode me ajudar? Obrigado, muito obrigada. "
+        "Houve uma inundação no bairro, precisamos chamar os bombeiros e a defesa civil. "
+        "Quem é o papa atual? Eu gostaria de conhecer os eventos e as festas do fim de semana. "
+        "Vocês sabem se o ônibus passa pela estrada? Ela não está em casa, mas ele vai voltar logo. "
+        "Também quero ir à cachoeira com meus amigos, porque está um dia lindo de sol. "
+        "Onde posso comer peixe perto da lagoa? A previsão diz que vai ficar nublado à tarde. "
+        "Isso é muito bom, não é? Então a gente se vê depois, tudo bem com você? "
+        "Me conta uma piada, me fala uma curiosidade sobre a cidade. Olá, bom dia, boa noite."
+    ),
+    "es": (
+        "¿Qué tiempo hace hoy en Maricá? ¿Va a llover mañana en la playa de Itaipuaçu? "
+        "¿Cuál es la temperatura ahora en Niterói y en Río de Janeiro? Hace mucho calor. "
+        "¿Las condiciones son buenas para bañarse en el mar? ¿Cuáles son las noticias de hoy en la ciudad? "
+        "¿Qué hora es ahora? Quería saber dónde queda el sendero de la piedra del mono. "
+        "No encontré información sobre este tema, ¿me puedes ayudar? Gracias, muchas gracias. "
+        "Hubo una inundación en el barrio, necesitamos llamar a los bomberos y a defensa civil. "
+        "¿Quién es el papa actual? Me gustaría conocer los eventos y las fiestas del fin de semana. "
+        "¿Ustedes saben si el colectivo pasa por la ruta? Ella no está en casa, pero él va a volver pronto. "
+        "También quiero ir a la cascada con mis amigos, porque hay un día hermoso de sol. "
+        "¿Dónde puedo comer pescado cerca de la laguna? El pronóstico dice que va a estar nublado a la tarde. "
+        "Eso es muy bueno, ¿no? Entonces nos vemos después, ¿todo bien contigo? Dame el clima, por favor. "
+        "Contame un chiste, decime algo curioso sobre la ciudad. Hola, buenos días, buenas noches."
+    ),
+    "en": (
+        "What is the weather like today in Maricá? Is it going to rain tomorrow at the beach? "
+        "What is the temperature right now in Niterói and in Rio de Janeiro? It is very hot. "
+        "Are the conditions good for swimming in the sea? What are the news today in the city? "
+        "What time is it now? I would like to know where the monkey rock trail is. "
+        "I could not find information about this topic, can you help me? Thanks, thank you very much. "
+        "There was a flood in the neighborhood, we need to call the firefighters and civil defense. "
+        "Who is the current pope? I would like to know about the events and parties this weekend. "
+        "Do you know if the bus goes along the road? She is not at home, but he will be back soon. "
+        "I also want to go to the waterfall with my friends, because it is a beautiful sunny day. "
+        "Where can I eat fish near the lagoon? The forecast says that it will be cloudy in the afternoon. "
+        "That is very good, isn't it? Then we will see each other later, how are you doing? "
+        "Tell me a joke, tell me something interesting about the town. Hello, good morning, good night."
+    ),
+    "fr": (
+        "Quel temps fait-il aujourd'hui à Maricá? Est-ce qu'il va pleuvoir demain sur la plage? "
+        "Quelle est la température maintenant à Niterói et à Rio de Janeiro? Il fait très chaud. "
+        "Les conditions sont-elles bonnes pour se baigner dans la mer? Quelles sont les nouvelles du jour? "
+        "Quelle heure est-il maintenant? Je voudrais savoir où se trouve le sentier de la pierre du singe. "
+        "Je n'ai pas trouvé d'informations sur ce sujet, pouvez-vous m'aider? Merci, merci beaucoup. "
+        "Il y a eu une inondation dans le quartier, nous devons appeler les pompiers et la défense civile. "
+        "Qui est le pape actuel? J'aimerais connaître les événements et les fêtes du week-end. "
+        "Savez-vous si le bus passe par la route? Elle n'est pas à la maison, mais il va revenir bientôt. "
+        "Je veux aussi aller à la cascade avec mes amis, parce que c'est une belle journée de soleil. "
+        "Où est-ce que je peux manger du poisson près de la lagune? La météo dit qu'il y aura des nuages cet après-midi. "
+        "C'est très bien, n'est-ce pas? Alors on se voit plus tard, comment ça va? "
+        "Raconte-moi une blague, dis-moi quelque chose de curieux sur la ville. Bonjour, bonsoir."
+    ),
+    "it": (
+        "Che tempo fa oggi a Maricá? Domani pioverà sulla spiaggia di Itaipuaçu? "
+        "Qual è la temperatura adesso a Niterói e a Rio de Janeiro? Fa molto caldo. "
+        "Le condizioni sono buone per fare il bagno nel mare? Quali sono le notizie di oggi in città? "
+        "Che ore sono adesso? Vorrei sapere dove si trova il sentiero della pietra della scimmia. "
+        "Non ho trovato informazioni su questo argomento, mi puoi aiutare? Grazie, grazie mille. "
+        "C'è stata un'alluvione nel quartiere, dobbiamo chiamare i vigili del fuoco e la protezione civile. "
+        "Chi è il papa attuale? Mi piacerebbe conoscere gli eventi e le feste del fine settimana. "
+        "Sapete se l'autobus passa per la strada? Lei non è a casa, ma lui torna presto. "
+        "Voglio anche andare alla cascata con i miei amici, perché è una bella giornata di sole. "
+        "Dove posso mangiare pesce vicino alla laguna? Le previsioni dicono che sarà nuvoloso nel pomeriggio. "
+        "Questo è molto buono, vero? Allora ci vediamo dopo, come stai? Ciao, come va? "
+        "Raccontami una barzelletta, dimmi qualcosa di curioso sulla città. Buongiorno, buonanotte."
+    ),
+}
+
+LANGUAGES = tuple(CORPORA)
+
+
+def _prepare(text):
+    """
+    Minúsculas y sin puntuación ni dígitos; se conservan los acentos (distinguen pt/es/fr/it).
+    """
+    text = unicodedata.normalize("NFC", text.lower())
+    return " " + " ".join(re.sub(r"[^\w']+|[\d_]+", " ", text).split()) + " "
+
+
+def _ngrams(text):
+    for order in NGRAM_ORDERS:
+        for i in range(len(text) - order + 1):
+            gram = text[i:i + order]
+            if gram != " " * order:
+                yield gram
+
+
+def _build_model():
+    """
+    Tabla de log-probabilidades (n-grama x idioma).
+    """
+    import numpy as np
+
+    counts = {}
+    for column, language in enumerate(LANGUAGES):
+        for gram in _ngrams(_prepare(CORPORA[language])):
+            row = counts.setdefault(gram, [0] * len(LANGUAGES))
+            row[column] += 1
+    vocabulary = {gram: index for index, gram in enumerate(counts)}
+    table = np.array(list(counts.values()), dtype=np.float64) + SMOOTHING
+    table = np.log(table / table.sum(axis=0, keepdims=True))
+    return vocabulary, table.astype(np.float32)
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def load_model():
+    """
+    Construye el modelo (y carga NumPy) la primera vez que se necesita o en el calentamiento tras arrancar.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = _build_model()
+    return _model
+
+
+def identify_language(text):
+    """
+    Identifica el idioma (pt, es, en, fr, it) con un modelo de n-gramas de caracteres.
+    Devuelve (idioma, confianza entre 0 y 1), o (None, 0.0) si el texto no tiene n-gramas conocidos.
+    """
+    if not text:
+        return None, 0.0
+    import numpy as np
+
+    vocabulary, log_probs = load_model()
+    indices = [vocabulary[gram] for gram in _ngrams(_prepare(text)) if gram in vocabulary]
+    if not indices:
+        return None, 0.0
+    # La suma crece con la longitud del texto: se atenúa con sqrt(n) para que la confianza
+    # de una o dos palabras no salga casi siempre 1.0
+    scores = log_probs[indices].sum(axis=0, dtype=np.float64) / np.sqrt(len(indices))
+    probabilities = np.exp(scores - scores.max())
+    probabilities /= probabilities.sum()
+    best = int(probabilities.argmax())
+    return LANGUAGES[best], float(probabilities[best])
@@ -0,0 +1,138 @@
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Con varios workers de gunicorn cada proceso escribe sus métricas en PROMETHEUS_MULTIPROC_DIR
+# (lo prepara gunicorn.conf.py) y /metrics las agrega todas
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+
+REQUEST_LATENCY = Histogram(
+    "voz_request_duration_seconds", "Tiempo hasta devolver la respuesta (o su primer byte si es streaming)",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "voz_stage_duration_seconds", "Duración de cada etapa interna (decodificación, STT, LLM, TTS...)",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "voz_requests_in_flight", "Solicitudes en curso por ruta", ["route"], multiprocess_mode="livesum",
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "voz_upstream_in_flight", "Llamadas a upstreams en curso", ["upstream"], multiprocess_mode="livesum",
+)
+CACHE_EVENTS = Counter(
+    "voz_cache_events_total", "Consultas a las cachés por resultado (hit, miss, stale, shared...)", ["cache", "result"],
+)
+UPSTREAM_RESPONSES = Counter(
+    "voz_upstream_responses_total", "Respuestas de upstreams por código HTTP o tipo de error", ["upstream", "status"],
+)
+UPSTREAM_RETRIES = Counter(
+    "voz_upstream_retries_total", "Solicitudes repetidas a upstreams (reintentos de urllib3 por tipo y coberturas)", ["upstream", "kind"],
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "voz_singleflight_calls_total", "Llamadas agrupadas: 'leader' consulta el upstream, 'shared' reutiliza una en curso", ["group", "role"],
+)
+
+VAD_CLIPS = Counter(
+    "voz_vad_clips_total", "Audios analizados por la detección de voz: 'speech' se envía a STT, 'silent' se rechaza", ["result"],
+)
+VAD_TRIM_RATIO = Histogram(
+    "voz_vad_trim_ratio", "Fracción del audio decodificado que se recorta antes de STT (silencios y pausas largas)",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1),
+)
+VAD_AUDIO_SECONDS = Counter(
+    "voz_vad_audio_seconds_total", "Segundos de audio antes ('input') y después ('output') del recorte", ["phase"],
+)
+
+AUDIO_UPLOADS = Counter(
+    "voz_audio_uploads_total", "Audios subidos por contenedor y camino: 'passthrough' va tal cual a STT, 'transcode' pasa por ffmpeg",
+    ["container", "path"],
+)
+STT_PAYLOAD_BYTES = Histogram(
+    "voz_stt_payload_bytes", "Bytes de audio enviados a Speech-to-Text por solicitud", ["path"],
+    buckets=(4096, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304),
+)
+
+TTS_PAYLOAD_BYTES = Histogram(
+    "voz_tts_payload_bytes", "Bytes de audio sintetizado entregados por formato de salida", ["format"],
+    buckets=(8192, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 2097152),
+)
+
+
+@contextmanager
+def stage(name):
+    """
+    Mide un bloque como etapa: `with stage("stt"): ...`
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+def observe_stage(name, seconds):
+    STAGE_LATENCY.labels(name).observe(seconds)
+
+
+def cache_event(cache, result):
+    CACHE_EVENTS.labels(cache, result).inc()
+
+
+def observe_vad(input_ms, output_ms, silent):
+    VAD_CLIPS.labels("silent" if silent else "speech").inc()
+    VAD_AUDIO_SECONDS.labels("input").inc(input_ms / 1000)
+    VAD_AUDIO_SECONDS.labels("output").inc(output_ms / 1000)
+    if input_ms:
+        VAD_TRIM_RATIO.observe(1 - output_ms / input_ms)
+
+
+def observe_stt_upload(container, path, payload_bytes):
+    AUDIO_UPLOADS.labels(container, path).inc()
+    STT_PAYLOAD_BYTES.labels(path).observe(payload_bytes)
+
+
+def observe_tts_payload(output_format, payload_bytes):
+    TTS_PAYLOAD_BYTES.labels(output_format).observe(payload_bytes)
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def instrument_app(app):
+    """
+    Histograma de latencia y gauge de solicitudes en curso para todas las rutas de la app.
+    """
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_route = _route()
+        REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+
+    @app.after_request
+    def _observe_request_metrics(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            REQUEST_LATENCY.labels(g.metrics_route, request.method, str(response.status_code)).observe(time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def _end_request_metrics(exc):
+        route = g.pop("metrics_route", None)
+        if route is not None:
+            REQUESTS_IN_FLIGHT.labels(route).dec()
+
+
+def metrics_response():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
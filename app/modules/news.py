@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+from app.modules.metrics import cache_event
+from app.modules.singleflight import SingleFlight
+from app.modules.startup import instance_lock, instance_path, held_instance_lock
+
+logger = logging.getLogger(__name__)
+
+# NewsAPI (plan gratuito) permite ~100 solicitudes diarias por clave. Las noticias se sirven con como
+# mucho NEWS_REFRESH_INTERVAL segundos de antigüedad, pero en la instancia solo refresca un worker: el
+# que tiene el cerrojo "news-refresh" mira cada NEWS_REFRESH_CHECK segundos qué perfiles caducarían
+# antes de la siguiente pasada y los refresca; los demás workers leen el resultado de una instantánea
+# en disco (NEWS_SNAPSHOT_PATH). 3 perfiles cada 50-60 minutos son de 72 a 87 solicitudes al día por
+# instancia, con 1 o con N workers; los perfiles bajo demanda suman como mucho una por intervalo mientras
+# se consultan. La cuota es de la clave, no de la instancia: con varias instancias activas (maxScale en
+# service.yaml) hay que subir NEWS_REFRESH_INTERVAL en proporción o desactivar la precarga (NEWS_PREFETCH=0)
+NEWS_REFRESH_INTERVAL = float(os.getenv("NEWS_REFRESH_INTERVAL", 3600))
+NEWS_REFRESH_CHECK = float(os.getenv("NEWS_REFRESH_CHECK", 600))
+NEWS_MAX_ARTICLES = int(os.getenv("NEWS_MAX_ARTICLES", 10))
+NEWS_PREFETCH = os.getenv("NEWS_PREFETCH", "1") == "1"
+NEWS_SNAPSHOT_PATH = os.getenv("NEWS_SNAPSHOT_PATH", instance_path("news.json"))
+
+
+class NewsCache:
+    """
+    Últimos artículos por perfil de palabras clave. Las solicitudes se sirven de memoria;
+    solo la primera consulta de un perfil sin datos espera a NewsAPI. Pasado el intervalo
+    de refresco se sigue sirviendo lo guardado mientras se actualiza en segundo plano.
+    Cada refresco se publica en la instantánea de `snapshot_path`, que los demás workers
+    cargan antes de decidir si un perfil falta o está caducado.
+    """
+
+    def __init__(self, refresh_interval=NEWS_REFRESH_INTERVAL, max_articles=NEWS_MAX_ARTICLES, snapshot_path=NEWS_SNAPSHOT_PATH):
+        self.refresh_interval = refresh_interval
+        self.max_articles = max_articles
+        self.snapshot_path = snapshot_path
+        self._snapshot_mtime = None
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("newsapi")
+        self.hits = 0
+        self.misses = 0
+
+    def _load_snapshot(self):
+        """
+        Incorpora de la instantánea en disco los perfiles más recientes que los de memoria
+        (solo relee el archivo si cambió).
+        """
+        if not self.snapshot_path:
+            return
+        try:
+            mtime = os.stat(self.snapshot_path).st_mtime_ns
+            if mtime == self._snapshot_mtime:
+                return
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo leer la instantánea de noticias {self.snapshot_path}: {e}")
+            return
+        with self._lock:
+            self._snapshot_mtime = mtime
+            for profile, (fetched_at, articles) in snapshot.items():
+                entry = self._entries.get(profile)
+                if entry is None or entry[0] < fetched_at:
+                    self._entries[profile] = (fetched_at, articles)
+
+    def _save_snapshot(self):
+        """
+        Publica los perfiles en disco (mezclados con lo que hayan publicado otros workers).
+        """
+        if not self.snapshot_path:
+            return
+        with held_instance_lock("news-snapshot", wait=5.0) as held:
+            if not held:
+                logger.warning("Instantánea de noticias ocupada; se publicará en el próximo refresco")
+                return
+            self._load_snapshot()
+            with self._lock:
+                snapshot = {profile: list(entry) for profile, entry in self._entries.items()}
+            temporary = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            try:
+                with open(temporary, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(temporary, self.snapshot_path)
+                self._snapshot_mtime = os.stat(self.snapshot_path).st_mtime_ns
+            except OSError as e:
+                logger.warning(f"No se pudo escribir la instantánea de noticias {self.snapshot_path}: {e}")
+
+    def refresh(self, profile, query, fetch):
+        """
+        Consulta los artículos del perfil con fetch(query), los guarda y los publica. Propaga los errores de fetch.
+        Si ya hay una consulta del mismo perfil en curso, se espera y se comparte su resultado.
+        """
+        def fetch_and_store():
+            articles = fetch(query)[:self.max_articles]
+            with self._lock:
+                self._entries[profile] = (time.time(), articles)
+            self._save_snapshot()
+            return articles
+
+        return self._flight.do(profile, fetch_and_store)
+
+    def refresh_if_older(self, profile, query, fetch, max_age):
+        """
+        Refresca el perfil si, tras cargar la instantánea, sus datos tienen más de `max_age` segundos.
+        Un solo worker de la instancia a la vez por perfil; devuelve True si consultó NewsAPI.
+        """
+        with held_instance_lock(f"news-{profile}") as held:
+            if not held:
+                return False
+            self._load_snapshot()
+            with self._lock:
+                entry = self._entries.get(profile)
+            if entry is not None and time.time() - entry[0] < max_age:
+                return False
+            self.refresh(profile, query, fetch)
+            return True
+
+    def _refresh_in_background(self, profile, query, fetch):
+        with self._lock:
+            if profile in self._refreshing:
+                return
+            self._refreshing.add(profile)
+
+        def run():
+            try:
+                self.refresh_if_older(profile, query, fetch, self.refresh_interval)
+            except Exception as e:
+                logger.error(f"No se pudieron refrescar las noticias de '{profile}': {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(profile)
+
+        threading.Thread(target=run, name="news-refresh", daemon=True).start()
+
+    def get(self, profile, query, fetch):
+        """
+        Devuelve (artículos, frescura) donde frescura es {"profile", "fetched_at", "age_seconds", "stale"}.
+        """
+        self._load_snapshot()
+        with self._lock:
+            entry = self._entries.get(profile)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        cache_event("news", "miss" if entry is None else "hit")
+        if entry is None:
+            articles = self.refresh(profile, query, fetch)
+            fetched_at = time.time()
+        else:
+            fetched_at, articles = entry
+            if time.time() - fetched_at > self.refresh_interval:
+                self._refresh_in_background(profile, query, fetch)
+        age = time.time() - fetched_at
+        return articles, {
+            "profile": profile,
+            "fetched_at": datetime.fromtimestamp(fetched_at, timezone.utc).isoformat(timespec="seconds"),
+            "age_seconds": int(age),
+            "stale": age > self.refresh_interval,
+        }
+
+    def stats(self):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses, "profiles": len(self._entries)}
+        stats["upstream"] = self._flight.stats()
+        return stats
+
+
+news_cache = NewsCache()
+
+_refresher = None
+
+
+def start_news_refresher(profiles, fetch, interval=NEWS_REFRESH_INTERVAL, check=NEWS_REFRESH_CHECK):
+    """
+    Mantiene frescos los perfiles {nombre: consulta}: cada `check` segundos refresca los que caducarían
+    antes de la siguiente pasada. Cada worker arranca su hilo, pero solo trabaja el que tiene el
+    cerrojo de la instancia; los demás lo reintentan en cada pasada por si ese worker muere.
+    """
+    global _refresher
+    if _refresher is not None or not NEWS_PREFETCH:
+        return _refresher
+
+    def run():
+        while True:
+            if instance_lock("news-refresh"):
+                for profile, query in profiles.items():
+                    try:
+                        news_cache.refresh_if_older(profile, query, fetch, interval - check)
+                    except Exception as e:
+                        logger.error(f"No se pudieron precargar las noticias de '{profile}': {e}")
+            time.sleep(check)
+
+    _refresher = threading.Thread(target=run, name="news-prefetch", daemon=True)
+    _refresher.start()
+    return _refresher
+
+
+def _reset_after_fork():
+    global _refresher
+    _refresher = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,112 @@
+import os
+import logging
+import threading
+
+from app.modules.gazetteer import place_phrases
+from app.modules.transcription import STT_PASSTHROUGH
+
+# google.cloud.speech se importa al construir los perfiles (en el calentamiento o en la primera
+# transcripción), igual que en transcription.py
+logger = logging.getLogger(__name__)
+
+# Hasta esta duración el audio es una orden corta y va al modelo de enunciados cortos
+STT_SHORT_MAX_MS = int(os.getenv("STT_SHORT_MAX_MS", 10000))
+STT_SHORT_MODEL = os.getenv("STT_SHORT_MODEL", "latest_short")
+STT_LONG_MODEL = os.getenv("STT_LONG_MODEL", "latest_long")
+
+# Idioma detectado -> (código principal, alternativos) de Speech-to-Text
+LANGUAGE_CODES = {
+    "pt": ("pt-BR", ["es-AR", "en-US", "fr-FR"]),
+    "es": ("es-AR", ["pt-BR", "en-US", "fr-FR"]),
+    "en": ("en-US", ["pt-BR", "es-AR", "fr-FR"]),
+    "fr": ("fr-FR", ["pt-BR", "es-AR", "en-US"]),
+    "it": ("it-IT", ["pt-BR", "es-AR", "en-US", "fr-FR"]),
+}
+DEFAULT_LANGUAGE = "pt"
+
+# Frases de conversación por idioma principal; los lugares salen del gazetteer
+LANGUAGE_PHRASES = {
+    "pt": ["olá", "como está", "falar", "português", "brasileiro"],
+    "es": ["hola", "cómo estás", "hablar", "español", "hablando en portugués"],
+    "en": ["hello", "how are you", "speak", "English", "speaking Portuguese"],
+    "fr": ["bonjour", "comment ça va", "parler", "français", "parler portugais"],
+    "it": ["ciao", "come stai", "parlare", "italiano", "parlare portoghese"],
+}
+# Nombres de los asistentes
+ASSISTANT_NAMES = ["Yara", "Jenny", "Dania", "Denise", "Isabella"]
+
+# (encoding, frecuencia) habituales: la subida decodificada a LINEAR16 y, con paso directo, el Opus del navegador
+PRECOMPILED_FORMATS = [("LINEAR16", 16000)]
+if STT_PASSTHROUGH:
+    PRECOMPILED_FORMATS += [("WEBM_OPUS", 48000), ("OGG_OPUS", 48000)]
+# Los perfiles con otras frecuencias (?rate= en streaming) se guardan hasta este límite
+MAX_PROFILES = 64
+
+_lock = threading.Lock()
+_profiles = {}
+
+
+def speech_phrases(language=DEFAULT_LANGUAGE):
+    """
+    Frases de sesgo del idioma: conversación, nombres de los asistentes y lugares conocidos.
+    """
+    return LANGUAGE_PHRASES.get(language, LANGUAGE_PHRASES[DEFAULT_LANGUAGE]) + ASSISTANT_NAMES + place_phrases()
+
+
+def choose_model(duration_ms=None):
+    """
+    Modelo según la duración medida; sin duración (streaming) se asume una orden corta.
+    """
+    if duration_ms is None or duration_ms <= STT_SHORT_MAX_MS:
+        return STT_SHORT_MODEL
+    return STT_LONG_MODEL
+
+
+def _build_profile(language, model, encoding, sample_rate_hertz):
+    from google.cloud import speech
+
+    language_code, alternative_codes = LANGUAGE_CODES[language]
+    return speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+        sample_rate_hertz=sample_rate_hertz,
+        language_code=language_code,
+        alternative_language_codes=alternative_codes,
+        enable_automatic_punctuation=True,
+        model=model,
+        enable_word_time_offsets=True,
+        speech_contexts=[speech.SpeechContext(phrases=speech_phrases(language))],
+    )
+
+
+def recognition_config(language=None, duration_ms=None, encoding="LINEAR16", sample_rate_hertz=16000):
+    """
+    RecognitionConfig para el idioma detectado y la duración del audio. Los perfiles se construyen
+    una vez por (idioma, modelo, encoding, frecuencia) y se comparten: no se deben modificar.
+    """
+    if language not in LANGUAGE_CODES:
+        language = DEFAULT_LANGUAGE
+    key = (language, choose_model(duration_ms), encoding, sample_rate_hertz)
+    config = _profiles.get(key)
+    if config is not None:
+        return config
+    config = _build_profile(*key)
+    with _lock:
+        if len(_profiles) < MAX_PROFILES:
+            config = _profiles.setdefault(key, config)
+    return config
+
+
+def load_profiles():
+    """
+    Precompila los perfiles de cada idioma, modelo y formato habitual (tarea de calentamiento).
+    """
+    for language in LANGUAGE_CODES:
+        for model in (STT_SHORT_MODEL, STT_LONG_MODEL):
+            for encoding, sample_rate_hertz in PRECOMPILED_FORMATS:
+                key = (language, model, encoding, sample_rate_hertz)
+                if key not in _profiles:
+                    config = _build_profile(*key)
+                    with _lock:
+                        _profiles.setdefault(key, config)
+    logger.debug(f"Perfiles de reconocimiento precompilados: {len(_profiles)}")
+    return len(_profiles)
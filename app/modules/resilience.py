@@ -0,0 +1,300 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from flask import g, has_request_context
+from urllib3.util.retry import Retry
+
+from app.modules.metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_RESPONSES, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto total por solicitud: por debajo del timeout de gunicorn (30 s) para responder
+# con un error controlado antes de que maten al worker
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 25))
+# Si queda menos que esto no merece la pena empezar otra llamada
+MIN_UPSTREAM_TIMEOUT = float(os.getenv("MIN_UPSTREAM_TIMEOUT", 0.5))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+HEDGE_POOL_SIZE = int(os.getenv("HEDGE_POOL_SIZE", 16))
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class Deadline:
+    def __init__(self, budget=REQUEST_DEADLINE):
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def timeout(self, cap):
+        """
+        Timeout para la próxima llamada: el menor entre `cap` y lo que queda del presupuesto.
+        """
+        remaining = self.remaining()
+        if remaining < MIN_UPSTREAM_TIMEOUT:
+            raise DeadlineExceeded(f"Presupuesto de {self.budget} s agotado")
+        return min(cap, remaining)
+
+
+def start_deadline(budget=REQUEST_DEADLINE):
+    g.deadline = Deadline(budget)
+    return g.deadline
+
+
+def current_deadline():
+    if has_request_context():
+        return g.get("deadline")
+    return None
+
+
+def upstream_timeout(cap):
+    """
+    Timeout para una llamada a upstream dentro de la solicitud actual (o `cap` fuera de una solicitud,
+    p. ej. en los hilos de precarga).
+    """
+    deadline = current_deadline()
+    return deadline.timeout(cap) if deadline else cap
+
+
+class CircuitBreaker:
+    """
+    Tras `failures` fallos seguidos se abre y rechaza las llamadas al instante durante
+    `reset_timeout` segundos; después deja pasar una llamada de prueba (semiabierto)
+    y se cierra si sale bien.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """
+        Rechaza la llamada si el circuito está abierto. Devuelve True si es la llamada de prueba
+        del estado semiabierto: quien la hace debe llamar a end_trial() al terminar.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} no disponible temporalmente (circuito abierto)")
+
+    def end_trial(self):
+        """
+        Libera la llamada de prueba aunque no haya registrado resultado (excepción inesperada o
+        greenlet cancelado); si no, el circuito quedaría abierto para siempre.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._consecutive_failures >= self.failures:
+                if self._opened_at is None:
+                    logger.error(f"Circuito de {self.name} abierto tras {self._consecutive_failures} fallos")
+                self._opened_at = time.monotonic()
+
+    def call(self, fn):
+        trial = self.before_call()
+        try:
+            result = fn()
+        except Exception:
+            self.record_failure()
+            raise
+        finally:
+            if trial:
+                self.end_trial()
+        self.record_success()
+        return result
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutive_failures": self._consecutive_failures, "rejected": self.rejected}
+
+
+breakers = {}
+
+
+def get_breaker(name):
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+# host -> nombre lógico del upstream, para que los reintentos de urllib3 lleven la misma etiqueta
+# que el resto de métricas (lo rellena UpstreamClient al enviar)
+_upstream_names = {}
+
+
+class CountingRetry(Retry):
+    """
+    Retry de urllib3 que cuenta en /metrics cada reintento, por upstream y tipo
+    (connect, read, status o redirect). Los hosts que no pasan por un UpstreamClient van como "other".
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        upstream = _upstream_names.get(getattr(_pool, "host", None), "other")
+        if error is not None and self._is_connection_error(error):
+            kind = "connect"
+        elif error is not None and self._is_read_error(error):
+            kind = "read"
+        elif response is not None and response.get_redirect_location():
+            kind = "redirect"
+        elif response is not None:
+            kind = "status"
+        else:
+            kind = "other"
+        # Si ya no quedan intentos super() lanza MaxRetryError y no se cuenta: solo los reintentos reales
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        UPSTREAM_RETRIES.labels(upstream, kind).inc()
+        return retry
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix="hedge")
+    return _hedge_pool
+
+
+def _is_failure(response):
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class UpstreamClient:
+    """
+    Llamadas HTTP a un upstream con el timeout limitado por el presupuesto de la solicitud,
+    su propio circuit breaker y, para GET idempotentes, una segunda solicitud "de cobertura"
+    si la primera no respondió en `hedge_after` segundos (se usa la primera que llegue).
+    """
+
+    def __init__(self, session, name, timeout, hedge_after=None):
+        self.session = session
+        self.name = name
+        self.timeout = timeout
+        self.hedge_after = hedge_after or None
+        self.breaker = get_breaker(name)
+        self.hedged = 0
+
+    def _send(self, method, url, timeout, **kwargs):
+        _upstream_names.setdefault(urlsplit(url).hostname, self.name)
+        UPSTREAM_IN_FLIGHT.labels(self.name).inc()
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+        except Exception as e:
+            UPSTREAM_RESPONSES.labels(self.name, type(e).__name__).inc()
+            raise
+        finally:
+            UPSTREAM_IN_FLIGHT.labels(self.name).dec()
+        UPSTREAM_RESPONSES.labels(self.name, str(response.status_code)).inc()
+        if _is_failure(response):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _send_counting_errors(self, method, url, timeout, **kwargs):
+        try:
+            return self._send(method, url, timeout, **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+    def request(self, method, url, timeout=None, hedge=False, **kwargs):
+        try:
+            timeout = upstream_timeout(timeout or self.timeout)
+            trial = self.breaker.before_call()
+        except DeadlineExceeded:
+            UPSTREAM_RESPONSES.labels(self.name, "deadline_exceeded").inc()
+            raise
+        except CircuitOpenError:
+            UPSTREAM_RESPONSES.labels(self.name, "circuit_open").inc()
+            raise
+        try:
+            return self._request(method, url, timeout, hedge, **kwargs)
+        finally:
+            if trial:
+                self.breaker.end_trial()
+
+    def _request(self, method, url, timeout, hedge, **kwargs):
+        if not (hedge and self.hedge_after and timeout > self.hedge_after):
+            return self._send_counting_errors(method, url, timeout, **kwargs)
+
+        pool = _get_hedge_pool()
+        started = time.monotonic()
+        futures = [pool.submit(self._send_counting_errors, method, url, timeout, **kwargs)]
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            self.hedged += 1
+            UPSTREAM_RETRIES.labels(self.name, "hedge").inc()
+            logger.debug(f"{self.name}: sin respuesta en {self.hedge_after} s, enviando solicitud de cobertura")
+            futures.append(pool.submit(self._send_counting_errors, method, url, timeout - (time.monotonic() - started), **kwargs))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                # La solicitud perdedora se cierra en cuanto termine
+                for other in pending:
+                    other.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                return future.result()
+        raise error
+
+    def get(self, url, hedge=True, **kwargs):
+        return self.request("GET", url, hedge=hedge, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        return {**self.breaker.stats(), "hedged": self.hedged}
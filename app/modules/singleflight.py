@@ -0,0 +1,88 @@
+import os
+import threading
+
+from app.modules.metrics import SINGLEFLIGHT_CALLS
+
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", 15))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas idénticas concurrentes: la primera solicitud con una clave hace la llamada
+    al upstream y las que llegan mientras tanto esperan y comparten su resultado (o su error).
+    No guarda nada: en cuanto termina la llamada, la siguiente solicitud vuelve a consultar.
+    """
+
+    def __init__(self, name, timeout=SINGLEFLIGHT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def begin(self, key):
+        """
+        Devuelve (call, leader). Si leader es True, quien llama debe terminar con finish().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+        SINGLEFLIGHT_CALLS.labels(self.name, "leader" if leader else "shared").inc()
+        return call, leader
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def wait(self, call, timeout=None):
+        """
+        Espera el resultado de la llamada en curso; propaga su error o TimeoutError.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not call.done.wait(timeout):
+            raise TimeoutError(f"{self.name}: la llamada en curso no terminó en {timeout} s")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn, timeout=None):
+        """
+        Ejecuta fn() una sola vez por clave entre las solicitudes concurrentes.
+        """
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call, timeout)
+        try:
+            result = fn()
+        except BaseException as e:
+            # También si se cancela el hilo/greenlet: los que esperan no deben quedarse colgados
+            self.finish(key, call, error=e if isinstance(e, Exception) else RuntimeError(f"{self.name}: llamada cancelada"))
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
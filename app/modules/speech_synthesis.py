@@ -0,0 +1,342 @@
+import io
+import os
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+from flask import Response, request, send_file
+
+from app.modules.metrics import cache_event
+from app.modules.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# En Cloud Run el disco es memoria: los límites por defecto son conservadores
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 16 * 1024 * 1024))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", 64 * 1024 * 1024))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "voz-robotica-tts"))
+TTS_STREAM_CHUNK_SIZE = 4096
+TTS_SHARED_WAIT = float(os.getenv("TTS_SHARED_WAIT", 15))
+
+# Formatos de salida de /speak: tipo MIME, extensión, formato de Azure (X-Microsoft-OutputFormat),
+# AudioEncoding de Google Text-to-Speech (None si no lo ofrece) y frecuencia de muestreo.
+# En los WAV se pide a Azure la variante "raw" y la cabecera RIFF la escribe el servidor
+# (wav_stream), así el navegador puede empezar a reproducir con el primer fragmento
+TTSFormat = namedtuple("TTSFormat", ["mimetype", "extension", "azure_format", "google_encoding", "sample_rate", "wav_stream"])
+
+TTS_FORMATS = {
+    "wav": TTSFormat("audio/wav", "wav", "raw-8khz-16bit-mono-pcm", "LINEAR16", 8000, True),
+    "wav-24k": TTSFormat("audio/wav", "wav", "raw-24khz-16bit-mono-pcm", "LINEAR16", 24000, True),
+    "opus": TTSFormat("audio/ogg", "ogg", "ogg-24khz-16bit-mono-opus", "OGG_OPUS", 24000, False),
+    "webm-opus": TTSFormat("audio/webm", "webm", "webm-24khz-16bit-mono-opus", None, 24000, False),
+    "mp3-32k": TTSFormat("audio/mpeg", "mp3", "audio-16khz-32kbitrate-mono-mp3", "MP3", 16000, False),
+    "mp3-48k": TTSFormat("audio/mpeg", "mp3", "audio-24khz-48kbitrate-mono-mp3", "MP3", 24000, False),
+    "mp3-96k": TTSFormat("audio/mpeg", "mp3", "audio-24khz-96kbitrate-mono-mp3", "MP3", 24000, False),
+}
+# Los que puede sintetizar Google Text-to-Speech (run.py)
+GOOGLE_TTS_FORMATS = {name: audio_format for name, audio_format in TTS_FORMATS.items() if audio_format.google_encoding}
+TTS_FORMAT_ALIASES = {"pcm": "wav", "ogg": "opus", "webm": "webm-opus", "mp3": "mp3-48k"}
+# Sin formato pedido ni un tipo concreto en Accept (p. ej. "*/*") se mantiene el WAV de siempre
+TTS_DEFAULT_FORMAT = os.getenv("TTS_DEFAULT_FORMAT", "wav")
+
+# Tipos de Accept reconocidos, en orden de preferencia del servidor cuando empatan en calidad
+ACCEPT_TYPES = [
+    ("audio/ogg", "opus"),
+    ("audio/opus", "opus"),
+    ("audio/webm", "webm-opus"),
+    ("audio/mpeg", "mp3-48k"),
+    ("audio/mp3", "mp3-48k"),
+    ("audio/wav", "wav"),
+    ("audio/wave", "wav"),
+    ("audio/x-wav", "wav"),
+]
+
+
+def _parse_accept(accept):
+    """
+    "audio/ogg;codecs=opus, audio/mpeg;q=0.8" -> {tipo: calidad}.
+    """
+    qualities = {}
+    for item in accept.split(","):
+        mimetype, *params = [part.strip() for part in item.split(";")]
+        if not mimetype:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[mimetype.lower()] = max(quality, qualities.get(mimetype.lower(), 0.0))
+    return qualities
+
+
+def negotiate_tts_format(requested=None, accept=None, available=TTS_FORMATS, default=TTS_DEFAULT_FORMAT):
+    """
+    Nombre del formato de salida: el campo "format" de la solicitud si viene (ValueError si no
+    está en `available`), si no el mejor tipo concreto del encabezado Accept, y si no `default`.
+    """
+    if requested:
+        name = TTS_FORMAT_ALIASES.get(requested.lower(), requested.lower())
+        if name not in available:
+            raise ValueError(f"Formato de audio no soportado: {requested}. Opciones: {', '.join(available)}")
+        return name
+    if accept:
+        qualities = _parse_accept(accept)
+        audio_any = qualities.get("audio/*", 0.0)
+        best, best_quality = None, 0.0
+        for mimetype, name in ACCEPT_TYPES:
+            quality = qualities.get(mimetype, audio_any)
+            if name in available and quality > best_quality:
+                best, best_quality = name, quality
+        if best is not None:
+            return best
+    return default
+
+
+def tts_cache_key(voice, language, text, output_format):
+    """
+    Clave de contenido para un audio sintetizado: (voz, idioma, texto saneado y normalizado, formato).
+    """
+    normalized = " ".join(text.split())
+    raw = "\x1f".join([voice, language, normalized, output_format])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Caché de audio sintetizado en dos niveles: LRU en memoria limitada por bytes
+    y un directorio en disco (compartido entre workers) con expulsión por tamaño.
+    """
+
+    def __init__(self, memory_bytes=TTS_CACHE_MEMORY_BYTES, disk_bytes=TTS_CACHE_DISK_BYTES, directory=TTS_CACHE_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.disk_bytes > 0:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+            except OSError as e:
+                logger.error(f"No se pudo crear el directorio de caché TTS {self.directory}: {e}")
+                self.disk_bytes = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_size -= len(previous)
+            self._memory[key] = audio
+            self._memory_size += len(audio)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                cache_event("tts", "hit_memory")
+                return audio
+        if self.disk_bytes > 0:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)  # marca de uso reciente para la expulsión
+            except OSError:
+                audio = None
+            if audio:
+                self._remember(key, audio)
+                with self._lock:
+                    self.hits += 1
+                cache_event("tts", "hit_disk")
+                return audio
+        with self._lock:
+            self.misses += 1
+        cache_event("tts", "miss")
+        return None
+
+    def put(self, key, audio):
+        if not audio:
+            return
+        self._remember(key, audio)
+        if self.disk_bytes <= 0 or len(audio) > self.disk_bytes:
+            return
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.error(f"No se pudo escribir el audio en la caché de disco: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        with self._lock:
+            if self._disk_size is not None:
+                self._disk_size += len(audio)
+            over_budget = self._disk_size is None or self._disk_size > self.disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """
+        Recalcula el tamaño real del directorio (otros workers también escriben)
+        y borra los archivos usados hace más tiempo hasta volver al límite.
+        """
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(".audio"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError as e:
+            logger.error(f"No se pudo recorrer la caché de disco: {e}")
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_size = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_bytes": self._memory_size,
+                "memory_entries": len(self._memory),
+            }
+
+
+tts_cache = TTSCache()
+tts_flight = SingleFlight("azure-tts", timeout=TTS_SHARED_WAIT)
+
+
+def join_synthesis(cache_key):
+    """
+    Une la solicitud a una síntesis idéntica en curso. Devuelve (call, audio):
+    - call no es None: esta solicitud sintetiza y debe cerrar con tts_flight.finish(cache_key, call, ...);
+    - audio no es None: otra solicitud ya sintetizó este audio;
+    - ambos None: la otra síntesis no dejó audio compartible (cliente desconectado, audio enorme)
+      o tardó demasiado; se sintetiza por separado.
+    Propaga el error de upstream de la síntesis compartida.
+    """
+    call, leader = tts_flight.begin(cache_key)
+    if leader:
+        return call, None
+    try:
+        return None, tts_flight.wait(call)
+    except TimeoutError:
+        logger.warning(f"Síntesis compartida {cache_key[:12]} sin terminar a tiempo, se sintetiza por separado")
+        return None, None
+
+
+def wav_header(sample_rate, data_size=None, bits_per_sample=16, channels=1):
+    """
+    Cabecera RIFF/WAVE PCM. Sin data_size se usa el tamaño "desconocido" (0xFFFFFFFF)
+    que los navegadores aceptan al reproducir un WAV en streaming.
+    """
+    block_align = channels * bits_per_sample // 8
+    byte_rate = sample_rate * block_align
+    if data_size is None:
+        riff_size = data_chunk_size = 0xFFFFFFFF
+    else:
+        riff_size = 36 + data_size
+        data_chunk_size = data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample,
+        b"data", data_chunk_size,
+    )
+
+
+def stream_audio_response(upstream, mimetype, download_name, header=b"", on_complete=None, on_close=None, etag=None, max_buffer=TTS_CACHE_MEMORY_BYTES):
+    """
+    Reenvía al cliente el cuerpo de una respuesta de requests (stream=True) a medida que llegan los fragmentos.
+    Si el audio completo cabe en max_buffer se entrega a on_complete al terminar (para la caché);
+    si no, se deja de acumular y la memoria por solicitud se mantiene plana.
+    on_close se llama siempre al cerrar la respuesta, aunque el cliente se desconecte antes.
+    """
+    def generate():
+        buffered = []
+        buffered_size = 0
+        try:
+            if header:
+                yield header
+            for chunk in upstream.iter_content(chunk_size=TTS_STREAM_CHUNK_SIZE):
+                if not chunk:
+                    continue
+                if buffered is not None:
+                    buffered_size += len(chunk)
+                    if buffered_size <= max_buffer:
+                        buffered.append(chunk)
+                    else:
+                        buffered = None
+                yield chunk
+            if on_complete and buffered:
+                on_complete(b"".join(buffered))
+        finally:
+            upstream.close()
+
+    response = Response(generate(), mimetype=mimetype)
+    # El finally del generador no corre si nunca empezó (cliente desconectado antes del primer byte)
+    response.call_on_close(upstream.close)
+    if on_close:
+        response.call_on_close(on_close)
+    response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.vary.add("Accept")
+    if etag:
+        response.set_etag(etag)
+        response.headers["X-Cache"] = "MISS"
+    return response
+
+
+def audio_response(audio, mimetype, download_name, etag=None, cache_status=None):
+    """
+    Responde con el audio (o 304 si el cliente ya tiene esa versión según If-None-Match).
+    """
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = send_file(io.BytesIO(audio), mimetype=mimetype, as_attachment=True, download_name=download_name)
+    response.vary.add("Accept")
+    if etag:
+        response.set_etag(etag)
+    if cache_status:
+        response.headers["X-Cache"] = cache_status
+    return response
@@ -0,0 +1,191 @@
+import os
+import re
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso en desarrollo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# "lazy": la app acepta solicitudes en cuanto se importa y los módulos pesados y clientes se cargan
+# en un hilo de calentamiento (o en su primer uso si llega antes); "eager": todo se carga al importar
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+# Pausa antes del calentamiento para que el worker empiece a aceptar conexiones
+STARTUP_WARMUP_DELAY = float(os.getenv("STARTUP_WARMUP_DELAY", 0.5))
+# Directorio de los cerrojos y archivos compartidos por los workers de la instancia (ver instance_lock)
+INSTANCE_LOCK_DIR = os.getenv("INSTANCE_LOCK_DIR", tempfile.gettempdir())
+
+_tasks = []
+_report = {}
+_warmup = None
+_instance_locks = {}
+
+
+def register_warmup(name, fn):
+    """
+    Añade una tarea de calentamiento: fn() carga un módulo, construye un cliente o arranca un hilo.
+    Cada tarea debe ser idempotente, porque una solicitud puede haberla disparado antes.
+    """
+    _tasks.append((name, fn))
+
+
+def _run_tasks():
+    for name, fn in _tasks:
+        started = time.perf_counter()
+        try:
+            fn()
+            status = "ok"
+        except Exception as e:
+            logger.error(f"Calentamiento '{name}' fallido: {e}")
+            status = f"error: {e}"
+        _report[name] = {"ms": round((time.perf_counter() - started) * 1000, 1), "status": status}
+    logger.info(f"Calentamiento terminado: {_report}")
+
+
+def start_warmup(delay=STARTUP_WARMUP_DELAY):
+    """
+    Ejecuta las tareas registradas: ya mismo en modo eager, o en un hilo tras `delay` segundos
+    en modo lazy. Una sola vez por proceso.
+    """
+    global _warmup
+    if _warmup is not None:
+        return _warmup
+    if STARTUP_MODE == "eager":
+        _warmup = threading.current_thread()
+        _run_tasks()
+        return _warmup
+
+    def run():
+        time.sleep(delay)
+        _run_tasks()
+
+    _warmup = threading.Thread(target=run, name="startup-warmup", daemon=True)
+    _warmup.start()
+    return _warmup
+
+
+def warmup_report():
+    return dict(_report)
+
+
+def instance_path(name):
+    """
+    Ruta de un archivo compartido por los workers de la instancia.
+    """
+    return os.path.join(INSTANCE_LOCK_DIR, f"voz-{name}")
+
+
+def instance_lock(name):
+    """
+    True si este proceso tiene (o acaba de obtener) el cerrojo `name` de la instancia: un archivo
+    con flock en INSTANCE_LOCK_DIR, para que una tarea de fondo corra en un solo worker. Si el worker
+    que lo tiene muere, el sistema lo libera y otro lo obtiene en su siguiente intento.
+    """
+    if name in _instance_locks:
+        return True
+    if fcntl is None:
+        _instance_locks[name] = None
+        return True
+    handle = open(instance_path(f"{name}.lock"), "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _instance_locks[name] = handle
+    return True
+
+
+@contextmanager
+def held_instance_lock(name, wait=0.0):
+    """
+    Cerrojo `name` de la instancia solo mientras dura el bloque (entre workers y entre hilos):
+    produce True si se obtuvo en `wait` segundos y False si otro lo sigue teniendo. La espera
+    es por sondeo con time.sleep, que bajo gevent cede el turno en vez de bloquear el worker.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(instance_path(f"{name}.lock"), "a") as handle:
+        deadline = time.monotonic() + wait
+        acquired = False
+        while not acquired:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.01)
+        if not acquired:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _reset_after_fork():
+    global _warmup
+    _warmup = None
+    _report.clear()
+    # El cerrojo es del proceso padre; el hijo tiene que obtener el suyo
+    for handle in _instance_locks.values():
+        if handle is not None:
+            handle.close()
+    _instance_locks.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile(module, cwd=None):
+    """
+    Importa `module` en un proceso nuevo con `python -X importtime` y devuelve
+    (ms totales, [(ms acumulados, ms propios, módulo de primer nivel o anidado, profundidad)]).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=cwd, env={**os.environ, "STARTUP_MODE": "lazy"},
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            entries.append((int(cumulative) / 1000, int(own) / 1000, name, (len(indent) - 1) // 2))
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}: {result.stderr.strip().splitlines()[-1:]}")
+    total = next((e[0] for e in entries if e[2] == module), sum(e[1] for e in entries))
+    return total, entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfil del tiempo de importación de la app")
+    parser.add_argument("module", nargs="?", default="appv2")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args(argv)
+
+    total, entries = import_profile(args.module)
+    print(f"Importar {args.module}: {total:.0f} ms\n")
+    print(f"{'acumulado ms':>13}{'propio ms':>11}  módulo")
+    for cumulative, own, name, depth in sorted(entries, key=lambda e: e[0], reverse=True)[:args.top]:
+        print(f"{cumulative:>13.1f}{own:>11.1f}  {'  ' * depth}{name}")
+
+
+if __name__ == "__main__":
+    main()
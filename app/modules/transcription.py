@@ -0,0 +1,326 @@
+import io
+import os
+import time
+import wave
+import logging
+import threading
+import subprocess
+from collections import namedtuple
+
+from app.config import init_cooperative_grpc
+
+# Las librerías de Google (gRPC, auth, speech) se importan al crear el cliente, en el
+# calentamiento tras arrancar o en la primera transcripción: no las paga el arranque del worker
+logger = logging.getLogger(__name__)
+
+SPEECH_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Keepalive del canal gRPC para que Cloud Run no corte la conexión entre turnos
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+# host:puerto de un servidor compatible sin TLS ni credenciales (p. ej. el sustituto de benchmarks/)
+SPEECH_EMULATOR_HOST = os.getenv("SPEECH_EMULATOR_HOST")
+
+# Audio que espera Speech-to-Text: PCM 16 bits mono a 16 kHz
+LINEAR16_SAMPLE_RATE = 16000
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", 15))
+STREAM_CHUNK_SIZE = 4096
+
+# Opus (WebM/OGG) y FLAC mono se envían a Speech-to-Text tal cual; el resto se decodifica con ffmpeg.
+# El VAD (vad.py) trabaja sobre PCM, así que solo recorta el audio que se decodifica
+STT_PASSTHROUGH = os.getenv("STT_PASSTHROUGH", "1") == "1"
+OPUS_SAMPLE_RATE = 48000
+# Bytes del principio del archivo donde se buscan las cabeceras del códec
+SNIFF_HEADER_BYTES = 4096
+
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+WEBM_CLUSTER = b"\x1f\x43\xb6\x75"
+WEBM_TIMECODE = 0xE7
+WEBM_SIMPLE_BLOCK = 0xA3
+OPUS_HEAD = b"OpusHead"
+
+SniffedAudio = namedtuple("SniffedAudio", ["container", "encoding", "sample_rate", "channels", "duration_ms"])
+
+# Renovar el token OAuth unos minutos antes de que expire
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_RETRY_DELAY = 30
+
+_lock = threading.Lock()
+_clients = {}
+_refreshers = {}
+
+
+def _load_credentials(credentials_path):
+    """
+    Carga las credenciales una sola vez: archivo de cuenta de servicio si existe,
+    o las credenciales por defecto del entorno (Cloud Run) en caso contrario.
+    """
+    import google.auth
+    from google.oauth2 import service_account
+
+    if credentials_path and os.path.exists(credentials_path):
+        return service_account.Credentials.from_service_account_file(credentials_path, scopes=SPEECH_SCOPES)
+    credentials, _ = google.auth.default(scopes=SPEECH_SCOPES)
+    return credentials
+
+
+def _refresh_loop(credentials, stop_event):
+    """
+    Renueva el token en segundo plano para que ninguna solicitud pague el minting OAuth.
+    """
+    from google.auth.transport.requests import Request
+
+    while not stop_event.is_set():
+        wait = TOKEN_RETRY_DELAY
+        try:
+            if not credentials.valid or credentials.expiry is None:
+                credentials.refresh(Request())
+            if credentials.expiry is not None:
+                remaining = credentials.expiry.timestamp() - time.time()
+                if remaining <= TOKEN_REFRESH_MARGIN:
+                    credentials.refresh(Request())
+                    remaining = credentials.expiry.timestamp() - time.time()
+                wait = max(TOKEN_RETRY_DELAY, remaining - TOKEN_REFRESH_MARGIN)
+        except Exception as e:
+            logger.error(f"No se pudo renovar el token de Speech-to-Text: {e}")
+        stop_event.wait(wait)
+
+
+def _build_client(credentials_path):
+    import grpc
+    from google.cloud import speech
+    from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+    from google.auth.transport.requests import Request
+
+    if init_cooperative_grpc():
+        logger.debug("gRPC integrado con gevent")
+    stop_event = threading.Event()
+    if SPEECH_EMULATOR_HOST:
+        channel = grpc.insecure_channel(SPEECH_EMULATOR_HOST, options=GRPC_CHANNEL_OPTIONS)
+        return speech.SpeechClient(transport=SpeechGrpcTransport(channel=channel)), stop_event
+
+    credentials = _load_credentials(credentials_path)
+    try:
+        credentials.refresh(Request())
+    except Exception as e:
+        logger.error(f"No se pudo obtener el token inicial de Speech-to-Text: {e}")
+
+    channel = SpeechGrpcTransport.create_channel(
+        credentials=credentials,
+        scopes=SPEECH_SCOPES,
+        options=GRPC_CHANNEL_OPTIONS,
+    )
+    client = speech.SpeechClient(transport=SpeechGrpcTransport(channel=channel))
+
+    refresher = threading.Thread(target=_refresh_loop, args=(credentials, stop_event), name="stt-token-refresh", daemon=True)
+    refresher.start()
+    return client, stop_event
+
+
+def get_speech_client(credentials_path=None):
+    """
+    Devuelve el cliente de Speech-to-Text compartido por el proceso.
+    Se crea una sola vez por worker (y por ruta de credenciales) y se reutiliza en todas las solicitudes.
+    """
+    key = credentials_path or "default"
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client, stop_event = _build_client(credentials_path)
+            _clients[key] = client
+            _refreshers[key] = stop_event
+            logger.debug(f"Cliente de Speech-to-Text compartido inicializado ({key})")
+    return client
+
+
+def decode_to_linear16(data, input_format=None, sample_rate=LINEAR16_SAMPLE_RATE, timeout=FFMPEG_TIMEOUT):
+    """
+    Decodifica el audio subido (WebM/Opus del navegador u otro formato que entienda ffmpeg)
+    a PCM LINEAR16 mono en una sola pasada por tuberías: sin archivos temporales ni segunda codificación.
+    Devuelve (pcm, duración en ms).
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "error"]
+    if input_format:
+        cmd += ["-f", input_format]
+    cmd += ["-i", "pipe:0", "-vn", "-ac", "1", "-ar", str(sample_rate), "-acodec", "pcm_s16le", "-f", "s16le", "pipe:1"]
+    try:
+        result = subprocess.run(cmd, input=data, capture_output=True, timeout=timeout)
+    except FileNotFoundError:
+        raise ValueError("ffmpeg no está instalado en el servidor")
+    except subprocess.TimeoutExpired:
+        raise ValueError(f"ffmpeg tardó más de {timeout:.1f} segundos en decodificar el audio")
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="ignore").strip()[-300:]
+        raise ValueError(f"Error al decodificar audio con ffmpeg: {error}")
+    pcm = result.stdout
+    duration_ms = len(pcm) * 1000 // (2 * sample_rate)
+    return pcm, duration_ms
+
+
+def _read_vint(data, pos, keep_marker=False):
+    """
+    Entero de longitud variable de EBML en data[pos:]. Devuelve (valor, bytes leídos);
+    valor None si es un tamaño desconocido (todo unos, como en los clusters de MediaRecorder).
+    """
+    first = data[pos]
+    if first == 0:
+        raise ValueError("Entero EBML no válido")
+    length = 9 - first.bit_length()
+    if len(data) < pos + length:
+        raise ValueError("Entero EBML truncado")
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def _webm_duration_ms(data):
+    """
+    Duración de un WebM según el último cluster: su Timecode más el mayor desplazamiento de sus
+    SimpleBlock (escala de 1 ms, la de los navegadores). None si no se puede leer.
+    """
+    pos = data.rfind(WEBM_CLUSTER)
+    while pos > 0:
+        try:
+            size, length = _read_vint(data, pos + 4)
+            p = pos + 4 + length
+            end = len(data) if size is None else min(len(data), p + size)
+            timecode, last_block = None, 0
+            while p < end:
+                element, length = _read_vint(data, p, keep_marker=True)
+                p += length
+                size, length = _read_vint(data, p)
+                p += length
+                if size is None:
+                    break
+                if element == WEBM_TIMECODE:
+                    timecode = int.from_bytes(data[p:p + size], "big")
+                elif element == WEBM_SIMPLE_BLOCK:
+                    _, track_length = _read_vint(data, p)
+                    last_block = max(last_block, int.from_bytes(data[p + track_length:p + track_length + 2], "big", signed=True))
+                p += size
+            if timecode is not None:
+                return timecode + last_block
+        except (IndexError, ValueError):
+            pass
+        # Los bytes del ID pueden aparecer por casualidad dentro del audio: se prueba el anterior
+        pos = data.rfind(WEBM_CLUSTER, 0, pos)
+    return None
+
+
+def _opus_channels(data, head):
+    return data[head + 9] if head >= 0 and len(data) > head + 9 else 0
+
+
+def sniff_audio(data):
+    """
+    Identifica el contenedor y el códec por los bytes de cabecera, sin decodificar.
+    Devuelve SniffedAudio (encoding es el de RecognitionConfig, o None si Speech-to-Text no lo acepta).
+    """
+    header = data[:SNIFF_HEADER_BYTES]
+    if header.startswith(EBML_MAGIC):
+        if b"A_OPUS" not in header:
+            return SniffedAudio("webm", None, None, 0, None)
+        channels = _opus_channels(header, header.find(OPUS_HEAD))
+        return SniffedAudio("webm", "WEBM_OPUS", OPUS_SAMPLE_RATE, channels, _webm_duration_ms(data))
+    if header.startswith(b"OggS"):
+        head = header.find(OPUS_HEAD)
+        if head < 0:
+            return SniffedAudio("ogg", None, None, 0, None)
+        # Posición granular de la última página (muestras a 48 kHz) menos el pre-skip de OpusHead
+        pre_skip = int.from_bytes(header[head + 10:head + 12], "little")
+        last_page = data.rfind(b"OggS")
+        granule = int.from_bytes(data[last_page + 6:last_page + 14], "little")
+        duration_ms = max(0, granule - pre_skip) * 1000 // OPUS_SAMPLE_RATE
+        return SniffedAudio("ogg", "OGG_OPUS", OPUS_SAMPLE_RATE, _opus_channels(header, head), duration_ms)
+    if header.startswith(b"fLaC") and len(header) >= 26:
+        # STREAMINFO: frecuencia (20 bits), canales - 1 (3), bits por muestra - 1 (5), muestras totales (36)
+        info = int.from_bytes(header[18:26], "big")
+        sample_rate = info >> 44
+        channels = ((info >> 41) & 0x7) + 1
+        bits = ((info >> 36) & 0x1F) + 1
+        total = info & ((1 << 36) - 1)
+        encoding = "FLAC" if bits in (16, 24) and 8000 <= sample_rate <= 48000 else None
+        return SniffedAudio("flac", encoding, sample_rate, channels, total * 1000 // sample_rate if sample_rate and total else None)
+    if header.startswith(b"RIFF") and header[8:12] == b"WAVE":
+        return SniffedAudio("wav", None, None, 0, None)
+    return SniffedAudio("other", None, None, 0, None)
+
+
+def can_passthrough(sniffed):
+    """
+    True si el audio puede ir a Speech-to-Text sin decodificar: códec aceptado, mono y con
+    duración conocida (para elegir el modelo). Si no, se decodifica con ffmpeg.
+    """
+    return STT_PASSTHROUGH and sniffed.encoding is not None and sniffed.channels == 1 and bool(sniffed.duration_ms)
+
+
+def linear16_to_wav(pcm, sample_rate=LINEAR16_SAMPLE_RATE):
+    """
+    Envuelve PCM LINEAR16 mono en una cabecera WAV (solo para guardar audio de depuración).
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def iter_audio_chunks(stream, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Lee el cuerpo de la solicitud a medida que llega (transfer-encoding chunked) sin esperar al final.
+    """
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def stream_transcripts(speech_client, config, audio_chunks, interim_results=True, timeout=None):
+    """
+    Envía los fragmentos de audio a streaming_recognize según llegan y produce
+    diccionarios {"text", "final", "stability", "language"} con los resultados parciales y finales.
+    `timeout` es el plazo de toda la llamada (gRPC la cancela al vencer, aunque el stream esté parado).
+    """
+    from google.cloud import speech
+
+    streaming_config = speech.StreamingRecognitionConfig(config=config, interim_results=interim_results)
+    requests = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in audio_chunks if chunk)
+    responses = speech_client.streaming_recognize(config=streaming_config, requests=requests, timeout=timeout)
+    for response in responses:
+        for result in response.results:
+            if not result.alternatives:
+                continue
+            yield {
+                "text": result.alternatives[0].transcript,
+                "final": result.is_final,
+                "stability": round(result.stability, 3),
+                "language": result.language_code or None,
+            }
+
+
+def _reset_after_fork():
+    """
+    Los canales gRPC y los hilos no sobreviven a un fork: el hijo crea los suyos.
+    """
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    _refreshers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,122 @@
+import os
+from collections import namedtuple
+
+from app.modules.metrics import observe_vad
+
+# Detección de voz por energía y cruces por cero sobre el PCM LINEAR16 ya decodificado:
+# recorta los silencios del principio y del final, acorta las pausas largas y descarta
+# los audios sin voz antes de llamar a Speech-to-Text
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", 20))
+# Energía RMS mínima de una trama con voz (escala int16; 200 ≈ -44 dBFS)
+VAD_MIN_RMS = float(os.getenv("VAD_MIN_RMS", 200))
+# El umbral sigue al ruido de fondo (percentil 10 de la energía) multiplicado por este factor...
+VAD_NOISE_RATIO = float(os.getenv("VAD_NOISE_RATIO", 3.0))
+# ...sin pasar de esta fracción de la trama más fuerte, para no cortar voz continua...
+VAD_PEAK_FRACTION = float(os.getenv("VAD_PEAK_FRACTION", 0.3))
+# ...y nunca por debajo de este múltiplo del ruido: un silencio con ruido constante no es voz
+VAD_MIN_SNR = float(os.getenv("VAD_MIN_SNR", 2.0))
+# Fricativas (s, f, x): poca energía pero muchos cruces por cero
+VAD_ZCR_THRESHOLD = float(os.getenv("VAD_ZCR_THRESHOLD", 0.25))
+# Se conserva audio antes (pre-roll) y después (hangover) de cada trama con voz
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", 150))
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", 300))
+# Las pausas interiores más largas se reducen a esta duración
+VAD_MAX_PAUSE_MS = int(os.getenv("VAD_MAX_PAUSE_MS", 600))
+# Con menos voz que esto el audio se considera silencio
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", 200))
+
+VadResult = namedtuple("VadResult", ["pcm", "input_ms", "output_ms", "speech_ms"])
+
+
+def _frame_features(frames):
+    """
+    Energía RMS y tasa de cruces por cero de cada trama (una fila por trama).
+    """
+    import numpy as np
+
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return rms, zcr
+
+
+def speech_frames(frames):
+    """
+    Máscara de tramas con voz: energía sobre el umbral adaptativo, o energía media y muchos cruces por cero.
+    """
+    import numpy as np
+
+    rms, zcr = _frame_features(frames)
+    noise = float(np.percentile(rms, 10))
+    floor = max(VAD_MIN_RMS, noise * VAD_MIN_SNR)
+    threshold = max(floor, min(noise * VAD_NOISE_RATIO, float(rms.max()) * VAD_PEAK_FRACTION))
+    # Las fricativas pueden quedar por debajo del umbral, pero no del ruido: el ruido blanco también cruza mucho por cero
+    return (rms > threshold) | ((rms > max(floor, threshold / 2)) & (zcr > VAD_ZCR_THRESHOLD))
+
+
+def _smooth(speech, preroll, hangover):
+    """
+    Extiende cada trama con voz `preroll` tramas hacia atrás y `hangover` hacia delante.
+    """
+    import numpy as np
+
+    window = np.ones(preroll + hangover + 1, dtype=np.int32)
+    spread = np.convolve(speech.astype(np.int32), window, mode="full")
+    return spread[preroll:preroll + len(speech)] > 0
+
+
+def _keep_mask(active, max_pause):
+    """
+    Tramas a conservar: las activas y, de cada pausa interior, como mucho `max_pause` tramas
+    (la mitad al principio y la mitad al final). Los silencios de los extremos se descartan.
+    """
+    import numpy as np
+
+    keep = active.copy()
+    edges = np.diff(np.concatenate(([0], (~active).astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    half = max_pause // 2
+    for start, end in zip(starts, ends):
+        if start == 0 or end == len(active):
+            continue
+        if end - start <= max_pause:
+            keep[start:end] = True
+        else:
+            keep[start:start + half] = True
+            keep[end - half:end] = True
+    return keep
+
+
+def trim_silence(pcm, sample_rate=16000):
+    """
+    Recorta el PCM LINEAR16 mono a la voz que contiene. Devuelve un VadResult; si no hay voz
+    suficiente, `pcm` viene vacío. Registra en /metrics la fracción recortada.
+    """
+    samples_per_frame = sample_rate * VAD_FRAME_MS // 1000
+    input_ms = len(pcm) * 1000 // (2 * sample_rate)
+    if not VAD_ENABLED:
+        return VadResult(pcm, input_ms, input_ms, input_ms)
+
+    import numpy as np
+
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+    count = len(samples) // samples_per_frame
+    if count == 0:
+        observe_vad(input_ms, 0, silent=True)
+        return VadResult(b"", input_ms, 0, 0)
+    frames = samples[:count * samples_per_frame].reshape(count, samples_per_frame)
+
+    speech = speech_frames(frames.astype(np.float32))
+    speech_ms = int(speech.sum()) * VAD_FRAME_MS
+    if speech_ms < VAD_MIN_SPEECH_MS:
+        observe_vad(input_ms, 0, silent=True)
+        return VadResult(b"", input_ms, 0, speech_ms)
+
+    active = _smooth(speech, VAD_PREROLL_MS // VAD_FRAME_MS, VAD_HANGOVER_MS // VAD_FRAME_MS)
+    keep = _keep_mask(active, VAD_MAX_PAUSE_MS // VAD_FRAME_MS)
+    trimmed = frames[keep].tobytes()
+    output_ms = int(keep.sum()) * VAD_FRAME_MS
+    observe_vad(input_ms, output_ms, silent=False)
+    return VadResult(trimmed, input_ms, output_ms, speech_ms)
@@ -0,0 +1,213 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from app.config import GUNICORN_WORKERS
+from app.modules.metrics import cache_event
+from app.modules.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# El clima cambia en escalas de minutos y kilómetros: se agrupan las coordenadas en una rejilla
+WEATHER_GRID_DEGREES = float(os.getenv("WEATHER_GRID_DEGREES", 0.05))  # ~5,5 km
+WEATHER_TTL = float(os.getenv("WEATHER_TTL", 600))
+WEATHER_STALE_TTL = float(os.getenv("WEATHER_STALE_TTL", 1800))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", 1024))
+# Precarga: cada worker revisa cada WEATHER_PREFETCH_INTERVAL segundos las celdas que le pidieron en los
+# últimos WEATHER_PREFETCH_RECENT segundos y refresca en su caché las que caducarían antes de la siguiente
+# pasada. WEATHER_PREFETCH_MAX_CELLS es el total de la instancia: cada worker precarga su parte.
+# Volumen por instancia: cada celda precargada se refresca cada 480-600 s (TTL menos una pasada), de 144 a
+# 180 llamadas al día, y unas 7 más tras su última consulta; con las 10 celdas ocupadas todo el día,
+# como mucho ~1800. Sin consultas no hay llamadas. Las celdas fuera del cupo se refrescan bajo demanda
+WEATHER_PREFETCH_INTERVAL = float(os.getenv("WEATHER_PREFETCH_INTERVAL", 120))
+WEATHER_PREFETCH_RECENT = float(os.getenv("WEATHER_PREFETCH_RECENT", 3600))
+WEATHER_PREFETCH_MAX_CELLS = int(os.getenv("WEATHER_PREFETCH_MAX_CELLS", 10))
+WEATHER_PREFETCH = os.getenv("WEATHER_PREFETCH", "1") == "1"
+WEATHER_WORKER_PREFETCH_CELLS = max(1, WEATHER_PREFETCH_MAX_CELLS // GUNICORN_WORKERS)
+
+
+def snap_coordinates(lat, lon, grid=WEATHER_GRID_DEGREES):
+    """
+    Ajusta las coordenadas al centro de su celda de la rejilla.
+    """
+    lat = float(lat)
+    lon = float(lon)
+    return round(round(lat / grid) * grid, 4), round(round(lon / grid) * grid, 4)
+
+
+class WeatherCache:
+    """
+    Caché de clima por celda de rejilla con TTL y stale-while-revalidate:
+    hasta WEATHER_TTL se sirve directamente; durante WEATHER_STALE_TTL más se sirve
+    el dato anterior mientras se refresca en segundo plano.
+    """
+
+    def __init__(self, grid=WEATHER_GRID_DEGREES, ttl=WEATHER_TTL, stale_ttl=WEATHER_STALE_TTL, max_entries=WEATHER_CACHE_MAX_ENTRIES):
+        self.grid = grid
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._requested = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("openweather")
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _store(self, key, data):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, lat, lon, fetch):
+        """
+        Consulta el clima de la celda (usando su centro) y lo guarda. Propaga los errores de fetch.
+        Las consultas simultáneas de la misma celda comparten una sola llamada.
+        """
+        key = snap_coordinates(lat, lon, self.grid)
+
+        def fetch_and_store():
+            data = fetch(*key)
+            self._store(key, data)
+            return data
+
+        return self._flight.do(key, fetch_and_store)
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(key[0], key[1], fetch)
+            except Exception as e:
+                logger.error(f"No se pudo refrescar el clima de {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="weather-refresh", daemon=True).start()
+
+    def get(self, lat, lon, fetch):
+        key = snap_coordinates(lat, lon, self.grid)
+        with self._lock:
+            entry = self._entries.get(key)
+            self._requested[key] = time.monotonic()
+            self._requested.move_to_end(key)
+            while len(self._requested) > self.max_entries:
+                self._requested.popitem(last=False)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                with self._lock:
+                    self.hits += 1
+                cache_event("weather", "hit")
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    self.stale_hits += 1
+                cache_event("weather", "stale")
+                self._refresh_in_background(key, fetch)
+                return entry[1]
+        with self._lock:
+            self.misses += 1
+        cache_event("weather", "miss")
+        return self.refresh(lat, lon, fetch)
+
+    def prefetch_candidates(self, recent, horizon, limit):
+        """
+        De las `limit` celdas pedidas más recientemente (en los últimos `recent` segundos), las que
+        no tienen dato o lo tienen caducando en menos de `horizon` segundos.
+        """
+        now = time.monotonic()
+        candidates = []
+        with self._lock:
+            for index, (key, requested_at) in enumerate(reversed(self._requested.items())):
+                if now - requested_at > recent or index >= limit:
+                    break
+                entry = self._entries.get(key)
+                if entry is None or now - entry[0] >= self.ttl - horizon:
+                    candidates.append(key)
+        return candidates
+
+    def stats(self):
+        with self._lock:
+            stats = {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses, "entries": len(self._entries)}
+        stats["upstream"] = self._flight.stats()
+        return stats
+
+
+class PlaceCache:
+    """
+    Memoriza resultados de geocodificación (los lugares no se mueven), con tamaño acotado.
+    """
+
+    def __init__(self, max_entries=WEATHER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("geocoding")
+
+    def get_or_fetch(self, key, fetch):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                cache_event("geocoding", "hit")
+                return self._entries[key]
+        cache_event("geocoding", "miss")
+
+        def fetch_and_store():
+            value = fetch()
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+
+        return self._flight.do(key, fetch_and_store)
+
+
+weather_cache = WeatherCache()
+place_cache = PlaceCache()
+
+_prefetcher = None
+
+
+def start_weather_prefetcher(fetch, interval=WEATHER_PREFETCH_INTERVAL, max_cells=WEATHER_WORKER_PREFETCH_CELLS):
+    """
+    Mantiene caliente en la caché de este worker el clima de las celdas que le consultaron hace poco,
+    como mucho `max_cells` (su parte del cupo de la instancia). Un solo hilo por proceso.
+    """
+    global _prefetcher
+    if _prefetcher is not None or not WEATHER_PREFETCH:
+        return _prefetcher
+
+    def run():
+        while True:
+            time.sleep(interval)
+            for key in weather_cache.prefetch_candidates(WEATHER_PREFETCH_RECENT, interval, max_cells):
+                try:
+                    weather_cache.refresh(key[0], key[1], fetch)
+                except Exception as e:
+                    logger.error(f"No se pudo precargar el clima de {key}: {e}")
+
+    _prefetcher = threading.Thread(target=run, name="weather-prefetch", daemon=True)
+    _prefetcher.start()
+    return _prefetcher
+
+
+def _reset_after_fork():
+    global _prefetcher
+    _prefetcher = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,31 +1,42 @@
-from flask import Blueprint, request, jsonify, send_file, render_template, current_app as app
-import io
+from flask import Blueprint, request, jsonify, render_template
 import os
-import tempfile
 import requests
 import re
-import subprocess
-import time
-import traceback
-from pydub import AudioSegment
 import urllib.parse
 from datetime import datetime
 import pytz
-from google.cloud import speech
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from bs4 import BeautifulSoup
-import langdetect
 
+from app.modules.speech_synthesis import tts_cache, tts_cache_key, tts_flight, join_synthesis, audio_response, stream_audio_response, wav_header, negotiate_tts_format, TTS_FORMATS
+from app.modules.transcription import get_speech_client, decode_to_linear16, linear16_to_wav, sniff_audio, can_passthrough, LINEAR16_SAMPLE_RATE
+from app.modules.recognition import recognition_config
+from app.modules.vad import trim_silence
+from app.config import HTTP_POOL_MAXSIZE
+from app.modules.resilience import CountingRetry, UpstreamClient, DeadlineExceeded, CircuitOpenError, get_breaker, start_deadline, upstream_timeout
+from app.modules.metrics import metrics_response, stage, observe_stt_upload, observe_tts_payload
+from app.modules.event_log import get_event_logger, log_config_request
+from app.modules.activities import trail_cache, start_trail_scraper, format_trails, load_parser as load_html_parser, WIKILOC_URL
+from app.modules.startup import register_warmup
 from app.utils.helpers import detect_language_nlp, detect_language, is_news_related, query_newsapi, extract_city, add_header
 
 main_routes = Blueprint('main', __name__)
+log = get_event_logger(__name__)
 
-# Configurar reintentos para solicitudes HTTP
-retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-adapter = HTTPAdapter(max_retries=retries)
+# Sesión HTTP compartida, como en appv2: solo se reintenta una conexión fallida (sin backoff); los tiempos
+# los controlan el presupuesto por solicitud y los circuit breakers de cada upstream
+retries = CountingRetry(total=1, connect=1, read=0, status=0, backoff_factor=0)
+adapter = HTTPAdapter(max_retries=retries, pool_connections=HTTP_POOL_MAXSIZE, pool_maxsize=HTTP_POOL_MAXSIZE)
 http = requests.Session()
 http.mount("https://", adapter)
+http.mount("http://", adapter)
+
+# Un cliente por upstream con su timeout máximo y su circuit breaker (los mismos nombres que en appv2)
+openweather_api = UpstreamClient(http, "openweather", timeout=10)
+xai_api = UpstreamClient(http, "xai", timeout=20)
+azure_tts_api = UpstreamClient(http, "azure-tts", timeout=10)
+wikiloc_api = UpstreamClient(http, "wikiloc", timeout=10)
+speech_breaker = get_breaker("speech-to-text")
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", 20))
 
 # Variables globales para las claves API
 OPENWEATHER_API_KEY = None
@@ -36,10 +47,15 @@ AZURE_REGION = None
 GOOGLE_APPLICATION_CREDENTIALS = None
 SCRAPE_DELAY = None
 
-# Carga las claves API dentro del contexto de la aplicación
+# Carga las claves API dentro del contexto de la aplicación (una vez por proceso: no cambian entre solicitudes)
+_api_keys_loaded = False
+
 @main_routes.before_app_request
 def load_api_keys():
-    global OPENWEATHER_API_KEY, SUPERGROK_API_KEY, AZURE_SPEECH_KEY, NEWS_API_KEY, AZURE_REGION, GOOGLE_APPLICATION_CREDENTIALS, SCRAPE_DELAY
+    global OPENWEATHER_API_KEY, SUPERGROK_API_KEY, AZURE_SPEECH_KEY, NEWS_API_KEY, AZURE_REGION, GOOGLE_APPLICATION_CREDENTIALS, SCRAPE_DELAY, _api_keys_loaded
+    if _api_keys_loaded:
+        return
+    _api_keys_loaded = True
     OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
     SUPERGROK_API_KEY = os.getenv("SUPERGROK_API_KEY")
     AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
@@ -49,15 +65,23 @@ def load_api_keys():
     SCRAPE_DELAY = float(os.getenv("SCRAPE_DELAY", 1.0))
 
     # Verifica las claves API
-    app.logger.debug(f"OPENWEATHER_API_KEY = {'set' if OPENWEATHER_API_KEY else 'not set'}")
-    app.logger.debug(f"SUPERGROK_API_KEY = {'set' if SUPERGROK_API_KEY else 'not set'}")
-    app.logger.debug(f"AZURE_SPEECH_KEY = {'set' if AZURE_SPEECH_KEY else 'not set'}")
-    app.logger.debug(f"NEWS_API_KEY = {'set' if NEWS_API_KEY else 'not set'}")
-    app.logger.debug(f"GOOGLE_APPLICATION_CREDENTIALS = {'set' if GOOGLE_APPLICATION_CREDENTIALS else 'not set'}")
-    app.logger.debug(f"SCRAPE_DELAY = {SCRAPE_DELAY} seconds")
+    log.info(
+        "startup.config",
+        openweather_api_key=bool(OPENWEATHER_API_KEY),
+        supergrok_api_key=bool(SUPERGROK_API_KEY),
+        azure_speech_key=bool(AZURE_SPEECH_KEY),
+        news_api_key=bool(NEWS_API_KEY),
+        google_application_credentials=bool(GOOGLE_APPLICATION_CREDENTIALS),
+        scrape_delay=SCRAPE_DELAY
+    )
 
     if not os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
-        app.logger.error(f"Archivo de credenciales de Google no encontrado en {GOOGLE_APPLICATION_CREDENTIALS}")
+        log.error("startup.google_credentials_missing", path=GOOGLE_APPLICATION_CREDENTIALS)
+
+# Presupuesto de tiempo de la solicitud: todas las llamadas a upstreams salen de él
+@main_routes.before_app_request
+def start_request_deadline():
+    start_deadline()
 
 @main_routes.after_request
 def after_request(response):
@@ -66,10 +90,10 @@ def after_request(response):
 @main_routes.route('/')
 def home():
     try:
-        app.logger.debug("Renderizando index-v2.html")
+        log.debug("home.render", template="index-v2.html")
         return render_template('index-v2.html')
     except Exception as e:
-        app.logger.error(f"Error al renderizar index-v2.html: {str(e)}\n{traceback.format_exc()}")
+        log.exception("home.render_error", error=e)
         return jsonify({"error": "Error interno del servidor"}), 500
 
 @main_routes.route('/favicon.ico')
@@ -83,134 +107,120 @@ def test():
 @main_routes.route('/transcribe', methods=['POST'])
 def transcribe_audio():
     try:
-        app.logger.debug("Verificando ffmpeg")
-        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
-        app.logger.debug(f"FFmpeg version: {ffmpeg_version[:50]}...")
-
         google_credentials_path = GOOGLE_APPLICATION_CREDENTIALS
-        app.logger.debug(f"Ruta de credenciales de Google Cloud: {google_credentials_path}")
         if not os.path.exists(google_credentials_path):
             raise ValueError(f"Archivo de credenciales no encontrado en {google_credentials_path}")
 
-        speech_client = speech.SpeechClient.from_service_account_json(google_credentials_path)
-        app.logger.debug("Cliente de Speech-to-Text inicializado")
+        speech_client = get_speech_client(google_credentials_path)
 
         if 'audio' not in request.files:
-            app.logger.error("No se proporcionó un archivo de audio")
+            log.warning("transcribe.no_audio")
             return jsonify({"error": "No se proporcionó un archivo de audio"}), 400
 
         audio_file = request.files['audio']
         if not audio_file.filename:
-            app.logger.error("El archivo de audio está vacío o sin nombre")
+            log.warning("transcribe.unnamed_audio")
             return jsonify({"error": "El archivo de audio está vacío o sin nombre"}), 400
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_audio:
-            audio_file.save(temp_audio.name)
-            file_size = os.path.getsize(temp_audio.name)
-            app.logger.debug(f"Tamaño del archivo de audio: {file_size} bytes")
-            if file_size < 100:
-                raise ValueError(f"El archivo de audio es demasiado pequeño: {file_size} bytes")
-
+        uploaded = audio_file.read()
+        file_size = len(uploaded)
+        log.debug("transcribe.upload", bytes=file_size)
+        if file_size < 100:
+            raise ValueError(f"El archivo de audio es demasiado pequeño: {file_size} bytes")
+
+        # Opus (WebM/OGG) y FLAC mono van a Speech-to-Text tal cual; el resto se decodifica a LINEAR16 y pasa por el VAD
+        sniffed = sniff_audio(uploaded)
+        if can_passthrough(sniffed):
+            content, duration_ms = uploaded, sniffed.duration_ms
+            encoding, sample_rate = sniffed.encoding, sniffed.sample_rate
+            log.debug("transcribe.passthrough", container=sniffed.container, encoding=encoding, duration_ms=duration_ms)
+            if duration_ms < 1000:
+                raise ValueError("El audio es demasiado corto para procesar")
+            observe_stt_upload(sniffed.container, "passthrough", len(content))
+        else:
             try:
-                audio = AudioSegment.from_file(temp_audio.name, format="webm")
-                audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
-                app.logger.debug(f"Audio procesado con pydub, duración (ms): {len(audio)}")
-                if len(audio) < 1000:
+                with stage("audio_decode"):
+                    content, duration_ms = decode_to_linear16(uploaded)
+                log.debug("transcribe.decoded", container=sniffed.container, duration_ms=duration_ms, bytes=len(content))
+                if duration_ms < 1000:
                     raise ValueError("El audio es demasiado corto para procesar")
             except Exception as e:
-                app.logger.error(f"Error al procesar audio con pydub: {str(e)}\n{traceback.format_exc()}")
-                raise ValueError(f"Error al procesar audio con pydub: {str(e)}")
-
-            temp_wav = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-            audio.export(temp_wav.name, format="wav", parameters=["-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1"])
-            wav_size = os.path.getsize(temp_wav.name)
-            app.logger.debug(f"Tamaño del archivo WAV: {wav_size} bytes")
-            if wav_size < 1000:
-                raise ValueError(f"El archivo WAV es demasiado pequeño: {wav_size} bytes")
-
-            with open(temp_wav.name, "rb") as audio_file:
-                content = audio_file.read()
+                log.exception("transcribe.decode_error", error=e)
+                raise ValueError(f"Error al decodificar audio: {str(e)}")
+
             if not content:
                 raise ValueError("El contenido del archivo de audio está vacío")
 
-            detected_language = detect_language_nlp(content.decode('utf-8', errors='ignore'))
-            if not detected_language:
-                app.logger.warning("No se pudo detectar el idioma, usando es-ES por defecto")
-                detected_language = "es"
-            language_code = "es-ES" if detected_language == "es" else "pt-BR"
-            alternative_codes = ["pt-BR", "en-US", "fr-FR", "it-IT"]
-            app.logger.debug(f"Idioma detectado: {detected_language}, usando language_code: {language_code}")
-
-            audio = speech.RecognitionAudio(content=content)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=16000,
-                language_code=language_code,
-                alternative_language_codes=alternative_codes,
-                enable_automatic_punctuation=True,
-                model="default",
-                enable_word_time_offsets=True,
-                audio_channel_count=1,
-                enable_separate_recognition_per_channel=False,
-                speech_contexts=[speech.SpeechContext(phrases=[
-                    "hola", "cómo estás", "hablar", "español", "portugués",
-                    "Maricá", "Río de Janeiro", "Niterói", "Saquarema",
-                    "Buenos Aires", "Petrópolis", "Londres", "Tokio",
-                    "Itaboraí", "Magé", "Teresópolis", "Arraial do Cabo",
-                    "São Pedro da Aldeia", "São José do Vale do Rio Preto",
-                    "Barra Mansa", "Nova Friburgo", "Visconde de Mauá",
-                    "Resende", "Penedo", "Parque Nacional de Itatiaia",
-                    "Parque Natural Municipal Morada dos Corrêas",
-                    "Espraiado", "Ponta Negra", "Serra da Tiririca",
-                    "Barra de Sana", "Pedra de Inoã", "fluminense", "buziano",
-                    "Yara", "Jenny", "Dania", "Denise", "Isabella",
-                    "Reserva Natural de Massambaba - Saquarema", "Pedra do Macaco",
-                    "Trilha da Pedra do Macaco", "Cachoeira do Segredo en Silvado",
-                    "Tribo Nawa Ayahuasca Maricá"
-                ])]
-            )
-
-            app.logger.debug(f"Enviando audio a Speech-to-Text: {len(content)} bytes, config: {config}")
-            response = speech_client.recognize(config=config, audio=audio)
-            app.logger.debug(f"Respuesta de Speech-to-Text: {response}")
-            if not response.results:
-                app.logger.error("No hay resultados en la transcripción. Audio guardado para depuración.")
+            # Recorta silencios y pausas largas; si no hay voz se responde sin llamar a STT
+            with stage("vad"):
+                voice = trim_silence(content)
+            log.debug("vad.result", input_ms=voice.input_ms, output_ms=voice.output_ms, speech_ms=voice.speech_ms)
+            if not voice.pcm:
+                log.warning("vad.no_speech", input_ms=voice.input_ms)
+                return jsonify({"error": "No se detectó voz clara. Intenta hablar más claro y cerca del micrófono."}), 400
+            content, duration_ms = voice.pcm, voice.output_ms
+            encoding, sample_rate = "LINEAR16", LINEAR16_SAMPLE_RATE
+            observe_stt_upload(sniffed.container, "transcode", len(content))
+
+        # El idioma lo indica el cliente o se identifica en el texto del turno anterior
+        detected_language = request.form.get('language')
+        if not detected_language:
+            with stage("language_detection"):
+                detected_language = detect_language_nlp(request.form.get('context', ''))
+        if not detected_language:
+            log.warning("transcribe.language_unknown", default="es")
+            detected_language = "es"
+        # Perfil precompilado según el idioma y la duración (órdenes cortas -> modelo de enunciados cortos)
+        config = recognition_config(detected_language, duration_ms, encoding, sample_rate)
+        log.debug("transcribe.language", language=detected_language, language_code=config.language_code, model=config.model)
+
+        # google.cloud.speech se importa en el primer uso para no cargarlo al arrancar
+        from google.cloud import speech
+        audio = speech.RecognitionAudio(content=content)
+
+        with stage("stt"):
+            response = speech_breaker.call(lambda: speech_client.recognize(config=config, audio=audio, timeout=upstream_timeout(STT_TIMEOUT)))
+        log.debug("stt.response", results=len(response.results), response=response)
+        if not response.results:
+            log.warning("stt.no_results", saved_audio=True)
+            if encoding == "LINEAR16":
                 with open("/home/cris/voz_robotica/test_audio.wav", "wb") as test_file:
+                    test_file.write(linear16_to_wav(content))
+            else:
+                with open(f"/home/cris/voz_robotica/test_audio.{sniffed.container}", "wb") as test_file:
                     test_file.write(content)
-                return jsonify({"error": "No se detectó voz clara. Intenta hablar más claro y cerca del micrófono."}), 400
-            transcription = response.results[0].alternatives[0].transcript
-            if not transcription.strip():
-                app.logger.error("Transcripción vacía.")
-                return jsonify({"error": "No se detectó voz clara. Intenta hablar más claro y cerca del micrófono."}), 400
-            app.logger.debug(f"Transcripción obtenida: {transcription}")
-            os.unlink(temp_audio.name)
-            os.unlink(temp_wav.name)
-            return jsonify({"text": transcription, "language": detected_language})
-
+            return jsonify({"error": "No se detectó voz clara. Intenta hablar más claro y cerca del micrófono."}), 400
+        transcription = response.results[0].alternatives[0].transcript
+        if not transcription.strip():
+            log.warning("stt.empty_transcript")
+            return jsonify({"error": "No se detectó voz clara. Intenta hablar más claro y cerca del micrófono."}), 400
+        log.debug("stt.transcript", text=transcription)
+        return jsonify({"text": transcription, "language": detected_language})
+
+    except (DeadlineExceeded, CircuitOpenError) as e:
+        log.error("stt.unavailable", error=e)
+        return jsonify({"error": f"Servicio de Speech-to-Text no disponible temporalmente: {str(e)}"}), 503
     except Exception as e:
-        app.logger.error(f"Error al procesar audio: {str(e)}\n{traceback.format_exc()}")
-        if 'temp_audio' in locals():
-            os.unlink(temp_audio.name)
-        if 'temp_wav' in locals():
-            os.unlink(temp_wav.name)
+        log.exception("transcribe.error", error=e)
         return jsonify({"error": f"Error al transcribir audio: {str(e)}"}), 500
 
 def get_weather(lat, lon):
     api_key = os.getenv('OPENWEATHER_API_KEY')
     if not api_key:
-        app.logger.error("La clave de OpenWeatherMap no está configurada.")
+        log.error("openweather.missing_key")
         return "No se pudo obtener el clima porque falta la clave API."
 
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
     try:
-        response = requests.get(url)
+        with stage("weather"):
+            response = openweather_api.get(url)
         response.raise_for_status()
         weather_data = response.json()
         description = weather_data['weather'][0]['description']
         temperature = weather_data['main']['temp']
         return f"El clima actual es {description} con una temperatura de {temperature}°C."
     except requests.exceptions.RequestException as e:
-        app.logger.error(f"Error al obtener el clima: {str(e)}")
+        log.error("weather.error", error=e)
         return "No se pudo obtener la información del clima en este momento."
 
 @main_routes.route('/ask-ai', methods=['POST'])
@@ -218,14 +228,14 @@ def ask_ai():
     try:
         data = request.get_json()
         if not data or 'text' not in data:
-            app.logger.error("No se proporcionó texto en la solicitud")
+            log.warning("ask.no_text")
             return jsonify({"error": "No se proporcionó texto"}), 400
 
         text = data['text'].lower()
         language = data.get('language', 'es')  # Idioma detectado por /transcribe
         lat = data.get('lat', -22.91889)
         lon = data.get('lon', -42.81889)
-        app.logger.debug(f"Recibido: texto={text}, language={language}, lat={lat}, lon={lon}")
+        log.debug("ask.request", text=text, language=language, lat=lat, lon=lon)
 
         assistant_names = {
             'denis': {'name': 'Denise', 'voice': 'fr-FR-DeniseNeural', 'lang': 'fr'},
@@ -245,7 +255,7 @@ def ask_ai():
             assistant_name = mentioned_assistant['name']
             voice_name = mentioned_assistant['voice']
             lang_code = mentioned_assistant['lang']
-            app.logger.debug(f"Asistente mencionada: {assistant_name}, Voz: {voice_name}, Idioma: {lang_code}")
+            log.debug("ask.assistant", assistant=assistant_name, voice=voice_name, language=lang_code)
         else:
             lang_code = language  # Usar el idioma detectado por /transcribe
             lang_to_assistant = {
@@ -259,7 +269,7 @@ def ask_ai():
             assistant_name = assistant['name']
             voice_name = assistant['voice']
 
-        app.logger.debug("Consulta general, consultando SuperGrok")
+        log.debug("ask.route", route="llm")
         url = "https://api.x.ai/v1/chat/completions"
         headers = {"Authorization": f"Bearer {SUPERGROK_API_KEY}", "Content-Type": "application/json"}
         system_message = {
@@ -274,13 +284,17 @@ def ask_ai():
             "messages": [{"role": "system", "content": system_message}, {"role": "user", "content": text}],
             "max_tokens": 150
         }
-        response = http.post(url, json=payload, headers=headers, timeout=20)
+        with stage("llm"):
+            response = xai_api.post(url, json=payload, headers=headers)
         result = response.json()
         answer = result['choices'][0]['message']['content'].strip()
         return jsonify({"response": answer, "voice": voice_name, "language": lang_code})
 
+    except (DeadlineExceeded, CircuitOpenError) as e:
+        log.error("ask.upstream_unavailable", error=e)
+        return jsonify({"error": "El servicio no está disponible temporalmente. Intenta de nuevo en unos instantes."}), 503
     except Exception as e:
-        app.logger.error(f"Error en /ask-ai: {str(e)}")
+        log.error("ask.error", error=e)
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
 
 @main_routes.route('/speak', methods=['POST'])
@@ -288,21 +302,21 @@ def speak():
     try:
         data = request.get_json()
         if not data or 'text' not in data or 'voice' not in data or 'language' not in data:
-            app.logger.error("Faltan datos para sintetizar audio")
+            log.warning("tts.no_text")
             return jsonify({"error": "Faltan datos"}), 400
 
         text = data['text']
         voice_name = data['voice']
         language = data['language']
-        app.logger.debug(f"Procesando texto: {text}, voz: {voice_name}, idioma: {language}")
+        log.debug("tts.request", text=text, voice=voice_name, language=language)
 
         valid_voices = ['pt-BR-YaraNeural', 'en-US-JennyNeural', 'es-AR-DaniaNeural', 'fr-FR-DeniseNeural', 'it-IT-IsabellaNeural']
         if voice_name not in valid_voices:
-            app.logger.error(f"Voz no válida: {voice_name}")
+            log.warning("tts.invalid_voice", voice=voice_name)
             return jsonify({"error": f"Voz no válida. Opciones: {valid_voices}"}), 400
 
         if not AZURE_SPEECH_KEY:
-            app.logger.error("AZURE_SPEECH_KEY no está configurada")
+            log.error("tts.missing_key")
             return jsonify({"error": "Falta la clave de API de Azure Speech"}), 500
 
         lang_map = {
@@ -314,64 +328,113 @@ def speak():
         }
         expected_lang = lang_map.get(voice_name, 'es-AR')
         if language != expected_lang.split('-')[0]:
-            app.logger.warning(f"Idioma {language} no coincide con la voz {voice_name}. Usando {expected_lang}")
+            log.warning("tts.language_mismatch", detected=language, voice=voice_name, using=expected_lang)
             language = expected_lang
 
         text = re.sub(r'[^\w\s.,!?\'-]', '', text).replace('"', "'").strip()
         if not text:
-            app.logger.error("Texto vacío después de sanitizar")
+            log.warning("tts.empty_text")
             return jsonify({"error": "El texto está vacío después de sanitizar"}), 400
 
+        # Formato de salida: campo "format" o encabezado Accept (Opus, MP3 o WAV); forma parte de la clave de caché
+        try:
+            output_format = negotiate_tts_format(data.get('format'), request.headers.get('Accept'))
+        except ValueError as e:
+            log.warning("tts.invalid_format", format=data.get('format'))
+            return jsonify({"error": str(e)}), 400
+        audio_format = TTS_FORMATS[output_format]
+        download_name = f"response.{audio_format.extension}"
+        cache_key = tts_cache_key(voice_name, language, text, output_format)
+        cached_audio = tts_cache.get(cache_key)
+        if cached_audio is not None:
+            log.debug("tts.cache_hit", cache_key=cache_key[:12], format=output_format)
+            observe_tts_payload(output_format, len(cached_audio))
+            return audio_response(cached_audio, audio_format.mimetype, download_name, etag=cache_key, cache_status="HIT")
+
         ssml = f"""<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='{language}'><voice name='{voice_name}'>{text}</voice></speak>"""
         url = f"https://{AZURE_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
-        headers = {"Ocp-Apim-Subscription-Key": AZURE_SPEECH_KEY, "Content-Type": "application/ssml+xml", "X-Microsoft-OutputFormat": "riff-8khz-16bit-mono-pcm"}
-
-        response = http.post(url, headers=headers, data=ssml.encode('utf-8'))
+        headers = {"Ocp-Apim-Subscription-Key": AZURE_SPEECH_KEY, "Content-Type": "application/ssml+xml", "X-Microsoft-OutputFormat": audio_format.azure_format}
+
+        call, shared_audio = join_synthesis(cache_key)
+        if shared_audio is not None:
+            log.debug("tts.shared", cache_key=cache_key[:12])
+            return audio_response(shared_audio, audio_format.mimetype, download_name, etag=cache_key, cache_status="SHARED")
+
+        try:
+            with stage("tts"):
+                response = azure_tts_api.post(url, headers=headers, data=ssml.encode('utf-8'), stream=True)
+        except Exception as e:
+            if call:
+                tts_flight.finish(cache_key, call, error=e)
+            raise
         if response.status_code != 200:
             error_msg = f"Error al sintetizar audio: {response.status_code} - {response.text}"
-            app.logger.error(error_msg)
+            log.error("tts.upstream_error", status=response.status_code, response=response.text)
+            if call:
+                tts_flight.finish(cache_key, call, error=RuntimeError(error_msg))
             return jsonify({"error": error_msg}), 500
 
-        return send_file(io.BytesIO(response.content), mimetype="audio/wav", as_attachment=True, download_name="response.wav")
+        completed = {}
+
+        def on_complete(body):
+            completed["audio"] = wav_header(audio_format.sample_rate, len(body)) + body if audio_format.wav_stream else body
+            observe_tts_payload(output_format, len(completed["audio"]))
+            tts_cache.put(cache_key, completed["audio"])
+
+        def on_close():
+            if call:
+                tts_flight.finish(cache_key, call, result=completed.get("audio"))
+
+        return stream_audio_response(
+            response, audio_format.mimetype, download_name,
+            header=wav_header(audio_format.sample_rate) if audio_format.wav_stream else b"",
+            on_complete=on_complete,
+            on_close=on_close,
+            etag=cache_key
+        )
 
+    except (DeadlineExceeded, CircuitOpenError) as e:
+        log.error("tts.unavailable", error=e)
+        return jsonify({"error": f"Servicio de síntesis de voz no disponible temporalmente: {str(e)}"}), 503
     except Exception as e:
-        app.logger.error(f"Error al generar audio: {str(e)}\n{traceback.format_exc()}")
+        log.exception("tts.error", error=e)
         return jsonify({"error": f"Error al generar audio: {str(e)}"}), 500
 
+@main_routes.route('/log-config', methods=['GET', 'POST'])
+def log_config():
+    payload, status = log_config_request(request.method, request.get_json(silent=True), request.headers.get('X-Admin-Token'))
+    return jsonify(payload), status
+
+@main_routes.route('/metrics', methods=['GET'])
+def metrics():
+    return metrics_response()
+
+# HTML de la página de rutas de Wikiloc (lo llama el hilo del scraper, nunca una solicitud)
+def fetch_wikiloc():
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Linux; Android 10) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.120 Mobile Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.5"
+    }
+    log.debug("wikiloc.request", url=WIKILOC_URL)
+    response = wikiloc_api.get(WIKILOC_URL, headers=headers)
+    response.raise_for_status()
+    return response.text
+
+# Rutas de senderismo desde la caché del scraper, como en appv2: ni pausa ni scrape dentro de la solicitud
 @main_routes.route('/scrape-activities', methods=['GET'])
 def scrape_activities():
-    try:
-        app.logger.debug(f"Aplicando retraso de {SCRAPE_DELAY} segundos")
-        time.sleep(SCRAPE_DELAY)
-
-        url = "https://www.wikiloc.com/trails/hiking/brazil/rio-de-janeiro/marica"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Linux; Android 10) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.120 Mobile Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5"
-        }
-        response = http.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-
-        trails = []
-        trail_elements = soup.select('a.trail__title')
-        if not trail_elements:
-            app.logger.debug("No se encontraron rutas. HTML (primeros 500 caracteres):")
-            app.logger.debug(response.text[:500])
-            return jsonify({"activities": "No encontré rutas de senderismo en Maricá. Intenta buscar manualmente en wikiloc.com."})
-
-        for trail in trail_elements[:3]:
-            title = trail.text.strip()
-            link = trail['href']
-            if not link.startswith('http'):
-                link = f"https://www.wikiloc.com{link}"
-            trails.append({"title": title, "link": link})
-            app.logger.debug(f"Ruta encontrada: {title} - {link}")
-
-        response_text = "Aquí tienes algunas rutas de senderismo en Maricá desde Wikiloc:\n" + "\n".join(f"- {t['title']}: {t['link']}" for t in trails)
-        return jsonify({"activities": response_text or "No encontré rutas de senderismo en Maricá. Intenta buscar manualmente en wikiloc.com."})
-
-    except Exception as e:
-        app.logger.error(f"Error al scrapear Wikiloc: {str(e)}\n{traceback.format_exc()}")
-        return jsonify({"activities": "Error al buscar rutas en Wikiloc. Intenta de nuevo más tarde."}), 500
\ No newline at end of file
+    snapshot = trail_cache.snapshot()
+    if snapshot["trails"]:
+        log.debug("activities.cache", trails=len(snapshot['trails']), updated_at=snapshot['updated_at'])
+        return jsonify({"activities": format_trails(snapshot["trails"]), **snapshot})
+    if snapshot["error"]:
+        log.error("activities.unavailable", error=snapshot['error'])
+        return jsonify({"activities": "Error al buscar rutas en Wikiloc. Intenta de nuevo más tarde.", **snapshot}), 500
+    log.debug("activities.empty")
+    return jsonify({"activities": "No encontré rutas de senderismo en Maricá. Intenta buscar manualmente en wikiloc.com.", **snapshot})
+
+# Scraper de Wikiloc en segundo plano (SCRAPE_DELAY es la pausa de cortesía entre ejecuciones);
+# create_app arranca el calentamiento (ver app/modules/startup.py)
+register_warmup("trail_scraper", lambda: start_trail_scraper(fetch_wikiloc, delay=float(os.getenv("SCRAPE_DELAY", 1.0))))
+register_warmup("html_parser", load_html_parser)
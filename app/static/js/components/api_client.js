@@ -1,6 +1,19 @@
+// Formatos de audio que el navegador puede reproducir, del más ligero al más pesado:
+// el servidor elige el mejor según el encabezado Accept de /speak
+function audioAccept() {
+    const probe = new Audio();
+    const types = [];
+    if (probe.canPlayType('audio/ogg; codecs=opus')) types.push('audio/ogg');
+    if (probe.canPlayType('audio/webm; codecs=opus')) types.push('audio/webm;q=0.95');
+    if (probe.canPlayType('audio/mpeg')) types.push('audio/mpeg;q=0.9');
+    types.push('audio/wav;q=0.5');
+    return types.join(', ');
+}
+
 export class ApiClient {
     constructor(currentLanguage) {
         this.currentLanguage = currentLanguage;
+        this.audioAccept = audioAccept();
     }
 
     async obtenerRespuestaIA(texto, lat, lon, voice) {
@@ -20,11 +33,42 @@ export class ApiClient {
         }
     }
 
+    // Variante en streaming de obtenerRespuestaIA: llama a onDelta con cada fragmento de texto
+    // según lo genera el modelo y devuelve el evento final { response, voice, lang, language_code, ... }
+    async obtenerRespuestaIAStream(texto, lat, lon, voice, onDelta) {
+        const response = await fetch('/ask-ai-stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+            body: JSON.stringify({ text: texto, lat, lon, voice })
+        });
+        if (!response.ok) throw new Error('Error al obtener respuesta de IA: ' + response.statusText);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let separator;
+            while ((separator = buffer.indexOf('\n\n')) >= 0) {
+                const block = buffer.slice(0, separator);
+                buffer = buffer.slice(separator + 2);
+                const event = (block.match(/^event: (.*)$/m) || [])[1];
+                const data = JSON.parse((block.match(/^data: (.*)$/m) || [])[1] || '{}');
+                if (event === 'delta') onDelta(data.text);
+                else if (event === 'done') return data;
+                else if (event === 'error') throw new Error(data.error);
+            }
+        }
+        throw new Error('La respuesta en streaming terminó sin evento final');
+    }
+
     async generarAudio(texto, voice) {
         try {
             const response = await fetch('/speak', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', 'Accept': this.audioAccept },
                 body: JSON.stringify({ text: texto, voice })
             });
             if (!response.ok) throw new Error('Error al generar audio: ' + response.statusText);
@@ -34,4 +78,30 @@ export class ApiClient {
             throw error;
         }
     }
-}
\ No newline at end of file
+
+    // Un turno completo en una sola solicitud: envía el audio grabado y recibe
+    // la transcripción, la respuesta, los tiempos por etapa y el audio sintetizado
+    async conversar(audioBlob, lat, lon, voice) {
+        try {
+            const formData = new FormData();
+            formData.append('audio', audioBlob, 'recording.webm');
+            if (voice) formData.append('voice', voice);
+            if (lat != null && lon != null) {
+                formData.append('lat', lat);
+                formData.append('lon', lon);
+            }
+            const response = await fetch('/converse', { method: 'POST', body: formData });
+            const contentType = response.headers.get('Content-Type') || '';
+            if (contentType.startsWith('application/json')) {
+                const data = await response.json();
+                if (!response.ok || data.error) throw new Error(data.error || response.statusText);
+                return { meta: data, audio: null };
+            }
+            const parts = await response.formData();
+            return { meta: JSON.parse(parts.get('meta')), audio: parts.get('audio') };
+        } catch (error) {
+            console.error('Error en la conversación:', error);
+            throw error;
+        }
+    }
+}
@@ -1,9 +1,11 @@
 export class TranscriptionService {
-    async transcribe(audioBlob) {
+    // context: texto del turno anterior (opcional); el servidor identifica su idioma para Speech-to-Text
+    async transcribe(audioBlob, context = null) {
         try {
             console.log('Enviando audioBlob al endpoint /transcribe:', audioBlob);
             const formData = new FormData();
             formData.append('audio', audioBlob, 'recording.webm'); // Asegurar nombre de archivo y tipo MIME
+            if (context) formData.append('context', context);
 
             const response = await fetch('https://192.168.1.108:8080/transcribe', {
                 method: 'POST',
@@ -27,4 +29,42 @@ export class TranscriptionService {
             throw error;
         }
     }
-}
\ No newline at end of file
+
+    // Envía el audio mientras se graba (ReadableStream de fragmentos WebM/Opus) a /transcribe-stream
+    // y llama a onResult con cada resultado parcial o final ({ text, final, stability, language })
+    async transcribeStream(audioStream, onResult, language = null) {
+        const params = new URLSearchParams({ encoding: 'webm_opus' });
+        if (language) params.set('language', language);
+
+        const response = await fetch(`/transcribe-stream?${params}`, {
+            method: 'POST',
+            body: audioStream,
+            duplex: 'half',
+            headers: { 'Content-Type': 'audio/webm' }
+        });
+        if (!response.ok) {
+            const errorText = await response.text();
+            throw new Error(`Error al transcribir audio: ${response.status} ${errorText}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finalText = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const result = JSON.parse(line);
+                if (result.error) throw new Error(result.error);
+                if (result.final) finalText += (finalText ? ' ' : '') + result.text;
+                onResult(result);
+            }
+        }
+        return finalText;
+    }
+}
@@ -1,5 +1,7 @@
 import os
 
+from app.modules.language_id import identify_language, LANGUAGE_ID_MIN_CONFIDENCE
+
 def read_secret(key_name):
     """
     Lee el valor de una clave desde variables de entorno o archivos físicos.
@@ -30,11 +32,13 @@ def read_secret(key_name):
 
 def detect_language_nlp(text):
     """
-    Detecta el idioma del texto usando NLP.
-    Esta es una implementación básica; ajusta según tus necesidades.
+    Detecta el idioma del texto con el identificador local de n-gramas (sin llamadas de red).
+    Devuelve None si la confianza es baja.
     """
-    # Ejemplo simple: siempre devuelve 'es' (español)
-    return 'es'
+    language, confidence = identify_language(text)
+    if confidence < LANGUAGE_ID_MIN_CONFIDENCE:
+        return None
+    return language
 
 def detect_language(text, voice_name):
     """
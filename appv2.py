@@ -1,39 +1,65 @@
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-import io
 import os
-import tempfile
+import json
 import requests
 import re
-import subprocess
 import time
+import uuid
 from dotenv import load_dotenv
-from pydub import AudioSegment
 import urllib.parse
-import pandas as pd
-import numpy as np
 from datetime import datetime
 import pytz
-from google.cloud import language_v1, speech
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from bs4 import BeautifulSoup
+from app.config import HTTP_POOL_MAXSIZE, OPENWEATHER_BASE_URL, NEWSAPI_BASE_URL, XAI_BASE_URL, AZURE_TTS_BASE_URL
+from app.modules.speech_synthesis import tts_cache, tts_cache_key, tts_flight, join_synthesis, audio_response, stream_audio_response, wav_header, negotiate_tts_format, TTS_FORMATS
+from app.modules.gazetteer import resolve_place, find_place_in_text
+from app.modules.recognition import recognition_config, load_profiles as load_recognition_profiles
+from app.modules.vad import trim_silence
+from app.modules.ai_query import classify, EMERGENCY_TYPES, answer_cache, answer_cache_key, is_cacheable, clean_answer, AnswerStreamCleaner
+from app.modules.language_id import identify_language, load_model as load_language_model, LANGUAGES, LANGUAGE_ID_MIN_CONFIDENCE
+from app.modules.weather import weather_cache, place_cache, snap_coordinates, start_weather_prefetcher
+from app.modules.news import news_cache, start_news_refresher
+from app.modules.activities import trail_cache, start_trail_scraper, format_trails, load_parser as load_html_parser, WIKILOC_URL
+from app.modules.resilience import CountingRetry, UpstreamClient, DeadlineExceeded, CircuitOpenError, get_breaker, breakers, start_deadline, upstream_timeout
+from app.modules.transcription import get_speech_client, decode_to_linear16, sniff_audio, can_passthrough, iter_audio_chunks, stream_transcripts, FFMPEG_TIMEOUT, LINEAR16_SAMPLE_RATE, SPEECH_EMULATOR_HOST
+from app.modules.metrics import instrument_app, metrics_response, stage, observe_stage, observe_stt_upload, observe_tts_payload
+from app.modules.event_log import setup_logging, get_event_logger, log_config_request
+from app.modules.startup import register_warmup, start_warmup
+
+# Logs estructurados (JSON) escritos por un hilo aparte; nivel y muestreo con LOG_LEVEL/LOG_SAMPLE_RATES o /log-config
+setup_logging()
+log = get_event_logger("appv2")
 
 app = Flask(__name__)
 CORS(app)
+instrument_app(app)
 
-# Configurar reintentos para solicitudes HTTP
-retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-adapter = HTTPAdapter(max_retries=retries)
+# Sesión HTTP compartida: solo se reintenta una conexión fallida (sin backoff); los tiempos
+# los controlan el presupuesto por solicitud y los circuit breakers de cada upstream
+retries = CountingRetry(total=1, connect=1, read=0, status=0, backoff_factor=0)
+adapter = HTTPAdapter(max_retries=retries, pool_connections=HTTP_POOL_MAXSIZE, pool_maxsize=HTTP_POOL_MAXSIZE)
 http = requests.Session()
 http.mount("https://", adapter)
+http.mount("http://", adapter)
+
+# Un cliente por upstream (timeout máximo, circuit breaker y cobertura opcional de GET en segundos; 0 = sin cobertura)
+openweather_api = UpstreamClient(http, "openweather", timeout=10, hedge_after=float(os.getenv("OPENWEATHER_HEDGE_AFTER", 0)))
+news_api = UpstreamClient(http, "newsapi", timeout=10)
+xai_api = UpstreamClient(http, "xai", timeout=20)
+azure_tts_api = UpstreamClient(http, "azure-tts", timeout=10)
+wikiloc_api = UpstreamClient(http, "wikiloc", timeout=10, hedge_after=float(os.getenv("WIKILOC_HEDGE_AFTER", 0)))
+speech_breaker = get_breaker("speech-to-text")
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", 20))
+# El streaming incluye lo que dura la grabación; igualmente lo limita el presupuesto de la solicitud
+STT_STREAM_TIMEOUT = float(os.getenv("STT_STREAM_TIMEOUT", 25))
 
 # Cargar .env
 try:
     load_dotenv(dotenv_path="/home/cris/voz_robotica/.env")
-    print("DEBUG: .env cargado desde /home/cris/voz_robotica/.env")
+    log.debug("startup.dotenv", path="/home/cris/voz_robotica/.env")
 except Exception as e:
-    print(f"DEBUG: Error al cargar .env: {e}")
+    log.warning("startup.dotenv_error", error=e)
 
 # Función para leer secretos desde archivos
 def read_secret(file_path):
@@ -41,7 +67,7 @@ def read_secret(file_path):
         with open(file_path, 'r') as f:
             return f.read().strip()
     except Exception as e:
-        print(f"ERROR: No se pudo leer el secreto en {file_path}: {e}")
+        log.warning("startup.secret_unreadable", path=file_path, error=e)
         return None
 
 # Carga las API Keys
@@ -56,120 +82,124 @@ ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 SCRAPE_DELAY = float(os.getenv("SCRAPE_DELAY", 1.0))  # Retraso configurable para scraping
 
 # Verifica las API Keys
-print(f"DEBUG: OPENWEATHER_API_KEY = {OPENWEATHER_API_KEY if OPENWEATHER_API_KEY else 'not set'}")
-print(f"DEBUG: SUPERGROK_API_KEY = {SUPERGROK_API_KEY[:5] if SUPERGROK_API_KEY else 'not set'}...")
-print(f"DEBUG: AZURE_SPEECH_KEY = {'set' if AZURE_SPEECH_KEY else 'not set'}")
-print(f"DEBUG: NEWS_API_KEY = {'set' if NEWS_API_KEY else 'not set'}")
-print(f"DEBUG: GOOGLE_APPLICATION_CREDENTIALS = {'set' if GOOGLE_APPLICATION_CREDENTIALS else 'not set'}")
-print(f"DEBUG: DEEPSEEK_API_KEY = {'set' if DEEPSEEK_API_KEY else 'not set'}")
-print(f"DEBUG: ELEVENLABS_API_KEY = {'set' if ELEVENLABS_API_KEY else 'not set'}")
-print(f"DEBUG: SCRAPE_DELAY = {SCRAPE_DELAY} seconds")
+log.info(
+    "startup.config",
+    openweather_api_key=bool(OPENWEATHER_API_KEY),
+    supergrok_api_key=bool(SUPERGROK_API_KEY),
+    azure_speech_key=bool(AZURE_SPEECH_KEY),
+    news_api_key=bool(NEWS_API_KEY),
+    google_application_credentials=bool(GOOGLE_APPLICATION_CREDENTIALS),
+    deepseek_api_key=bool(DEEPSEEK_API_KEY),
+    elevenlabs_api_key=bool(ELEVENLABS_API_KEY),
+    scrape_delay=SCRAPE_DELAY
+)
 
 # Verificar GOOGLE_APPLICATION_CREDENTIALS
-if not os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
-    print(f"ERROR: Archivo de credenciales de Google no encontrado en {GOOGLE_APPLICATION_CREDENTIALS}")
-
-# Inicializar cliente de Google Cloud Natural Language
-try:
-    nlp_client = language_v1.LanguageServiceClient.from_service_account_json(GOOGLE_APPLICATION_CREDENTIALS)
-    print("DEBUG: Cliente de Google Cloud Natural Language inicializado")
-except Exception as e:
-    print(f"ERROR: No se pudo inicializar el cliente de NLP: {e}")
-    nlp_client = None
-
-# Función para detectar idioma con Google Cloud Natural Language
-def detect_language_nlp(text):
-    if not nlp_client:
-        print("DEBUG: Cliente NLP no disponible, usando detección por palabras clave")
-        return None
-    try:
-        document = language_v1.Document(content=text, type_=language_v1.Document.Type.PLAIN_TEXT)
-        response = nlp_client.analyze_sentiment(document=document)
-        language = response.language
-        confidence = response.document_sentiment.score
-        print(f"DEBUG: Idioma detectado por NLP: {language}, confianza: {confidence}")
-        return language
-    except Exception as e:
-        print(f"ERROR: No se pudo detectar idioma con NLP: {e}")
+if not SPEECH_EMULATOR_HOST and not os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
+    log.error("startup.google_credentials_missing", path=GOOGLE_APPLICATION_CREDENTIALS)
+
+# Función para detectar idioma localmente (modelo de n-gramas, sin llamadas de red)
+def detect_language_local(text):
+    language, confidence = identify_language(text)
+    log.debug("language.local", language=language, confidence=confidence)
+    if confidence < LANGUAGE_ID_MIN_CONFIDENCE:
         return None
+    return language
 
 # Función para detectar preguntas relacionadas con noticias
-def is_news_related(query):
-    news_keywords = [
-        "actual", "noticias", "news", "papa", "pope", "pontífice", "presidente",
-        "gobierno", "elección", "evento", "crisis", "conflicto", "falleció",
-        "muerte", "nuevo", "reciente", "hoy", "ayer", "emergência", "segurança",
-        "saúde", "inundação", "incêndio", "festas", "museus", "cultura",
-        "permacultura", "meditação", "yoga", "culto", "ayahuasca", "creyentes",
-        "trilhas", "motos", "crente", "caiçara",
-    ]
-    climate_keywords = ["clima", "tempo", "playas", "playa", "bañar", "baño"]
-    activity_keywords = ["trilhas", "senderismo", "caminata", "hiking", "eventos", "festas"]
-
-    if any(keyword in query.lower() for keyword in climate_keywords):
-        return False
-
-    if any(keyword in query.lower() for keyword in activity_keywords):
-        print("DEBUG: Consulta detectada como relacionada con actividades, scrapeando Wikiloc")
-        response = scrape_activities()
-        return response.get_json().get("activities", "No encontré actividades disponibles.")
+def is_news_related(query, intents=None):
+    if intents is None:
+        with stage("intent_routing"):
+            intents = classify(query)
 
-    return any(keyword in query.lower() for keyword in news_keywords)
+    if "climate" in intents or "beach" in intents:
+        return False
 
-# Función para consultar NewsAPI con enfoque en Río de Janeiro o eventos
-def query_newsapi(query):
+    return "news" in intents
+
+# Perfiles de búsqueda en NewsAPI: casi todas las consultas usan uno de estos
+NEWS_PROFILES = {
+    "regional": (
+        "Maricá OR Saquarema OR Niterói OR Araruama OR Búzios OR Itaboraí OR Magé OR "
+        "Petrópolis OR Teresópolis OR Rio de Janeiro OR Cabo Frio OR Arraial do Cabo OR "
+        "São Pedro da Aldeia OR São José do Vale do Rio Preto OR Barra Mansa OR Nova Friburgo OR "
+        "Visconde de Mauá OR Resende OR Penedo OR Parque Nacional de Itatiaia OR Espraiado OR "
+        "Ponta Negra OR Serra da Tiririca OR Barra de Sana OR fluminense OR buziano OR "
+        "eventos OR festas OR museus OR cultura OR permacultura OR meditação OR yoga OR culto OR "
+        "ayahuasca OR creyentes OR trilhas OR motos OR Rock in Rio OR Copacabana OR reggae"
+    ),
+    "pope": "Papa OR Vatican OR Pope",
+    "beaches": "playas Maricá OR condiciones banho Maricá",
+}
+# Variante poco frecuente: se consulta solo cuando alguien la pide (no se precarga)
+NEWS_ON_DEMAND_PROFILES = {
+    "pope_death": "Papa OR Vatican OR Pope OR morte OR death",
+}
+
+def fetch_news(keywords):
+    encoded_keywords = urllib.parse.quote(keywords)
+    url = f"{NEWSAPI_BASE_URL}/v2/everything?q={encoded_keywords}&sortBy=publishedAt&apiKey={NEWS_API_KEY}"
+    log.debug("newsapi.request", keywords=keywords)
+    response = news_api.get(url, timeout=10)
+    response.raise_for_status()
+    return response.json().get("articles", [])
+
+# Función para consultar noticias (desde la caché de NewsAPI) con enfoque en Río de Janeiro o eventos.
+# Devuelve (texto, frescura); frescura es None si no se consultó la caché
+def query_newsapi(query, intents=None):
     try:
         if not NEWS_API_KEY:
-            print("ERROR: NEWS_API_KEY no está configurada")
-            return None
-
-        keywords = (
-            "Maricá OR Saquarema OR Niterói OR Araruama OR Búzios OR Itaboraí OR Magé OR "
-            "Petrópolis OR Teresópolis OR Rio de Janeiro OR Cabo Frio OR Arraial do Cabo OR "
-            "São Pedro da Aldeia OR São José do Vale do Rio Preto OR Barra Mansa OR Nova Friburgo OR "
-            "Visconde de Mauá OR Resende OR Penedo OR Parque Nacional de Itatiaia OR Espraiado OR "
-            "Ponta Negra OR Serra da Tiririca OR Barra de Sana OR fluminense OR buziano OR "
-            "eventos OR festas OR museus OR cultura OR permacultura OR meditação OR yoga OR culto OR "
-            "ayahuasca OR creyentes OR trilhas OR motos OR Rock in Rio OR Copacabana OR reggae"
-        )
-        if "papa" in query.lower() or "pope" in query.lower() or "pontífice" in query.lower():
-            keywords = "Papa OR Vatican OR Pope"
-            if "actual" in query.lower() or "current" in query.lower():
-                return "O Papa atual é León XIV, eleito em 8 de maio de 2025. Robert Prevost é americano e peruano. Verifica em www.vatican.va para informações oficiales."
-            if "falleció" in query.lower() or "died" in query.lower():
-                keywords += " OR morte OR death"
-        elif "playas" in query.lower() or "playa" in query.lower() or "bañar" in query.lower():
-            keywords = "playas Maricá OR condiciones banho Maricá"
-
-        encoded_keywords = urllib.parse.quote(keywords)
-        url = f"https://newsapi.org/v2/everything?q={encoded_keywords}&sortBy=publishedAt&apiKey={NEWS_API_KEY}"
-        print(f"DEBUG: Enviando solicitud a NewsAPI: {url}")
-        response = http.get(url, timeout=10)
-        response.raise_for_status()
-        articles = response.json().get("articles", [])
-        
+            log.error("newsapi.missing_key")
+            return None, None
+
+        profile = "regional"
+        if intents is None:
+            with stage("intent_routing"):
+                intents = classify(query)
+        if "pope" in intents:
+            profile = "pope"
+            if "current" in intents:
+                return "O Papa atual é León XIV, eleito em 8 de maio de 2025. Robert Prevost é americano e peruano. Verifica em www.vatican.va para informações oficiales.", None
+            if "death" in intents:
+                profile = "pope_death"
+        elif "beach" in intents:
+            profile = "beaches"
+
+        keywords = NEWS_PROFILES.get(profile) or NEWS_ON_DEMAND_PROFILES[profile]
+        with stage("news"):
+            articles, freshness = news_cache.get(profile, keywords, fetch_news)
+        log.debug("news.cache", profile=profile, articles=len(articles), age_seconds=freshness['age_seconds'])
+
         if not articles:
-            print("DEBUG: No se encontraron artículos en NewsAPI")
-            return "Não encontrei notícias recentes sobre este tema. Verifica em fontes confiáveis como www.g1.globo.com ou www.marica.rj.gov.br."
+            log.debug("news.empty", profile=profile)
+            return "Não encontrei notícias recentes sobre este tema. Verifica em fontes confiáveis como www.g1.globo.com ou www.marica.rj.gov.br.", freshness
 
         latest_article = articles[0]
         title = latest_article.get("title", "")
         published_at = latest_article.get("publishedAt", "")
         source = latest_article.get("source", {}).get("name", "desconocida")
-        print(f"DEBUG: Artículo encontrado: {title} ({published_at})")
-        
-        return f"Segundo notícias recentes de {source} ({published_at}), {title}. Verifica em www.g1.globo.com ou www.marica.rj.gov.br para mais informações."
+        log.debug("news.article", title=title, published_at=published_at, source=source)
+
+        return f"Segundo notícias recentes de {source} ({published_at}), {title}. Verifica em www.g1.globo.com ou www.marica.rj.gov.br para mais informações.", freshness
 
     except requests.exceptions.HTTPError as http_err:
-        print(f"ERROR: Error HTTP al consultar NewsAPI: {str(http_err)}")
-        return "Ocurrió un error al consultar notícias recientes. Verifica em www.g1.globo.com ou www.marica.rj.gov.br."
+        log.error("newsapi.http_error", error=http_err)
+        return "Ocurrió un error al consultar notícias recientes. Verifica em www.g1.globo.com ou www.marica.rj.gov.br.", None
     except Exception as e:
-        print(f"ERROR: Error al consultar NewsAPI: {str(e)}")
-        return "Ocurrió un error al consultar notícias recientes. Verifica em www.g1.globo.com ou www.marica.rj.gov.br."
+        log.error("newsapi.error", error=e)
+        return "Ocurrió un error al consultar notícias recientes. Verifica em www.g1.globo.com ou www.marica.rj.gov.br.", None
+
+# Presupuesto de tiempo de la solicitud: todas las llamadas a upstreams salen de él
+@app.before_request
+def start_request_deadline():
+    start_deadline()
 
-# Desactivar caché
+# Desactivar caché (las respuestas con ETag, como el audio de /speak, se pueden revalidar)
 @app.after_request
 def add_header(response):
+    if response.headers.get('ETag'):
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '-1'
@@ -178,10 +208,10 @@ def add_header(response):
 @app.route('/')
 def home():
     try:
-        print("DEBUG: Renderizando index-v2.html")
+        log.debug("home.render", template="index-v2.html")
         return render_template('index-v2.html')
     except Exception as e:
-        print(f"ERROR: Error al renderizar index-v2.html: {str(e)}")
+        log.error("home.render_error", error=e)
         return jsonify({"error": "Error interno del servidor"}), 500
 
 @app.route('/favicon.ico')
@@ -192,127 +222,181 @@ def favicon():
 def test():
     return jsonify({"message": "El servidor está funcionando correctamente"})
 
-@app.route('/transcribe', methods=['POST'])
-def transcribe_audio():
-    try:
-        print("DEBUG: Verificando ffmpeg")
-        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
-        print(f"DEBUG: FFmpeg version: {ffmpeg_version[:50]}...")
+# Idioma para Speech-to-Text: el que indica el cliente ("language") o el identificado
+# en el texto del turno anterior ("context"); el audio en sí no se puede analizar como texto
+def stt_language_hint(params):
+    language = params.get('language')
+    if language in LANGUAGES:
+        return language
+    context = params.get('context')
+    if context:
+        return detect_language_local(context)
+    return None
 
+# Transcribe el audio subido; devuelve (payload, status) para /transcribe y /converse
+def transcribe_upload(audio_file, language=None):
+    try:
         google_credentials_path = GOOGLE_APPLICATION_CREDENTIALS
-        print(f"DEBUG: Ruta de credenciales de Google Cloud: {google_credentials_path}")
-        if not os.path.exists(google_credentials_path):
+        if not SPEECH_EMULATOR_HOST and not os.path.exists(google_credentials_path):
             raise ValueError(f"Archivo de credenciales no encontrado en {google_credentials_path}")
 
-        speech_client = speech.SpeechClient.from_service_account_json(google_credentials_path)
-        print("DEBUG: Cliente de Speech-to-Text inicializado")
+        speech_client = get_speech_client(google_credentials_path)
 
-        if 'audio' not in request.files:
-            print("ERROR: No se proporcionó un archivo de audio")
-            return jsonify({"error": "No se proporcionó un archivo de audio"}), 400
+        if audio_file is None:
+            log.warning("transcribe.no_audio")
+            return {"error": "No se proporcionó un archivo de audio"}, 400
 
-        audio_file = request.files['audio']
         if not audio_file.filename:
-            print("ERROR: El archivo de audio está vacío o sin nombre")
-            return jsonify({"error": "El archivo de audio está vacío o sin nombre"}), 400
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_audio:
-            audio_file.save(temp_audio.name)
-            file_size = os.path.getsize(temp_audio.name)
-            print(f"DEBUG: Tamaño del archivo de audio: {file_size} bytes")
-            if file_size == 0:
-                raise ValueError("El archivo de audio está vacío")
-
-            try:
-                audio = AudioSegment.from_file(temp_audio.name, format="webm")
-                audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
-                print(f"DEBUG: Audio procesado con pydub, duración (ms): {len(audio)}")
-            except Exception as e:
-                print(f"ERROR: Error al procesar audio con pydub: {str(e)}")
-                raise ValueError(f"Error al procesar audio con pydub: {str(e)}")
-
-            temp_wav = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-            audio.export(temp_wav.name, format="wav", parameters=["-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1"])
-            wav_size = os.path.getsize(temp_wav.name)
-            print(f"DEBUG: Tamaño del archivo WAV: {wav_size} bytes")
-            if wav_size < 100:
-                raise ValueError(f"El archivo de audio es demasiado pequeño: {wav_size} bytes")
-
-            with open(temp_wav.name, "rb") as audio_file:
-                content = audio_file.read()
-            if not content:
-                raise ValueError("El contenido del archivo de audio está vacío")
-
-            # Detectar idioma del audio
-            detected_language = detect_language_nlp(content.decode('utf-8', errors='ignore'))
-            language_code = "pt-BR"
-            alternative_codes = ["es-AR", "en-US", "fr-FR"]
-            if detected_language == "it":
-                language_code = "it-IT"
-                alternative_codes = ["pt-BR", "es-AR", "en-US", "fr-FR"]
-            elif detected_language in ["es", "en", "fr"]:
-                language_code = {"es": "es-AR", "en": "en-US", "fr": "fr-FR"}[detected_language]
-                alternative_codes = ["pt-BR"] + [code for code in ["es-AR", "en-US", "fr-FR"] if code != language_code]
-
-            audio = speech.RecognitionAudio(content=content)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=16000,
-                language_code=language_code,
-                alternative_language_codes=alternative_codes,
-                enable_automatic_punctuation=True,
-                model="latest_short",
-                enable_word_time_offsets=True,
-                speech_contexts=[speech.SpeechContext(phrases=[
-                    "hablando en portugués", "Niterói", "Río de Janeiro",
-                    "olá", "como estás", "falar", "português", "brasileiro",
-                    "Maricá", "Saquarema", "Araruama", "Cabo Frio",
-                    "Grimsby", "Grimsby Inglaterra", "Grimsby UK",
-                    "Buenos Aires", "Petrópolis", "Londres", "Tokio",
-                    "Itaboraí", "Magé", "Teresópolis", "Arraial do Cabo",
-                    "São Pedro da Aldeia", "São José do Vale do Rio Preto",
-                    "Barra Mansa", "Nova Friburgo", "Visconde de Mauá",
-                    "Resende", "Penedo", "Parque Nacional de Itatiaia",
-                    "Parque Natural Municipal Morada dos Corrêas",
-                    "Espraiado", "Ponta Negra", "Serra da Tiririca",
-                    "Barra de Sana", "Pedra de Inoã", "fluminense", "buziano",
-                    "Yara", "Jenny", "Dania", "Denise", "Isabella",
-                    "Reserva Natural de Massambaba - Saquarema", "Pedra do Macaco",
-                    "Trilha da Pedra do Macaco", "Cachoeira do Segredo em Silvado",
-                    "Tribo Nawa Ayahuasca Maricá"
-                ])]
-            )
+            log.warning("transcribe.unnamed_audio")
+            return {"error": "El archivo de audio está vacío o sin nombre"}, 400
+
+        uploaded = audio_file.read()
+        log.debug("transcribe.upload", bytes=len(uploaded))
+        if not uploaded:
+            raise ValueError("El archivo de audio está vacío")
+
+        # Opus (WebM/OGG) y FLAC mono van a Speech-to-Text tal cual; el resto se decodifica a LINEAR16 y pasa por el VAD
+        sniffed = sniff_audio(uploaded)
+        if can_passthrough(sniffed):
+            content, duration_ms = uploaded, sniffed.duration_ms
+            encoding, sample_rate = sniffed.encoding, sniffed.sample_rate
+            log.debug("transcribe.passthrough", container=sniffed.container, encoding=encoding, duration_ms=duration_ms)
+            observe_stt_upload(sniffed.container, "passthrough", len(content))
+        else:
+            with stage("audio_decode"):
+                content, duration_ms = decode_to_linear16(uploaded, timeout=upstream_timeout(FFMPEG_TIMEOUT))
+            log.debug("transcribe.decoded", container=sniffed.container, duration_ms=duration_ms, bytes=len(content))
+            if len(content) < 100:
+                raise ValueError(f"El archivo de audio es demasiado pequeño: {len(content)} bytes")
+
+            # Sin silencios ni pausas largas se sube y se reconoce menos audio; sin voz no se llama a STT
+            with stage("vad"):
+                voice = trim_silence(content)
+            log.debug("vad.result", input_ms=voice.input_ms, output_ms=voice.output_ms, speech_ms=voice.speech_ms)
+            if not voice.pcm:
+                log.warning("vad.no_speech", input_ms=voice.input_ms)
+                return {"error": "No se detectó voz clara, intenta de nuevo"}, 400
+            content, duration_ms = voice.pcm, voice.output_ms
+            encoding, sample_rate = "LINEAR16", LINEAR16_SAMPLE_RATE
+            observe_stt_upload(sniffed.container, "transcode", len(content))
+
+        from google.cloud import speech
+        audio = speech.RecognitionAudio(content=content)
+        config = recognition_config(language, duration_ms, encoding, sample_rate)
+        log.debug("stt.profile", language_code=config.language_code, model=config.model)
+
+        with stage("stt"):
+            response = speech_breaker.call(lambda: speech_client.recognize(config=config, audio=audio, timeout=upstream_timeout(STT_TIMEOUT)))
+        log.debug("stt.response", results=len(response.results), response=response)
+        if not response.results:
+            log.warning("stt.no_results")
+            return {"error": "No se detectó voz clara, intenta de nuevo"}, 400
+        transcription = response.results[0].alternatives[0].transcript
+        if not transcription.strip():
+            log.warning("stt.empty_transcript")
+            return {"error": "No se detectó voz clara, intenta de nuevo"}, 400
+        log.debug("stt.transcript", text=transcription)
+        return {"text": transcription}, 200
+
+    except (DeadlineExceeded, CircuitOpenError) as e:
+        log.error("stt.unavailable", error=e)
+        return {"error": f"Servicio de Speech-to-Text no disponible temporalmente: {str(e)}"}, 503
+    except ImportError as e:
+        log.error("stt.import_error", error=e)
+        return {"error": f"Servicio de Speech-to-Text no disponible: {str(e)}"}, 500
+    except Exception as e:
+        log.error("transcribe.error", error=e)
+        return {"error": f"Error al procesar audio: {str(e)}"}, 500
 
-            print(f"DEBUG: Enviando audio a Speech-to-Text: {len(content)} bytes")
-            response = speech_client.recognize(config=config, audio=audio)
-            print(f"DEBUG: Respuesta de Speech-to-Text: {response}")
-            if not response.results:
-                print("ERROR: No hay resultados en la transcripción")
-                return jsonify({"error": "No se detectó voz clara, intenta de nuevo"}), 400
-            transcription = response.results[0].alternatives[0].transcript
-            if not transcription.strip():
-                print("ERROR: Transcripción vacía, no se detectó voz clara")
-                return jsonify({"error": "No se detectó voz clara, intenta de nuevo"}), 400
-            print(f"DEBUG: Transcripción obtenida: {transcription}")
-            os.unlink(temp_audio.name)
-            os.unlink(temp_wav.name)
-            return jsonify({"text": transcription})
+@app.route('/transcribe', methods=['POST'])
+def transcribe_audio():
+    payload, status = transcribe_upload(request.files.get('audio'), stt_language_hint(request.form))
+    return jsonify(payload), status
 
-    except ImportError as e:
-        print(f"ERROR: Error al importar google.cloud.speech: {str(e)}")
-        return jsonify({"error": f"Servicio de Speech-to-Text no disponible: {str(e)}"}), 500
+# Transcripción en streaming: el cliente envía el audio por partes (chunked) mientras graba
+# y recibe líneas NDJSON con resultados parciales y finales a medida que llegan de Speech-to-Text
+@app.route('/transcribe-stream', methods=['POST'])
+def transcribe_stream():
+    try:
+        google_credentials_path = GOOGLE_APPLICATION_CREDENTIALS
+        if not SPEECH_EMULATOR_HOST and not os.path.exists(google_credentials_path):
+            raise ValueError(f"Archivo de credenciales no encontrado en {google_credentials_path}")
+        speech_client = get_speech_client(google_credentials_path)
+
+        language = stt_language_hint(request.args)
+        encoding = request.args.get('encoding', 'webm_opus').lower()
+        if encoding == 'linear16':
+            config = recognition_config(language, encoding="LINEAR16", sample_rate_hertz=int(request.args.get('rate', 16000)))
+        elif encoding == 'webm_opus':
+            # MediaRecorder del navegador graba WebM/Opus a 48 kHz
+            config = recognition_config(language, encoding="WEBM_OPUS", sample_rate_hertz=48000)
+        else:
+            log.warning("transcribe_stream.unsupported_encoding", encoding=encoding)
+            return jsonify({"error": f"Codificación no soportada: {encoding}. Opciones: webm_opus, linear16"}), 400
+        log.debug("transcribe_stream.start", encoding=encoding, language=language)
     except Exception as e:
-        print(f"ERROR: Error al procesar audio: {str(e)}")
-        if 'temp_audio' in locals():
-            os.unlink(temp_audio.name)
-        if 'temp_wav' in locals():
-            os.unlink(temp_wav.name)
+        log.error("transcribe_stream.start_error", error=e)
         return jsonify({"error": f"Error al procesar audio: {str(e)}"}), 500
 
-@app.route('/weather', methods=['POST'])
-def get_weather():
+    def generate():
+        try:
+            timeout = upstream_timeout(STT_STREAM_TIMEOUT)
+            for result in stream_transcripts(speech_client, config, iter_audio_chunks(request.stream), timeout=timeout):
+                if result["final"]:
+                    log.debug("transcribe_stream.final", text=result['text'])
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            log.error("transcribe_stream.error", error=e)
+            yield json.dumps({"error": f"Error al procesar audio: {str(e)}"}, ensure_ascii=False) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Geocodificación directa: primero el nomenclátor local; OpenWeatherMap solo para nombres desconocidos
+# (memorizado: los lugares no se mueven)
+def geocode_city(city):
+    place = resolve_place(city)
+    if place:
+        return [{'name': place.name, 'lat': place.lat, 'lon': place.lon, 'country': place.country}]
+
+    def fetch():
+        geocode_url = f"{OPENWEATHER_BASE_URL}/geo/1.0/direct?q={urllib.parse.quote(city)}&limit=1&appid={OPENWEATHER_API_KEY}"
+        log.debug("geocode.request", city=city)
+        response = openweather_api.get(geocode_url, timeout=5)
+        response.encoding = 'utf-8'
+        response.raise_for_status()
+        return response.json()
+    with stage("geocode"):
+        return place_cache.get_or_fetch(('direct', city.lower()), fetch)
+
+# Geocodificación inversa, memorizada por celda de la rejilla de clima
+def reverse_geocode(lat, lon):
+    cell = snap_coordinates(lat, lon)
+    def fetch():
+        geocode_url = f"{OPENWEATHER_BASE_URL}/geo/1.0/reverse?lat={lat}&lon={lon}&limit=1&appid={OPENWEATHER_API_KEY}"
+        log.debug("geocode.reverse_request", lat=lat, lon=lon)
+        response = openweather_api.get(geocode_url, timeout=5)
+        response.encoding = 'utf-8'
+        response.raise_for_status()
+        return response.json()
+    with stage("geocode"):
+        return place_cache.get_or_fetch(('reverse',) + cell, fetch)
+
+# One Call 3.0 para el centro de una celda (lo llama la caché de clima)
+def fetch_onecall(lat, lon):
+    url = f"{OPENWEATHER_BASE_URL}/data/3.0/onecall?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric&lang=pt_br"
+    log.debug("weather.request", lat=lat, lon=lon)
+    response = openweather_api.get(url, timeout=10)
+    response.encoding = 'utf-8'
+    log.debug("weather.response", status=response.status_code)
+    response.raise_for_status()
+    return response.json()
+
+# Consulta el clima para los datos recibidos (ciudad o coordenadas) y devuelve el payload de /weather
+def weather_report(data):
+    city_name = None
     try:
-        data = request.json
         city = data.get('city')
         lat = data.get('lat', -22.91889)  # Maricá por defecto
         lon = data.get('lon', -42.81889)
@@ -320,17 +404,11 @@ def get_weather():
         user_lat = data.get('user_lat')  # Geolocalización del usuario
         user_lon = data.get('user_lon')
 
-        print(f"DEBUG: Coordenadas recibidas en /weather: lat={lat}, lon={lon}, city={city}, text={text}, user_lat={user_lat}, user_lon={user_lon}")
+        log.debug("weather.query", lat=lat, lon=lon, city=city, text=text, user_lat=user_lat, user_lon=user_lon)
 
         if city:
-            geocode_url = f"http://api.openweathermap.org/geo/1.0/direct?q={urllib.parse.quote(city)}&limit=1&appid={OPENWEATHER_API_KEY}"
-            print(f"DEBUG: Enviando solicitud de geocodificación: {geocode_url}")
-            geocode_response = http.get(geocode_url)
-            geocode_response.encoding = 'utf-8'
-            print(f"DEBUG: Respuesta de geocodificación: {geocode_response.status_code}, {geocode_response.text[:100]}")
-            geocode_response.raise_for_status()
-            geocode_data = geocode_response.json()
-            print(f"DEBUG: Datos de geocodificación: {geocode_data}")
+            geocode_data = geocode_city(city)
+            log.debug("geocode.result", city=city, result=geocode_data)
             if not geocode_data:
                 city_name = "Maricá"
                 lat = -22.91889
@@ -340,24 +418,13 @@ def get_weather():
                 lon = geocode_data[0]['lon']
                 city_name = geocode_data[0]['name']
         else:
-            geocode_url = f"http://api.openweathermap.org/geo/1.0/reverse?lat={lat}&lon={lon}&limit=1&appid={OPENWEATHER_API_KEY}"
-            print(f"DEBUG: Enviando solicitud de geocodificación inversa: {geocode_url}")
-            geocode_response = http.get(geocode_url)
-            geocode_response.encoding = 'utf-8'
-            print(f"DEBUG: Respuesta de geocodificación inversa: {geocode_response.status_code}, {geocode_response.text[:100]}")
-            geocode_response.raise_for_status()
-            geocode_data = geocode_response.json()
+            geocode_data = reverse_geocode(lat, lon)
             city_name = geocode_data[0]['name'] if geocode_data else "Maricá"
 
-        print(f"DEBUG: Ciudad procesada en /weather: {city_name}")
+        log.debug("weather.city", city=city_name)
 
-        url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric&lang=pt_br"
-        print(f"DEBUG: Enviando solicitud de clima: {url}")
-        response = http.get(url)
-        response.encoding = 'utf-8'
-        print(f"DEBUG: Respuesta de clima: {response.status_code}, {response.text[:100]}")
-        response.raise_for_status()
-        weather_data = response.json()
+        with stage("weather"):
+            weather_data = weather_cache.get(lat, lon, fetch_onecall)
 
         current_weather = weather_data['current']
         temperature = current_weather['temp']
@@ -373,7 +440,7 @@ def get_weather():
             f"e a velocidade do vento é de {wind_speed} m/s."
         )
         bathing_conditions = ""
-        if text and ("playas" in text.lower() or "playa" in text.lower() or "bañar" in text.lower()):
+        if text and "beach" in classify(text):
             if temperature > 20 and rain == 0 and "chuva" not in description.lower():
                 bathing_conditions = " As condições são boas para se banhar nas praias hoje."
             else:
@@ -384,62 +451,56 @@ def get_weather():
         if user_lat and user_lon:
             map_url += f"&center={user_lat},{user_lon}"  # Corregido el parámetro
 
-        return jsonify({
+        return {
             "weather": weather_response + bathing_conditions,
             "map_url": map_url
-        })
+        }
 
     except requests.exceptions.HTTPError as http_err:
-        print(f"ERROR: Error HTTP al obtener el clima: {str(http_err)}")
-        return jsonify({"weather": f"Error al obtener el clima para {city_name or 'la ubicación'}: {str(http_err)}. Intenta con otra ciudad."})
+        log.error("weather.http_error", error=http_err)
+        return {"weather": f"Error al obtener el clima para {city_name or 'la ubicación'}: {str(http_err)}. Intenta con otra ciudad."}
     except Exception as e:
-        print(f"ERROR: Error al obtener el clima: {str(e)}")
-        return jsonify({"weather": f"Error al obtener el clima: {str(e)}. Intenta con otra ciudad."})
+        log.error("weather.error", error=e)
+        return {"weather": f"Error al obtener el clima: {str(e)}. Intenta con otra ciudad."}
+
+@app.route('/weather', methods=['POST'])
+def get_weather():
+    return jsonify(weather_report(request.json))
 
 def extract_city(text):
-    print(f"DEBUG: Intentando extraer ciudad de: {text}")
-    cities = [
-        "Maricá", "Saquarema", "Niterói", "Araruama", "Búzios", "Itaboraí", "Magé",
-        "Petrópolis", "Teresópolis", "Rio de Janeiro", "Cabo Frio", "Arraial do Cabo",
-        "São Pedro da Aldeia", "São José do Vale do Rio Preto", "Barra Mansa",
-        "Nova Friburgo", "Visconde de Mauá", "Resende", "Penedo", "Parque Nacional de Itatiaia",
-        "Espraiado", "Ponta Negra", "Serra da Tiririca", "Barra de Sana", "Pedra de Inoã",
-        "fluminense", "buziano", "maricaense", "niteroiense", "saquaremense", "cabo-friense"
-    ]
-    city_pattern = r'\b(?:em|clima|tempo|tiempo|weather|en|hace en|qué clima|qué tiempo es|qué tiempo|playas en|météo)\s+([\w\sáéíóúÁÉÍÓÚñÑ,\'-]+?)(?:\s+(hoje|agora|hoy|now|clima|england|inglaterra|argentina|brasil|france|francia|$))?'
+    # Lugar conocido mencionado en el texto: resolución local, sin red
+    place = find_place_in_text(text)
+    if place:
+        city = place.name if place.country == 'BR' else "Maricá"
+        log.debug("city.extracted", city=city, source="gazetteer")
+        return city
+    # El nombre llega hasta la palabra de cierre, la puntuación final o el final del texto (no basta con una letra)
+    city_pattern = r'\b(?:em|clima|tempo|tiempo|weather|en|hace en|qué clima|qué tiempo es|qué tiempo|playas en|météo)\s+(?!(?:hoje|agora|hoy|now)\b)([\w\sáéíóúÁÉÍÓÚñÑ,\'-]+?)(?=\s+(?:hoje|agora|hoy|now|clima|england|inglaterra|argentina|brasil|france|francia)\b|\s*[?.!]|\s*$)'
     match = re.search(city_pattern, text, re.IGNORECASE)
     city = match.group(1).strip() if match else None
     if city:
-        city = city.lower()
-        corrections = {
-            'grisby': 'Grimsby', 'direi': 'Grimsby', 'grinsby': 'Grimsby',
-            'grimsby': 'Grimsby', 'green': 'Grimsby', 'greensville': 'Grimsby'
-        }
-        city = corrections.get(city, city.title())
-        for prefix in ['en ', 'em ']:
+        for prefix in ['en ', 'em ', 'in ']:
             if city.lower().startswith(prefix):
-                city = city[len(prefix):].title()
-        # Validar con OpenWeatherMap
-        geocode_url = f"http://api.openweathermap.org/geo/1.0/direct?q={urllib.parse.quote(city)}&limit=1&appid={OPENWEATHER_API_KEY}"
+                city = city[len(prefix):]
+        # Validar con el nomenclátor local (OpenWeatherMap solo si el nombre no se reconoce)
         try:
-            response = http.get(geocode_url, timeout=5)
-            response.raise_for_status()
-            geocode_data = response.json()
+            geocode_data = geocode_city(city)
             if geocode_data and geocode_data[0]['country'] == 'BR':
                 city = geocode_data[0]['name']
             else:
                 city = "Maricá"
         except Exception as e:
-            print(f"DEBUG: Error al validar ciudad con OpenWeatherMap: {e}")
+            log.warning("city.validation_error", city=city, error=e)
             city = "Maricá"
     else:
         city = "Maricá"
-    print(f"DEBUG: Ciudad extraída: {city}")
+    log.debug("city.extracted", city=city, source="pattern")
     return city
 
 def detect_language(text, voice_name):
-    # Intentar con Google Cloud Natural Language
-    detected_language = detect_language_nlp(text)
+    # Identificación local por n-gramas
+    with stage("language_detection"):
+        detected_language = detect_language_local(text)
     if detected_language:
         return detected_language
     # Respaldo con palabras clave
@@ -453,13 +514,25 @@ def detect_language(text, voice_name):
         return 'it'
     return 'pt'
 
-@app.route('/ask-ai', methods=['POST'])
-def ask_ai():
+# Mensaje cuando el modelo no devuelve texto
+EMPTY_ANSWER_MESSAGES = {
+    'pt': "Desculpe, não entendi. Pode repetir?",
+    'en': "Sorry, I didn't understand. Can you repeat?",
+    'es': "Lo siento, no entendí. ¿Puedes repetir?",
+    'fr': "Désolé, je n'ai pas compris. Pouvez-vous répéter ?",
+    'it': "Scusa, non ho capito. Puoi ripetere?"
+}
+
+# Responde a la pregunta del usuario; devuelve (payload, status) para /ask-ai y /converse.
+# Con stream=True, si la respuesta debe venir del modelo (y no está en caché) el payload trae
+# "llm_request" con la solicitud preparada para que /ask-ai-stream la consuma token a token
+def answer_question(data, stream=False):
+    lang = 'pt'
+    news_freshness = None
     try:
-        data = request.get_json()
         if not data or 'text' not in data:
-            print("ERROR: No se proporcionó texto en la solicitud")
-            return jsonify({"error": "No se proporcionó texto"}), 400
+            log.warning("ask.no_text")
+            return {"error": "No se proporcionó texto"}, 400
 
         text = data['text']
         lat = data.get('lat')
@@ -467,10 +540,10 @@ def ask_ai():
         user_lat = data.get('user_lat')
         user_lon = data.get('user_lon')
         voice_name = data.get('voice', 'pt-BR-YaraNeural')
-        print(f"DEBUG: Recibido: texto={text}, lat={lat}, lon={lon}, user_lat={user_lat}, user_lon={user_lon}, voice={voice_name}")
+        log.debug("ask.request", text=text, lat=lat, lon=lon, user_lat=user_lat, user_lon=user_lon, voice=voice_name)
         if not isinstance(text, str) or not text.strip():
-            print("ERROR: El texto debe ser una cadena no vacía")
-            return jsonify({"error": "El texto debe ser una cadena no vacía"}), 400
+            log.warning("ask.invalid_text")
+            return {"error": "El texto debe ser una cadena no vacía"}, 400
 
         # Detectar idioma
         lang = detect_language(text, voice_name)
@@ -483,14 +556,17 @@ def ask_ai():
         }
         lang_code = lang_map.get(lang, 'pt-BR')
 
+        # Clasificar la consulta en una sola pasada sobre el texto (todas las intenciones a la vez)
+        with stage("intent_routing"):
+            intents = classify(text)
+        log.debug("ask.intents", language=lang, intents=list(intents))
+
         # Detectar consultas de clima
-        climate_keywords = ['clima', 'tempo', 'temperatura', 'chuva', 'sol', 'nublado', 'tiempo', 'weather', 'calor', 'frío', 'lluvia', 'qué clima', 'qué tiempo', 'qué tiempo es', 'hace en', 'météo']
-        is_climate_query = any(keyword in text.lower() for keyword in climate_keywords)
-        if is_climate_query:
-            print("DEBUG: Consulta sobre el clima, consultando OpenWeatherMap")
+        if "climate" in intents:
+            log.debug("ask.route", route="climate")
             city = extract_city(text)
             if not OPENWEATHER_API_KEY:
-                print("ERROR: OPENWEATHER_API_KEY no configurada")
+                log.error("openweather.missing_key")
                 error_msg = {
                     'pt': "Falta la clave de API de OpenWeatherMap. Configúrala e intenta de novo.",
                     'en': "Missing OpenWeatherMap API key. Configure it and try again.",
@@ -498,7 +574,7 @@ def ask_ai():
                     'fr': "Clé API OpenWeatherMap manquante. Configurez-la et réessayez.",
                     'it': "Manca la chiave API di OpenWeatherMap. Configurala e riprova."
                 }
-                return jsonify({"response": error_msg[lang]})
+                return {"response": error_msg[lang]}, 200
             weather_data = {
                 'city': city,
                 'lat': lat if lat else -22.91889,
@@ -507,17 +583,14 @@ def ask_ai():
                 'user_lat': user_lat,
                 'user_lon': user_lon
             }
-            weather_response = get_weather()  # Llamada directa a la función en lugar de solicitud HTTP
-            return jsonify(weather_response.get_json())
+            return weather_report(weather_data), 200
 
         # Detectar consultas de playas
-        beach_keywords = ['playas', 'playa', 'bañar', 'baño', 'plage', 'baignade']
-        is_beach_query = any(keyword in text.lower() for keyword in beach_keywords)
-        if is_beach_query:
-            print("DEBUG: Consulta sobre playas detectada, consultando OpenWeatherMap")
+        if "beach" in intents:
+            log.debug("ask.route", route="beach")
             city = extract_city(text)
             if not OPENWEATHER_API_KEY:
-                print("ERROR: OPENWEATHER_API_KEY no configurada")
+                log.error("openweather.missing_key")
                 error_msg = {
                     'pt': "Falta la clave de API de OpenWeatherMap. Configúrala e intenta de novo.",
                     'en': "Missing OpenWeatherMap API key. Configure it and try again.",
@@ -525,7 +598,7 @@ def ask_ai():
                     'fr': "Clé API OpenWeatherMap manquante. Configurez-la et réessayez.",
                     'it': "Manca la chiave API di OpenWeatherMap. Configurala e riprova."
                 }
-                return jsonify({"response": error_msg[lang]})
+                return {"response": error_msg[lang]}, 200
             weather_data = {
                 'city': city,
                 'lat': lat if lat else -22.91889,
@@ -534,14 +607,11 @@ def ask_ai():
                 'user_lat': user_lat,
                 'user_lon': user_lon
             }
-            weather_response = get_weather()  # Llamada directa a la función
-            return jsonify(weather_response.get_json())
+            return weather_report(weather_data), 200
 
         # Detectar consultas de hora
-        time_keywords = ['qué hora es', 'hora actual', 'horas', 'quelle heure', 'heure actuelle']
-        is_time_query = any(keyword in text.lower() for keyword in time_keywords)
-        if is_time_query:
-            print("DEBUG: Consulta sobre la hora detectada")
+        if "time" in intents:
+            log.debug("ask.route", route="time")
             brt = pytz.timezone('America/Sao_Paulo')
             current_time = datetime.now(brt).strftime('%H:%M')
             response_text = {
@@ -551,15 +621,14 @@ def ask_ai():
                 'fr': f"Il est {current_time} à Maricá, RJ.",
                 'it': f"Sono le {current_time} a Maricá, RJ."
             }[lang]
-            return jsonify({"response": response_text})
+            return {"response": response_text}, 200
 
         # Detectar consultas de emergencias
-        emergency_keywords = ['inundação', 'incêndio', 'emergência', 'desastre', 'acidente']
-        is_emergency_query = any(keyword in text.lower() for keyword in emergency_keywords)
-        if is_emergency_query:
-            print("DEBUG: Consulta sobre emergencia detectada")
+        if "emergency" in intents:
+            log.debug("ask.route", route="emergency")
             city = extract_city(text)
-            emergency_type = next((k for k in emergency_keywords if k in text.lower()), "emergência")
+            keyword = intents["emergency"][0].keyword
+            emergency_type = EMERGENCY_TYPES.get(keyword, keyword)
             emergency_numbers = {
                 "inundação": {"number": "193", "service": "Bomberos"},
                 "incêndio": {"number": "199", "service": "Defensa Civil"},
@@ -587,12 +656,18 @@ def ask_ai():
                 'fr': f"En cas de {emergency_type} à {city}, {advice_text} Appelez {service} au {number if isinstance(number, str) else ', '.join([n['number'] for n in number])}. <a href='tel:{number if isinstance(number, str) else number[0]['number']}' class='emergency-link'>Appeler</a>",
                 'it': f"In caso di {emergency_type} a {city}, {advice_text} Chiama {service} al {number if isinstance(number, str) else ', '.join([n['number'] for n in number])}. <a href='tel:{number if isinstance(number, str) else number[0]['number']}' class='emergency-link'>Chiamare</a>"
             }[lang]
-            return jsonify({"response": response_text, "map_url": map_url})
+            return {"response": response_text, "map_url": map_url}, 200
+
+        # Detectar consultas de actividades (rutas de Wikiloc ya scrapeadas en segundo plano)
+        if "activity" in intents:
+            log.debug("ask.route", route="activity")
+            activities, _ = activities_report()
+            return {"response": activities["activities"], "trails": activities["trails"], "updated_at": activities["updated_at"]}, 200
 
         # Verificar si la consulta está relacionada con noticias o eventos
-        if is_news_related(text):
-            print("DEBUG: Consulta detectada como relacionada con noticias o eventos")
-            news_response = query_newsapi(text)
+        if is_news_related(text, intents):
+            log.debug("ask.route", route="news")
+            news_response, news_freshness = query_newsapi(text, intents)
             if news_response:
                 modified_answer = news_response
             else:
@@ -604,9 +679,9 @@ def ask_ai():
                     'it': "Non ho trovato informazioni recenti su questo argomento. Controlla fonti affidabili come www.g1.globo.com o www.marica.rj.gov.br."
                 }[lang]
         else:
-            print("DEBUG: Consulta no relacionada con noticias ni clima, consultando SuperGrok")
+            log.debug("ask.route", route="llm")
             if not SUPERGROK_API_KEY:
-                print("ERROR: Falta la clave de API de SuperGrok")
+                log.error("llm.missing_key")
                 error_msg = {
                     'pt': "Falta la clave de API de SuperGrok.",
                     'en': "Missing SuperGrok API key.",
@@ -614,9 +689,9 @@ def ask_ai():
                     'fr': "Clé API SuperGrok manquante.",
                     'it': "Manca la chiave API di SuperGrok."
                 }
-                return jsonify({"error": error_msg[lang]}), 500
+                return {"error": error_msg[lang]}, 500
 
-            url = "https://api.x.ai/v1/chat/completions"
+            url = f"{XAI_BASE_URL}/v1/chat/completions"
             headers = {
                 "Authorization": f"Bearer {SUPERGROK_API_KEY}",
                 "Content-Type": "application/json"
@@ -666,6 +741,11 @@ def ask_ai():
                 "top_p": 0.9
             }
 
+            # Respuestas generales repetidas desde la caché (nunca las que llevan ubicación o dependen del momento)
+            cacheable = is_cacheable(intents, bool(lat and lon))
+            cache_key = answer_cache_key(system_message, lang, text) if cacheable else None
+            cached_answer = answer_cache.get(cache_key) if cacheable else None
+
             if lat and lon:
                 location_msg = {
                     'pt': f"Localização do usuário: lat={lat}, lon={lon}",
@@ -676,44 +756,59 @@ def ask_ai():
                 }[lang]
                 payload["messages"].append({"role": "system", "content": location_msg})
 
-            print(f"DEBUG: Enviando solicitud a xAI API: {payload}")
-            response = http.post(url, json=payload, headers=headers, timeout=20)
-            print(f"DEBUG: Respuesta HTTP: {response.status_code}, {response.text[:100]}...")
-            response.raise_for_status()
-            result = response.json()
-            print(f"DEBUG: Respuesta de xAI API: {result}")
-
-            if 'choices' not in result or not result['choices']:
-                print("ERROR: No se encontraron respuestas válidas en la respuesta de xAI")
-                error_msg = {
-                    'pt': "Não encontrei respostas válidas.",
-                    'en': "No valid responses found.",
-                    'es': "No se encontraron respuestas válidas.",
-                    'fr': "Aucune réponse valide trouvée.",
-                    'it': "Nessuna risposta valida trovata."
-                }
-                return jsonify({"error": error_msg[lang]}), 500
-
-            answer = result['choices'][0]['message']['content']
-            print(f"DEBUG: Respuesta recibida del modelo: {answer}")
-            modified_answer = answer
-
-        cleaned_answer = re.sub(r'\*\*.*?\*\*', lambda m: m.group(0).replace('**', ''), modified_answer)
-        cleaned_answer = re.sub(r'[\U0001F000-\U0001FFFF]', '', cleaned_answer)
-        modified_answer = cleaned_answer.strip()
+            if cached_answer is not None:
+                log.debug("llm.cache_hit", cache_key=cache_key)
+                modified_answer = cached_answer
+            elif stream:
+                return {"llm_request": {"url": url, "headers": headers, "payload": payload, "cache_key": cache_key}}, 200
+            else:
+                log.debug("llm.request", model=payload.get("model"), payload=payload)
+                upstream_start = time.perf_counter()
+                with stage("llm"):
+                    response = xai_api.post(url, json=payload, headers=headers, timeout=20)
+                response.raise_for_status()
+                result = response.json()
+                upstream_ms = (time.perf_counter() - upstream_start) * 1000
+                log.debug("llm.response", status=response.status_code, upstream_ms=round(upstream_ms), result=result)
+
+                if 'choices' not in result or not result['choices']:
+                    log.error("llm.no_choices", result=result)
+                    error_msg = {
+                        'pt': "Não encontrei respostas válidas.",
+                        'en': "No valid responses found.",
+                        'es': "No se encontraron respuestas válidas.",
+                        'fr': "Aucune réponse valide trouvée.",
+                        'it': "Nessuna risposta valida trovata."
+                    }
+                    return {"error": error_msg[lang]}, 500
+
+                answer = result['choices'][0]['message']['content']
+                log.debug("llm.answer", answer=answer)
+                modified_answer = answer
+                if cacheable and answer and answer.strip():
+                    answer_cache.put(cache_key, answer, upstream_ms)
+
+        modified_answer = clean_answer(modified_answer)
         if not modified_answer:
-            print("WARNING: Respuesta vacía, usando respuesta por defecto")
-            modified_answer = {
-                'pt': "Desculpe, não entendi. Pode repetir?",
-                'en': "Sorry, I didn't understand. Can you repeat?",
-                'es': "Lo siento, no entendí. ¿Puedes repetir?",
-                'fr': "Désolé, je n'ai pas compris. Pouvez-vous répéter ?",
-                'it': "Scusa, non ho capito. Puoi ripetere?"
-            }[lang]
-        return jsonify({"response": modified_answer})
-
+            log.warning("ask.empty_answer", language=lang)
+            modified_answer = EMPTY_ANSWER_MESSAGES[lang]
+        payload = {"response": modified_answer}
+        if news_freshness:
+            payload["news"] = news_freshness
+        return payload, 200
+
+    except (DeadlineExceeded, CircuitOpenError) as unavailable:
+        log.error("ask.upstream_unavailable", error=unavailable)
+        error_msg = {
+            'pt': "O serviço está temporariamente indisponível. Tente de novo em alguns instantes.",
+            'en': "The service is temporarily unavailable. Try again in a moment.",
+            'es': "El servicio no está disponible temporalmente. Intenta de nuevo en unos instantes.",
+            'fr': "Le service est temporairement indisponible. Réessayez dans un instant.",
+            'it': "Il servizio è temporaneamente non disponibile. Riprova tra un momento."
+        }
+        return {"error": error_msg[lang]}, 503
     except requests.exceptions.HTTPError as http_err:
-        print(f"ERROR: Error HTTP al conectar con xAI API: {str(http_err)}, Response: {http_err.response.text if http_err.response else 'No response'}")
+        log.error("llm.http_error", error=http_err, response=http_err.response.text if http_err.response is not None else None)
         error_msg = {
             'pt': f"Erro HTTP ao conectar com xAI API: {str(http_err)}. Tente de novo.",
             'en': f"HTTP error connecting to xAI API: {str(http_err)}. Try again.",
@@ -721,9 +816,9 @@ def ask_ai():
             'fr': f"Erreur HTTP lors de la connexion à l'API xAI : {str(http_err)}. Réessayez.",
             'it': f"Errore HTTP durante la connessione all'API xAI: {str(http_err)}. Riprova."
         }
-        return jsonify({"error": error_msg[lang]}), 500
+        return {"error": error_msg[lang]}, 500
     except requests.exceptions.RequestException as req_err:
-        print(f"ERROR: Error de red al conectar con xAI API: {str(req_err)}")
+        log.error("llm.network_error", error=req_err)
         error_msg = {
             'pt': f"Erro de rede ao conectar com xAI API: {str(req_err)}. Tente de novo.",
             'en': f"Network error connecting to xAI API: {str(req_err)}. Try again.",
@@ -731,9 +826,9 @@ def ask_ai():
             'fr': f"Erreur réseau lors de la connexion à l'API xAI : {str(req_err)}. Réessayez.",
             'it': f"Errore di rete durante la connessione all'API xAI: {str(req_err)}. Riprova."
         }
-        return jsonify({"error": error_msg[lang]}), 500
+        return {"error": error_msg[lang]}, 500
     except ValueError as json_err:
-        print(f"ERROR: Error al procesar la respuesta JSON de xAI API: {str(json_err)}")
+        log.error("llm.invalid_json", error=json_err)
         error_msg = {
             'pt': f"Erro ao processar a resposta JSON: {str(json_err)}. Tente de novo.",
             'en': f"Error processing JSON response: {str(json_err)}. Try again.",
@@ -741,9 +836,9 @@ def ask_ai():
             'fr': f"Erreur lors du traitement de la réponse JSON : {str(json_err)}. Réessayez.",
             'it': f"Errore durante l'elaborazione della risposta JSON: {str(json_err)}. Riprova."
         }
-        return jsonify({"error": error_msg[lang]}), 500
+        return {"error": error_msg[lang]}, 500
     except Exception as e:
-        print(f"ERROR: Error inesperado al procesar la solicitud en /ask-ai: {str(e)}")
+        log.error("ask.error", error=e)
         error_msg = {
             'pt': f"Erro inesperado ao processar a solicitação: {str(e)}. Tente de novo.",
             'en': f"Unexpected error processing the request: {str(e)}. Try again.",
@@ -751,20 +846,111 @@ def ask_ai():
             'fr': f"Erreur inattendue lors du traitement de la demande : {str(e)}. Réessayez.",
             'it': f"Errore imprevisto durante l'elaborazione della richiesta: {str(e)}. Riprova."
         }
-        return jsonify({"error": error_msg[lang]}), 500
+        return {"error": error_msg[lang]}, 500
 
-@app.route('/speak', methods=['POST'])
-def speak():
-    print("DEBUG: Solicitud recibida en /speak")
+@app.route('/ask-ai', methods=['POST'])
+def ask_ai():
+    payload, status = answer_question(request.get_json())
+    return jsonify(payload), status
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Variante de /ask-ai con Server-Sent Events: eventos "delta" ({"text"}) con el texto ya limpio
+# a medida que el modelo genera tokens y un evento final "done" con la respuesta completa,
+# la voz y el idioma (para pedir el audio a /speak). Las respuestas que no vienen del modelo
+# (clima, hora, noticias, caché...) se envían en un solo "delta".
+@app.route('/ask-ai-stream', methods=['POST'])
+def ask_ai_stream():
+    data = request.get_json()
+    payload, status = answer_question(data, stream=True)
+    if status != 200:
+        return jsonify(payload), status
+
+    voice_name = data.get('voice', 'pt-BR-YaraNeural')
+    lang = detect_language(data['text'], voice_name)
+    meta = {
+        "voice": voice_name,
+        "lang": lang,
+        "language_code": {'pt': 'pt-BR', 'en': 'en-US', 'es': 'es-AR', 'fr': 'fr-FR', 'it': 'it-IT'}.get(lang, 'pt-BR')
+    }
+    llm_request = payload.pop("llm_request", None)
+    # El generador corre fuera del contexto de la solicitud: el timeout se fija ahora con lo que queda del presupuesto
+    try:
+        llm_timeout = upstream_timeout(20)
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 503
+
+    def generate():
+        if llm_request is None:
+            text = payload.get("response") or payload.get("weather") or ""
+            if text:
+                yield sse_event("delta", {"text": text})
+            yield sse_event("done", {**payload, **meta})
+            return
+
+        upstream = None
+        cleaner = AnswerStreamCleaner()
+        raw_parts = []
+        started = time.perf_counter()
+        try:
+            upstream = xai_api.post(
+                llm_request["url"],
+                json={**llm_request["payload"], "stream": True},
+                headers=llm_request["headers"],
+                timeout=llm_timeout,
+                stream=True
+            )
+            upstream.raise_for_status()
+            for line in upstream.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == "[DONE]":
+                    break
+                choices = json.loads(chunk).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                if not raw_parts:
+                    observe_stage("llm_first_token", time.perf_counter() - started)
+                raw_parts.append(delta)
+                text = cleaner.feed(delta)
+                if text:
+                    yield sse_event("delta", {"text": text})
+            text = cleaner.finish()
+            if text:
+                yield sse_event("delta", {"text": text})
+
+            raw_answer = "".join(raw_parts)
+            upstream_ms = (time.perf_counter() - started) * 1000
+            observe_stage("llm", upstream_ms / 1000)
+            log.debug("llm.stream_complete", upstream_ms=round(upstream_ms), answer=raw_answer)
+            if llm_request["cache_key"] and raw_answer.strip():
+                answer_cache.put(llm_request["cache_key"], raw_answer, upstream_ms)
+            answer = clean_answer(raw_answer) or EMPTY_ANSWER_MESSAGES.get(lang, EMPTY_ANSWER_MESSAGES['pt'])
+            yield sse_event("done", {"response": answer, **meta})
+        except Exception as e:
+            log.error("llm.stream_error", error=e)
+            yield sse_event("error", {"error": f"Error al consultar el modelo: {str(e)}"})
+        finally:
+            if upstream is not None:
+                upstream.close()
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Sintetiza el texto con Azure; devuelve la respuesta de audio o (payload, status) si hay un error
+def synthesize_speech(data, accept=None):
     try:
-        data = request.get_json()
         if not data or 'text' not in data:
-            print("ERROR: No se proporcionó texto para sintetizar audio")
-            return jsonify({"error": "No se proporcionó texto"}), 400
+            log.warning("tts.no_text")
+            return {"error": "No se proporcionó texto"}, 400
 
         text = data['text']
         voice_name = data.get('voice', 'pt-BR-YaraNeural')
-        print(f"DEBUG: Procesando texto para sintetizar: {text}, voz: {voice_name}")
+        log.debug("tts.request", text=text, voice=voice_name)
         valid_voices = [
             'pt-BR-YaraNeural',
             'en-US-JennyNeural',
@@ -773,15 +959,15 @@ def speak():
             'it-IT-IsabellaNeural'
         ]
         if voice_name not in valid_voices:
-            print(f"ERROR: Voz no válida. Opciones disponibles: {valid_voices}")
-            return jsonify({"error": f"Voz no válida. Opciones disponibles: {valid_voices}"}), 400
+            log.warning("tts.invalid_voice", voice=voice_name)
+            return {"error": f"Voz no válida. Opciones disponibles: {valid_voices}"}, 400
 
         if not AZURE_SPEECH_KEY:
-            print("ERROR: AZURE_SPEECH_KEY no está configurada")
-            return jsonify({"error": "Falta la clave de API de Azure Speech"}), 500
+            log.error("tts.missing_key")
+            return {"error": "Falta la clave de API de Azure Speech"}, 500
 
         # Detectar idioma del texto
-        detected_lang = detect_language_nlp(text) or detect_language(text, voice_name)
+        detected_lang = detect_language(text, voice_name)
         expected_lang = {
             'pt-BR-YaraNeural': 'pt',
             'en-US-JennyNeural': 'en',
@@ -798,15 +984,30 @@ def speak():
         }.get(detected_lang, expected_lang)
 
         if detected_lang != expected_lang:
-            print(f"WARNING: Idioma detectado ({detected_lang}) no coincide con la voz ({voice_name}, esperado {expected_lang}), usando {lang}")
+            log.warning("tts.language_mismatch", detected=detected_lang, voice=voice_name, expected=expected_lang, using=lang)
 
         # Sanitizar el texto
         text = re.sub(r'[^\w\s.,!?\'-]', '', text)  # Elimina caracteres no permitidos
         text = text.replace('"', "'")  # Reemplaza comillas dobles por simples
         text = text.strip()
         if not text:
-            print("ERROR: Texto vacío después de sanitizar")
-            return jsonify({"error": "El texto está vacío después de sanitizar"}), 400
+            log.warning("tts.empty_text")
+            return {"error": "El texto está vacío después de sanitizar"}, 400
+
+        # Formato de salida: campo "format" o encabezado Accept (Opus, MP3 o WAV); forma parte de la clave de caché
+        try:
+            output_format = negotiate_tts_format(data.get('format'), accept)
+        except ValueError as e:
+            log.warning("tts.invalid_format", format=data.get('format'))
+            return {"error": str(e)}, 400
+        audio_format = TTS_FORMATS[output_format]
+        download_name = f"response.{audio_format.extension}"
+        cache_key = tts_cache_key(voice_name, lang, text, output_format)
+        cached_audio = tts_cache.get(cache_key)
+        if cached_audio is not None:
+            log.debug("tts.cache_hit", cache_key=cache_key[:12], format=output_format)
+            observe_tts_payload(output_format, len(cached_audio))
+            return audio_response(cached_audio, audio_format.mimetype, download_name, etag=cache_key, cache_status="HIT")
 
         ssml = f"""
         <speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='{lang}'>
@@ -816,105 +1017,217 @@ def speak():
         </speak>
         """
 
-        url = f"https://{AZURE_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
+        tts_base_url = AZURE_TTS_BASE_URL or f"https://{AZURE_REGION}.tts.speech.microsoft.com"
+        url = f"{tts_base_url}/cognitiveservices/v1"
         headers = {
             "Ocp-Apim-Subscription-Key": AZURE_SPEECH_KEY,
             "Content-Type": "application/ssml+xml",
-            "X-Microsoft-OutputFormat": "riff-8khz-16bit-mono-pcm"  # Formato WAV para mejor alineación
+            "X-Microsoft-OutputFormat": audio_format.azure_format
         }
 
-        print(f"DEBUG: Enviando solicitud a Azure Speech API: {url}")
-        response = http.post(url, headers=headers, data=ssml.encode('utf-8'))
-        print(f"DEBUG: Respuesta de Azure: {response.status_code}, {response.text[:100]}...")
+        # Si otra solicitud ya está sintetizando el mismo texto, se espera su audio en lugar de repetir la llamada
+        call, shared_audio = join_synthesis(cache_key)
+        if shared_audio is not None:
+            log.debug("tts.shared", cache_key=cache_key[:12])
+            return audio_response(shared_audio, audio_format.mimetype, download_name, etag=cache_key, cache_status="SHARED")
+
+        try:
+            # Con stream=True mide hasta las cabeceras, es decir, el tiempo hasta el primer byte de audio
+            with stage("tts"):
+                response = azure_tts_api.post(url, headers=headers, data=ssml.encode('utf-8'), stream=True)
+        except Exception as e:
+            if call:
+                tts_flight.finish(cache_key, call, error=e)
+            raise
+        log.debug("tts.response", status=response.status_code)
         if response.status_code != 200:
             error_msg = f"Error al sintetizar audio: {response.status_code} - {response.text}"
-            print(f"ERROR: {error_msg}")
-            return jsonify({"error": error_msg}), response.status_code
-
-        print(f"DEBUG: Audio generado con Azure Text-to-Speech (voz {voice_name})")
-        return send_file(
-            io.BytesIO(response.content),
-            mimetype="audio/wav",
-            as_attachment=True,
-            download_name="response.wav"
+            log.error("tts.upstream_error", status=response.status_code, response=response.text)
+            if call:
+                tts_flight.finish(cache_key, call, error=RuntimeError(error_msg))
+            return {"error": error_msg}, response.status_code
+
+        completed = {}
+
+        def on_complete(body):
+            completed["audio"] = wav_header(audio_format.sample_rate, len(body)) + body if audio_format.wav_stream else body
+            observe_tts_payload(output_format, len(completed["audio"]))
+            tts_cache.put(cache_key, completed["audio"])
+
+        def on_close():
+            if call:
+                tts_flight.finish(cache_key, call, result=completed.get("audio"))
+
+        # El audio se reenvía al cliente según llega de Azure y se guarda en caché al terminar
+        log.debug("tts.streaming", voice=voice_name, cache_key=cache_key[:12], format=output_format)
+        return stream_audio_response(
+            response,
+            audio_format.mimetype,
+            download_name,
+            header=wav_header(audio_format.sample_rate) if audio_format.wav_stream else b"",
+            on_complete=on_complete,
+            on_close=on_close,
+            etag=cache_key
         )
 
+    except (DeadlineExceeded, CircuitOpenError) as e:
+        log.error("tts.unavailable", error=e)
+        return {"error": f"Servicio de síntesis de voz no disponible temporalmente: {str(e)}"}, 503
     except Exception as e:
-        print(f"ERROR: Error al generar audio: {str(e)}")
-        return jsonify({"error": f"Error al generar audio: {str(e)}"}), 500
-
-@app.route('/scrape-activities', methods=['GET'])
-def scrape_activities():
-    try:
-        # Añadir un retraso para ser respetuosos con el servidor
-        print(f"DEBUG: Aplicando retraso de {SCRAPE_DELAY} segundos antes de scrapear")
-        time.sleep(SCRAPE_DELAY)
-
-        # Scraping de Wikiloc
-        url = "https://www.wikiloc.com/trails/hiking/brazil/rio-de-janeiro/marica"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5"
-        }
-        print(f"DEBUG: Enviando solicitud a Wikiloc: {url}")
-        response = http.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-
-        trails = []
-        # Buscar elementos de rutas (más flexible para cambios en la estructura HTML)
-        trail_elements = soup.select('div.trail__title, div.trail-item, a.trail-link')
-        if not trail_elements:
-            print("DEBUG: No se encontraron elementos de rutas. HTML retornado (primeros 500 caracteres):")
-            print(response.text[:500])
-            return jsonify({
-                "activities": "No encontré rutas de senderismo en Maricá. Es posible que la estructura del sitio haya cambiado. Intenta buscar manualmente en wikiloc.com."
-            })
-
-        for trail in trail_elements[:3]:  # Limitamos a 3 resultados
-            link_tag = trail if trail.name == 'a' else trail.find('a')
-            if link_tag and 'href' in link_tag.attrs and link_tag.text.strip():
-                title = link_tag.text.strip()
-                link = link_tag['href']
-                # Asegurar que el enlace sea completo
-                if not link.startswith('http'):
-                    link = f"https://www.wikiloc.com{link}"
-                trails.append({"title": title, "link": link})
-                print(f"DEBUG: Ruta encontrada: {title} - {link}")
-            else:
-                print("DEBUG: Elemento de ruta sin enlace o título válido. Saltando...")
+        log.error("tts.error", error=e)
+        return {"error": f"Error al generar audio: {str(e)}"}, 500
 
-        if not trails:
-            print("DEBUG: No se encontraron rutas válidas en Wikiloc")
-            return jsonify({
-                "activities": "No encontré rutas de senderismo en Maricá. Intenta buscar manualmente en wikiloc.com."
-            })
-
-        # Formatear respuesta
-        response_text = "Aquí tienes algunas rutas de senderismo en Maricá desde Wikiloc:\n"
-        for trail in trails:
-            response_text += f"- {trail['title']}: {trail['link']}\n"
+@app.route('/speak', methods=['POST'])
+def speak():
+    result = synthesize_speech(request.get_json(), request.headers.get('Accept'))
+    if isinstance(result, tuple):
+        payload, status = result
+        return jsonify(payload), status
+    return result
+
+# Turno completo en una sola solicitud: audio -> transcripción -> respuesta -> audio sintetizado.
+# La respuesta es multipart/form-data con la parte "meta" (JSON con transcripción, respuesta y tiempos
+# por etapa) seguida de la parte "audio", que se transmite según llega de Azure.
+# En el navegador basta con response.formData().
+@app.route('/converse', methods=['POST'])
+def converse():
+    started = time.perf_counter()
+    timings = {}
+    voice_name = request.form.get('voice', 'pt-BR-YaraNeural')
+
+    stage_start = time.perf_counter()
+    transcript, status = transcribe_upload(request.files.get('audio'), stt_language_hint(request.form))
+    timings['transcribe'] = round((time.perf_counter() - stage_start) * 1000, 1)
+    if status != 200:
+        return jsonify({**transcript, "timings": timings}), status
+    text = transcript["text"]
+
+    stage_start = time.perf_counter()
+    answer, status = answer_question({
+        'text': text,
+        'voice': voice_name,
+        'lat': request.form.get('lat'),
+        'lon': request.form.get('lon'),
+        'user_lat': request.form.get('user_lat'),
+        'user_lon': request.form.get('user_lon')
+    })
+    timings['answer'] = round((time.perf_counter() - stage_start) * 1000, 1)
+    if status != 200:
+        return jsonify({"transcript": text, **answer, "timings": timings}), status
+    answer_text = answer.get("response") or answer.get("weather") or ""
+
+    stage_start = time.perf_counter()
+    audio = synthesize_speech({'text': answer_text, 'voice': voice_name, 'format': request.form.get('format')})
+    timings['speak'] = round((time.perf_counter() - stage_start) * 1000, 1)
+    timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+    log.info("converse.timings", **timings)
+
+    meta = {"transcript": text, "answer": answer, "voice": voice_name, "timings": timings}
+    if isinstance(audio, tuple):
+        payload, _ = audio
+        meta["audio_error"] = payload.get("error")
+        return jsonify(meta)
+
+    boundary = uuid.uuid4().hex
+    # El nombre (y la extensión del formato negociado) sale del Content-Disposition de la respuesta de audio
+    filename = audio.headers.get('Content-Disposition', '').partition('filename=')[2].strip('"') or "response.wav"
+
+    def generate():
+        yield (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="meta"\r\n'
+            "Content-Type: application/json\r\n\r\n"
+        ).encode() + json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\r\n"
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="audio"; filename="{filename}"\r\n'
+            f"Content-Type: {audio.mimetype}\r\n\r\n"
+        ).encode()
+        for chunk in audio.iter_encoded():
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = Response(generate(), content_type=f"multipart/form-data; boundary={boundary}")
+    # Cerrar el audio termina la síntesis compartida (tts_flight) y libera la conexión con Azure; se hace al
+    # cerrar la respuesta y no en el generador, que no llega a ejecutarse si el cliente se va antes del primer byte
+    response.call_on_close(audio.close)
+    response.headers['Server-Timing'] = ", ".join(f"{name};dur={ms}" for name, ms in timings.items())
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-        return jsonify({"activities": response_text})
+# Métricas de Prometheus (de todos los workers si PROMETHEUS_MULTIPROC_DIR está configurado)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return metrics_response()
+
+# Nivel y muestreo de los logs en caliente (todos los workers del contenedor), protegido con LOG_ADMIN_TOKEN
+@app.route('/log-config', methods=['GET', 'POST'])
+def log_config():
+    payload, status = log_config_request(request.method, request.get_json(silent=True), request.headers.get('X-Admin-Token'))
+    return jsonify(payload), status
+
+# Estadísticas de las cachés del proceso (aciertos, fallos, tamaño, latencia ahorrada)
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "answers": answer_cache.stats(),
+        "tts": tts_cache.stats(),
+        "weather": weather_cache.stats(),
+        "news": news_cache.stats(),
+        "tts_upstream": tts_flight.stats(),
+        "breakers": {name: breaker.stats() for name, breaker in breakers.items()}
+    })
+
+def fetch_wikiloc():
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.5"
+    }
+    log.debug("wikiloc.request", url=WIKILOC_URL)
+    response = wikiloc_api.get(WIKILOC_URL, headers=headers, timeout=10)
+    response.raise_for_status()
+    return response.text
+
+# Rutas de senderismo desde la caché del scraper; devuelve (payload, status) para /scrape-activities y /ask-ai
+def activities_report():
+    snapshot = trail_cache.snapshot()
+    if snapshot["trails"]:
+        log.debug("activities.cache", trails=len(snapshot['trails']), updated_at=snapshot['updated_at'])
+        return {"activities": format_trails(snapshot["trails"]), **snapshot}, 200
+    if snapshot["error"]:
+        log.error("activities.unavailable", error=snapshot['error'])
+        return {"activities": "Error al buscar rutas en Wikiloc. Intenta de nuevo más tarde.", **snapshot}, 500
+    log.debug("activities.empty")
+    return {"activities": "No encontré rutas de senderismo en Maricá. Intenta buscar manualmente en wikiloc.com.", **snapshot}, 200
 
-    except requests.exceptions.HTTPError as http_err:
-        print(f"ERROR: Error HTTP al scrapear Wikiloc: {str(http_err)}")
-        return jsonify({
-            "activities": "Error al buscar rutas en Wikiloc. Intenta de nuevo más tarde."
-        }), 500
-    except requests.exceptions.RequestException as req_err:
-        print(f"ERROR: Error de red al scrapear Wikiloc: {str(req_err)}")
-        return jsonify({
-            "activities": "Error de red al buscar rutas en Wikiloc. Intenta de nuevo más tarde."
-        }), 500
-    except Exception as e:
-        print(f"ERROR: Error inesperado al scrapear Wikiloc: {str(e)}")
-        return jsonify({
-            "activities": "Error al buscar rutas en Wikiloc. Intenta de nuevo más tarde."
-        }), 500
+@app.route('/scrape-activities', methods=['GET'])
+def scrape_activities():
+    payload, status = activities_report()
+    return jsonify(payload), status
+
+# Cliente de Speech-to-Text (canal gRPC y token) listo antes de la primera transcripción
+def warm_speech_client():
+    if SPEECH_EMULATOR_HOST or os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
+        get_speech_client(GOOGLE_APPLICATION_CREDENTIALS)
+
+# Calentamiento tras arrancar (STARTUP_MODE=lazy) o al importar (eager); ver app/modules/startup.py
+# Mantener caliente el clima de las celdas consultadas hace poco (cupo repartido entre los workers)
+if OPENWEATHER_API_KEY:
+    register_warmup("weather_prefetcher", lambda: start_weather_prefetcher(fetch_onecall))
+# Refrescar en segundo plano las noticias de los perfiles habituales
+if NEWS_API_KEY:
+    register_warmup("news_refresher", lambda: start_news_refresher(NEWS_PROFILES, fetch_news))
+# Scrapear Wikiloc en segundo plano (SCRAPE_DELAY es la pausa de cortesía entre ejecuciones)
+register_warmup("trail_scraper", lambda: start_trail_scraper(fetch_wikiloc, delay=SCRAPE_DELAY))
+# Modelos y clientes que, si no, pagaría la primera solicitud que los use
+register_warmup("language_model", load_language_model)
+register_warmup("speech_client", warm_speech_client)
+register_warmup("recognition_profiles", load_recognition_profiles)
+register_warmup("html_parser", load_html_parser)
+start_warmup()
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 8080))
-    print(f"DEBUG: Iniciando servidor en puerto {port}")
+    log.info("startup.dev_server", port=port)
     app.run(host='0.0.0.0', port=port, debug=True)  # Debug habilitado para desarrollo local
\ No newline at end of file
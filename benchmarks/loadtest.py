@@ -0,0 +1,430 @@
+"""
+Prueba de carga del pipeline de voz completo contra upstreams sustitutos locales.
+
+Arranca los sustitutos de benchmarks/stand_ins.py, levanta `appv2:app` con gunicorn apuntando
+a ellos (o usa --app-url si la app ya está corriendo con esas variables) y envía a /transcribe,
+/ask-ai, /speak y /weather una mezcla de solicitudes con llegadas de Poisson a la tasa pedida.
+El informe trae rendimiento, p50/p95/p99 por ruta y el desglose por etapa de /metrics.
+
+    python -m benchmarks.loadtest --rps 20 --duration 60
+    python -m benchmarks.loadtest --rps 50 --mix ask-ai=1 --profiles perfiles.json --json informe.json
+
+perfiles.json sustituye parte de DEFAULT_PROFILES, p. ej.
+{"xai": {"latency": "lognormal:1500:6000", "error_rate": 0.05}}. Hace falta ffmpeg para /transcribe.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.stand_ins import StandIns
+
+DEFAULT_MIX = {"transcribe": 0.25, "ask-ai": 0.35, "speak": 0.25, "weather": 0.15}
+
+QUESTIONS = [
+    ("pt-BR-YaraNeural", "Como está o clima em Maricá hoje?"),
+    ("es-AR-DaniaNeural", "¿Qué tiempo hace en Niterói?"),
+    ("en-US-JennyNeural", "What's the weather in Rio de Janeiro?"),
+    ("pt-BR-YaraNeural", "As praias de Maricá estão boas para banho?"),
+    ("pt-BR-YaraNeural", "Que horas são?"),
+    ("pt-BR-YaraNeural", "Quais são as notícias de Maricá?"),
+    ("pt-BR-YaraNeural", "Quero fazer uma trilha em Maricá"),
+    ("pt-BR-YaraNeural", "Me conte uma curiosidade sobre a Lagoa de Araruama"),
+    ("es-AR-DaniaNeural", "¿Cuál es la historia de Maricá?"),
+    ("fr-FR-DeniseNeural", "Quelle est la meilleure plage de Maricá ?"),
+    ("it-IT-IsabellaNeural", "Qual è il piatto tipico di Maricá?"),
+]
+# Preguntas generales distintas en cada solicitud (no las sirve la caché de respuestas)
+UNIQUE_QUESTION_RATE = 0.3
+
+SPEAK_TEXTS = [
+    ("pt-BR-YaraNeural", "Em Maricá o clima está céu limpo. A temperatura é de 27 graus."),
+    ("es-AR-DaniaNeural", "En Niterói el clima está nublado. La temperatura es de 24 grados."),
+    ("en-US-JennyNeural", "In Rio de Janeiro the weather is clear. The temperature is 29 degrees."),
+]
+UNIQUE_SPEAK_RATE = 0.5
+
+CITIES = ["Maricá", "Niterói", "Saquarema", "Itaipuaçu", "Ponta Negra"]
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Ruta desconocida en --mix: {name}. Opciones: {', '.join(DEFAULT_MIX)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def speech_wav(seconds, sample_rate=16000):
+    """
+    WAV mono de 16 bits con una señal tipo voz (tono modulado): el sustituto de STT no la escucha,
+    pero ffmpeg y el resto del pipeline la procesan como un audio real.
+    """
+    frames = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        t = i / sample_rate
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+        value = envelope * (0.6 * math.sin(2 * math.pi * 180 * t) + 0.3 * math.sin(2 * math.pi * 720 * t))
+        frames += int(value * 12000).to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+# Formato del audio de /transcribe: (extensión, tipo MIME, argumentos de ffmpeg); wav no pasa por ffmpeg
+AUDIO_FORMATS = {
+    "wav": ("wav", "audio/wav", None),
+    "webm": ("webm", "audio/webm", ["-c:a", "libopus", "-b:a", "32k", "-f", "webm"]),
+    "ogg": ("ogg", "audio/ogg", ["-c:a", "libopus", "-b:a", "32k", "-f", "ogg"]),
+    "flac": ("flac", "audio/flac", ["-f", "flac"]),
+}
+
+
+def encode_audio(wav, audio_format):
+    """
+    Codifica el WAV de prueba como lo haría el navegador (WebM/Opus de MediaRecorder) u otro formato.
+    """
+    _, _, codec_args = AUDIO_FORMATS[audio_format]
+    if codec_args is None:
+        return wav
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "error", "-i", "pipe:0", *codec_args, "pipe:1"],
+        input=wav, capture_output=True, check=True,
+    )
+    return result.stdout
+
+
+class Workload:
+    """
+    Genera las solicitudes de cada ruta con una mezcla realista de repeticiones (cacheables) y textos nuevos.
+    """
+
+    def __init__(self, audio, audio_format="wav"):
+        self.audio = audio
+        self.audio_format = audio_format
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def build(self, kind):
+        if kind == "transcribe":
+            extension, mimetype, _ = AUDIO_FORMATS[self.audio_format]
+            return "POST", "/transcribe", {"files": {"audio": (f"turno.{extension}", self.audio, mimetype)}, "data": {"context": random.choice(QUESTIONS)[1]}}
+        if kind == "ask-ai":
+            voice, text = random.choice(QUESTIONS)
+            if random.random() < UNIQUE_QUESTION_RATE:
+                text = f"Me conte algo interessante sobre Maricá, número {self._next_id()}"
+                voice = "pt-BR-YaraNeural"
+            lat, lon = -22.91889 + random.uniform(-0.05, 0.05), -42.81889 + random.uniform(-0.05, 0.05)
+            return "POST", "/ask-ai", {"json": {"text": text, "voice": voice, "lat": lat, "lon": lon}}
+        if kind == "speak":
+            voice, text = random.choice(SPEAK_TEXTS)
+            if random.random() < UNIQUE_SPEAK_RATE:
+                text = f"{text} Resposta {self._next_id()}."
+            return "POST", "/speak", {"json": {"text": text, "voice": voice}}
+        if random.random() < 0.5:
+            return "POST", "/weather", {"json": {"city": random.choice(CITIES)}}
+        return "POST", "/weather", {"json": {"lat": -22.91889 + random.uniform(-0.3, 0.3), "lon": -42.81889 + random.uniform(-0.3, 0.3)}}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.results = defaultdict(list)
+
+    def add(self, kind, status, latency, first_byte):
+        with self._lock:
+            self.results[kind].append((status, latency, first_byte))
+
+    def summary(self, elapsed):
+        report = {}
+        for kind, results in sorted(self.results.items()):
+            latencies = [r[1] * 1000 for r in results]
+            first_bytes = [r[2] * 1000 for r in results if r[2] is not None]
+            statuses = defaultdict(int)
+            for status, _, _ in results:
+                statuses[str(status)] += 1
+            report[kind] = {
+                "requests": len(results),
+                "throughput_rps": round(len(results) / elapsed, 2),
+                "errors": sum(1 for r in results if not (isinstance(r[0], int) and r[0] < 400)),
+                "statuses": dict(statuses),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "ttfb_p50_ms": round(percentile(first_bytes, 50), 1) if first_bytes else None,
+            }
+        return report
+
+
+def scrape_metrics(app_url):
+    """
+    {(nombre, etiquetas ordenadas): valor} de /metrics.
+    """
+    samples = {}
+    text = requests.get(f"{app_url}/metrics", timeout=10).text
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def _delta(before, after):
+    return {key: value - before.get(key, 0.0) for key, value in after.items() if value - before.get(key, 0.0)}
+
+
+def _bucket_quantile(buckets, q):
+    """
+    Cuantil aproximado por interpolación lineal dentro del bucket (como histogram_quantile).
+    """
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return previous_bound
+            span = count - previous_count
+            return previous_bound + (bound - previous_bound) * ((rank - previous_count) / span if span else 0)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def histogram_breakdown(delta, metric, label):
+    groups = defaultdict(lambda: {"buckets": [], "sum": 0.0, "count": 0.0})
+    for (name, labels), value in delta.items():
+        labels = dict(labels)
+        if label not in labels:
+            continue
+        group = groups[labels[label]]
+        if name == f"{metric}_bucket":
+            group["buckets"].append((float(labels["le"]), value))
+        elif name == f"{metric}_sum":
+            group["sum"] += value
+        elif name == f"{metric}_count":
+            group["count"] += value
+    breakdown = {}
+    for key, group in sorted(groups.items()):
+        if not group["count"]:
+            continue
+        # Con varios workers (o rutas con varios estados) se suman los buckets del mismo límite
+        merged = defaultdict(float)
+        for bound, value in group["buckets"]:
+            merged[bound] += value
+        buckets = sorted(merged.items())
+        breakdown[key] = {
+            "count": int(group["count"]),
+            "mean_ms": round(group["sum"] / group["count"] * 1000, 1),
+            "p50_ms": round((_bucket_quantile(buckets, 0.5) or 0) * 1000, 1),
+            "p95_ms": round((_bucket_quantile(buckets, 0.95) or 0) * 1000, 1),
+        }
+    return breakdown
+
+
+def counter_breakdown(delta, metric, *labels):
+    totals = defaultdict(float)
+    for (name, sample_labels), value in delta.items():
+        if name != f"{metric}_total":
+            continue
+        sample_labels = dict(sample_labels)
+        totals["/".join(sample_labels.get(label, "") for label in labels)] += value
+    return {key: int(value) for key, value in sorted(totals.items())}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(env, workers, serving_mode):
+    """
+    Levanta appv2:app con gunicorn (gunicorn.conf.py del repositorio) y espera a que responda.
+    """
+    port = _free_port()
+    metrics_dir = tempfile.mkdtemp(prefix="voz-loadtest-metrics-")
+    app_env = {
+        **os.environ,
+        **env,
+        "PORT": str(port),
+        "GUNICORN_WORKERS": str(workers),
+        "SERVING_MODE": serving_mode,
+        "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "appv2:app"], cwd=root, env=app_env)
+    app_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn terminó al arrancar (código {process.returncode})")
+        try:
+            requests.get(f"{app_url}/test", timeout=1)
+            return process, app_url, metrics_dir
+        except requests.exceptions.RequestException:
+            time.sleep(0.3)
+    process.terminate()
+    raise RuntimeError("appv2 no respondió en 60 s")
+
+
+def run_load(app_url, workload, mix, rps, duration, concurrency, recorder):
+    """
+    Llegadas de Poisson en bucle abierto: la latencia se mide desde el instante programado,
+    así que si la app (o el cliente) se satura, la espera también cuenta.
+    """
+    kinds, weights = zip(*mix.items())
+    local = threading.local()
+
+    def fire(kind, method, path, kwargs, scheduled):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        first_byte = None
+        try:
+            with session.request(method, f"{app_url}{path}", stream=True, timeout=60, **kwargs) as response:
+                first_byte = time.perf_counter() - scheduled
+                for _ in response.iter_content(65536):
+                    pass
+                status = response.status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        recorder.add(kind, status, time.perf_counter() - scheduled, first_byte)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < duration:
+            next_at += random.expovariate(rps)
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind = random.choices(kinds, weights)[0]
+            method, path, kwargs = workload.build(kind)
+            pool.submit(fire, kind, method, path, kwargs, next_at)
+    return time.perf_counter() - started
+
+
+def print_report(report):
+    print(f"\nCarga: {report['target_rps']} rps objetivo, {report['elapsed_s']} s, {report['achieved_rps']} rps conseguidos")
+    print(f"\n{'ruta':<12}{'solic.':>8}{'rps':>8}{'errores':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p50':>10}")
+    for kind, row in report["routes"].items():
+        print(f"{kind:<12}{row['requests']:>8}{row['throughput_rps']:>8}{row['errors']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{str(row['ttfb_p50_ms']):>10}")
+    if report.get("stages"):
+        print(f"\n{'etapa':<22}{'n':>8}{'media ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for stage, row in report["stages"].items():
+            print(f"{stage:<22}{row['count']:>8}{row['mean_ms']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}")
+    if report.get("caches"):
+        print("\nCachés: " + ", ".join(f"{key}={value}" for key, value in report["caches"].items()))
+    if report.get("audio_uploads"):
+        print("Audio a STT: " + ", ".join(f"{key}={value}" for key, value in report["audio_uploads"].items()))
+    print("Upstreams: " + ", ".join(f"{name}={stats['calls']} ({stats['errors']} err)" for name, stats in report["upstreams"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de appv2 con upstreams sustitutos")
+    parser.add_argument("--rps", type=float, default=10, help="solicitudes por segundo objetivo")
+    parser.add_argument("--duration", type=float, default=60, help="segundos de carga medida")
+    parser.add_argument("--warmup", type=float, default=5, help="segundos de calentamiento (no cuentan)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="p. ej. transcribe=0.25,ask-ai=0.35,speak=0.25,weather=0.15")
+    parser.add_argument("--concurrency", type=int, default=256, help="solicitudes simultáneas máximas del cliente")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="duración del audio enviado a /transcribe")
+    parser.add_argument("--audio-format", default="wav", choices=sorted(AUDIO_FORMATS), help="formato del audio enviado a /transcribe (webm: como MediaRecorder)")
+    parser.add_argument("--profiles", help="JSON con latencias/errores/tamaños por upstream")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("GUNICORN_WORKERS", 2)))
+    parser.add_argument("--serving-mode", default=os.getenv("SERVING_MODE", "gevent"), choices=["gevent", "sync"])
+    parser.add_argument("--app-url", help="usar una app ya arrancada (con las variables de los sustitutos)")
+    parser.add_argument("--json", help="guardar el informe en este archivo")
+    args = parser.parse_args(argv)
+
+    overrides = None
+    if args.profiles:
+        with open(args.profiles, encoding="utf-8") as f:
+            overrides = json.load(f)
+    stand_ins = StandIns(overrides)
+    process = metrics_dir = None
+    try:
+        if args.app_url:
+            app_url = args.app_url.rstrip("/")
+            print("Variables para la app:\n" + "\n".join(f"  {key}={value}" for key, value in stand_ins.env().items()))
+        else:
+            process, app_url, metrics_dir = start_app(stand_ins.env(), args.workers, args.serving_mode)
+        workload = Workload(encode_audio(speech_wav(args.audio_seconds), args.audio_format), args.audio_format)
+
+        if args.warmup > 0:
+            run_load(app_url, workload, args.mix, args.rps, args.warmup, args.concurrency, Recorder())
+        before = scrape_metrics(app_url)
+        upstreams_before = stand_ins.stats()
+        recorder = Recorder()
+        elapsed = run_load(app_url, workload, args.mix, args.rps, args.duration, args.concurrency, recorder)
+        delta = _delta(before, scrape_metrics(app_url))
+
+        routes = recorder.summary(elapsed)
+        upstreams = {
+            name: {**stats, "calls": stats["calls"] - upstreams_before[name]["calls"], "errors": stats["errors"] - upstreams_before[name]["errors"]}
+            for name, stats in stand_ins.stats().items()
+        }
+        report = {
+            "target_rps": args.rps,
+            "elapsed_s": round(elapsed, 1),
+            "achieved_rps": round(sum(row["requests"] for row in routes.values()) / elapsed, 2),
+            "routes": routes,
+            "server_routes": histogram_breakdown(delta, "voz_request_duration_seconds", "route"),
+            "stages": histogram_breakdown(delta, "voz_stage_duration_seconds", "stage"),
+            "caches": counter_breakdown(delta, "voz_cache_events", "cache", "result"),
+            "upstream_responses": counter_breakdown(delta, "voz_upstream_responses", "upstream", "status"),
+            "audio_uploads": counter_breakdown(delta, "voz_audio_uploads", "container", "path"),
+            "upstreams": upstreams,
+        }
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        stand_ins.close()
+
+
+if __name__ == "__main__":
+    main()
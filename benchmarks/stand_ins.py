@@ -0,0 +1,285 @@
+"""
+Sustitutos locales de los upstreams de appv2 (OpenWeather, NewsAPI, x.ai, Azure TTS, Wikiloc y
+Speech-to-Text) para las pruebas de carga: responden con datos con la forma real, con latencias,
+tasas de error y tamaños configurables por upstream.
+
+Los upstreams HTTP comparten un servidor y se distinguen por el primer segmento de la ruta
+(http://127.0.0.1:PUERTO/xai/v1/chat/completions); Speech-to-Text es un servidor gRPC aparte.
+"""
+import json
+import math
+import random
+import threading
+import time
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Latencias: "fixed:MS", "uniform:MIN_MS:MAX_MS" o "lognormal:MEDIANA_MS:P99_MS"
+DEFAULT_PROFILES = {
+    "openweather": {"latency": "lognormal:120:600", "error_rate": 0.0},
+    "newsapi": {"latency": "lognormal:250:1200", "error_rate": 0.0, "articles": 10},
+    "xai": {"latency": "lognormal:900:4000", "error_rate": 0.01, "answer_chars": 400, "token_ms": 15},
+    "azure-tts": {"latency": "lognormal:250:1000", "error_rate": 0.0, "audio_seconds": 4.0},
+    "wikiloc": {"latency": "lognormal:600:2500", "error_rate": 0.0, "html_bytes": 200000},
+    "speech-to-text": {"latency": "lognormal:700:2500", "error_rate": 0.0},
+}
+
+TRANSCRIPTS = [
+    "Como está o clima em Maricá hoje?",
+    "Quais são as notícias de Maricá?",
+    "Quero fazer uma trilha em Maricá",
+    "Que horas são?",
+    "Me conte uma curiosidade sobre a Lagoa de Araruama",
+]
+
+ANSWER_WORDS = (
+    "Maricá tem lagoas praias trilhas e um clima agradável durante quase todo o ano "
+    "a cidade fica no estado do Rio de Janeiro e é conhecida pela restinga e pelo pôr do sol"
+).split()
+
+PLACES = ["Maricá", "Niterói", "Saquarema", "Itaipuaçu", "Ponta Negra", "Rio de Janeiro"]
+
+
+class Latency:
+    def __init__(self, spec):
+        kind, *params = spec.split(":")
+        params = [float(p) / 1000 for p in params]
+        if kind == "fixed" and len(params) == 1:
+            self._sample = lambda: params[0]
+        elif kind == "uniform" and len(params) == 2:
+            self._sample = lambda: random.uniform(params[0], params[1])
+        elif kind == "lognormal" and len(params) == 2:
+            mu = math.log(params[0])
+            sigma = max(0.0, (math.log(params[1]) - mu) / 2.326)
+            self._sample = lambda: random.lognormvariate(mu, sigma)
+        else:
+            raise ValueError(f"Latencia no válida: {spec}")
+        self.spec = spec
+
+    def sample(self):
+        return self._sample()
+
+
+class UpstreamProfile:
+    """
+    Comportamiento de un upstream sustituto y contadores de lo que ha servido.
+    """
+
+    def __init__(self, name, latency, error_rate=0.0, **params):
+        self.name = name
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.params = params
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def wait(self):
+        """
+        Espera la latencia simulada; devuelve True si esta llamada debe fallar.
+        """
+        time.sleep(self.latency.sample())
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+        return failed
+
+    def stats(self):
+        with self._lock:
+            return {"latency": self.latency.spec, "calls": self.calls, "errors": self.errors}
+
+
+def build_profiles(overrides=None):
+    profiles = {}
+    for name, defaults in DEFAULT_PROFILES.items():
+        config = {**defaults, **((overrides or {}).get(name) or {})}
+        profiles[name] = UpstreamProfile(name, **config)
+    return profiles
+
+
+def _answer(chars):
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(random.choice(ANSWER_WORDS))
+    return " ".join(words).capitalize() + "."
+
+
+def _onecall():
+    return {
+        "current": {
+            "temp": round(random.uniform(19, 32), 1),
+            "humidity": random.randint(50, 95),
+            "wind_speed": round(random.uniform(0.5, 9), 1),
+            "weather": [{"description": random.choice(["céu limpo", "nuvens dispersas", "chuva leve"])}],
+            "rain": {"1h": random.choice([0, 0, 0, 0.4])},
+        },
+        "daily": [{"temp": {"min": 19.0, "max": 29.0}, "weather": [{"description": "céu limpo"}]}],
+    }
+
+
+def _wikiloc_html(size):
+    items = "".join(
+        f'<div class="trail__title"><a href="/hiking-trails/trilha-{i}-{i * 7919}">Trilha {i} em Maricá</a></div>'
+        for i in range(1, 21)
+    )
+    padding = "<p>" + "lorem ipsum " * max(0, (size - len(items)) // 12) + "</p>"
+    return f"<html><body>{padding}{items}</body></html>".encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    profiles = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        _, upstream, rest = (url.path + "/").split("/", 2)
+        rest = "/" + rest.rstrip("/")
+        body = self._body() if method == "POST" else b""
+        profile = self.profiles.get(upstream)
+        if profile is None:
+            return self._send(404, {"error": f"upstream desconocido: {upstream}"})
+        if profile.wait():
+            return self._send(random.choice([429, 500, 503]), {"error": "error simulado"})
+        handler = getattr(self, "_" + upstream.replace("-", "_"), None)
+        if handler is None:
+            return self._send(404, {"error": "ruta desconocida"})
+        handler(profile, method, rest, parse_qs(url.query), body)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def _openweather(self, profile, method, path, query, body):
+        if path == "/geo/1.0/direct":
+            name = (query.get("q") or ["Maricá"])[0]
+            return self._send(200, [{"name": name.title(), "lat": -22.9 + random.uniform(-0.2, 0.2), "lon": -42.8 + random.uniform(-0.2, 0.2), "country": "BR"}])
+        if path == "/geo/1.0/reverse":
+            return self._send(200, [{"name": random.choice(PLACES), "lat": float(query["lat"][0]), "lon": float(query["lon"][0]), "country": "BR"}])
+        if path == "/data/3.0/onecall":
+            return self._send(200, _onecall())
+        self._send(404, {"error": "ruta desconocida"})
+
+    def _newsapi(self, profile, method, path, query, body):
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        articles = [
+            {"title": f"Notícia {i} sobre Maricá", "publishedAt": now, "source": {"name": "Sustituto"}, "description": _answer(200)}
+            for i in range(int(profile.params.get("articles", 10)))
+        ]
+        self._send(200, {"status": "ok", "totalResults": len(articles), "articles": articles})
+
+    def _xai(self, profile, method, path, query, body):
+        request = json.loads(body or b"{}")
+        answer = _answer(int(profile.params.get("answer_chars", 400)))
+        if not request.get("stream"):
+            return self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}]})
+        # Streaming: la latencia simulada es la del primer token; después un token cada token_ms
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        token_delay = float(profile.params.get("token_ms", 15)) / 1000
+        for i, word in enumerate(answer.split(" ")):
+            delta = word if i == 0 else " " + word
+            self._chunk(f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]})}\n\n".encode("utf-8"))
+            time.sleep(token_delay)
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _azure_tts(self, profile, method, path, query, body):
+        # raw-8khz-16bit-mono-pcm: ruido suave con la duración configurada
+        samples = int(8000 * float(profile.params.get("audio_seconds", 4.0)))
+        pcm = bytes(random.getrandbits(8) & 0x0F for _ in range(2 * min(samples, 4000))) * max(1, samples // 4000)
+        self._send(200, pcm, "audio/x-wav")
+
+    def _wikiloc(self, profile, method, path, query, body):
+        self._send(200, _wikiloc_html(int(profile.params.get("html_bytes", 200000))), "text/html; charset=utf-8")
+
+
+def start_speech_server(profile, host="127.0.0.1"):
+    """
+    Servidor gRPC con el método Recognize de google.cloud.speech.v1. Devuelve (servidor, "host:puerto").
+    """
+    import grpc
+    from google.cloud import speech
+
+    def recognize(request, context):
+        if profile.wait():
+            context.abort(grpc.StatusCode.UNAVAILABLE, "error simulado")
+        return speech.RecognizeResponse(results=[speech.SpeechRecognitionResult(
+            alternatives=[speech.SpeechRecognitionAlternative(transcript=random.choice(TRANSCRIPTS), confidence=0.92)],
+            language_code=request.config.language_code,
+        )])
+
+    handler = grpc.method_handlers_generic_handler("google.cloud.speech.v1.Speech", {
+        "Recognize": grpc.unary_unary_rpc_method_handler(
+            recognize,
+            request_deserializer=speech.RecognizeRequest.deserialize,
+            response_serializer=speech.RecognizeResponse.serialize,
+        ),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=128))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port(f"{host}:0")
+    server.start()
+    return server, f"{host}:{port}"
+
+
+class StandIns:
+    """
+    Arranca todos los sustitutos; env() devuelve las variables que apuntan appv2 hacia ellos.
+    """
+
+    def __init__(self, overrides=None, host="127.0.0.1"):
+        self.profiles = build_profiles(overrides)
+        handler = type("Handler", (_Handler,), {"profiles": self.profiles})
+        self.http = ThreadingHTTPServer((host, 0), handler)
+        self.http.daemon_threads = True
+        self.base_url = f"http://{host}:{self.http.server_address[1]}"
+        threading.Thread(target=self.http.serve_forever, name="stand-ins", daemon=True).start()
+        self.grpc, self.speech_host = start_speech_server(self.profiles["speech-to-text"], host)
+
+    def env(self):
+        return {
+            "OPENWEATHER_BASE_URL": f"{self.base_url}/openweather",
+            "NEWSAPI_BASE_URL": f"{self.base_url}/newsapi",
+            "XAI_BASE_URL": f"{self.base_url}/xai",
+            "AZURE_TTS_BASE_URL": f"{self.base_url}/azure-tts",
+            "WIKILOC_URL": f"{self.base_url}/wikiloc/trails/hiking/brazil/rio-de-janeiro/marica",
+            "SPEECH_EMULATOR_HOST": self.speech_host,
+            "OPENWEATHER_API_KEY": "stand-in",
+            "NEWS_API_KEY": "stand-in",
+            "SUPERGROK_API_KEY": "stand-in",
+            "AZURE_SPEECH_KEY": "stand-in",
+        }
+
+    def stats(self):
+        return {name: profile.stats() for name, profile in self.profiles.items()}
+
+    def close(self):
+        self.http.shutdown()
+        self.http.server_close()
+        self.grpc.stop(grace=None)
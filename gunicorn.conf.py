@@ -0,0 +1,36 @@
+import os
+
+# Configuración de gunicorn para Cloud Run (ver app/config.py para SERVING_MODE)
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+
+if os.getenv("SERVING_MODE", "gevent") == "gevent":
+    # E/S cooperativa: cada worker atiende hasta worker_connections solicitudes a la vez,
+    # en línea con containerConcurrency de service.yaml
+    worker_class = "gevent"
+    workers = int(os.getenv("GUNICORN_WORKERS", 2))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 80))
+else:
+    worker_class = "sync"
+    workers = int(os.getenv("GUNICORN_WORKERS", 4))
+
+# Los workers lo leen en app/config.py para repartir la cuota de las APIs entre sus hilos de precarga
+os.environ["GUNICORN_WORKERS"] = str(workers)
+
+# Métricas de Prometheus compartidas entre workers: cada proceso escribe sus valores en este
+# directorio y /metrics los agrega (se fija aquí para que los workers lo hereden al arrancar)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+
+def on_starting(server):
+    # Valores de una ejecución anterior falsearían los contadores
+    import shutil
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Los gauges "livesum" de un worker muerto dejan de contar
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
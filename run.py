@@ -1,16 +1,14 @@
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from google.cloud import speech
-from google.cloud import texttospeech
-import tempfile
 import logging
 import io
-import openai
 import requests
 from flask import send_from_directory
 import re
+from app.modules.speech_synthesis import tts_cache, tts_cache_key, audio_response, negotiate_tts_format, TTS_FORMATS, GOOGLE_TTS_FORMATS
+from app.modules.transcription import get_speech_client
 
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG)
@@ -23,17 +21,15 @@ CORS(app)
 # Configurar Google Cloud (Speech-to-Text y Text-to-Speech)
 credential_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "/home/cris/voz_robotica/credentials.json")
 logger.debug(f"Usando credenciales de Google en: {credential_path}")
+# Lo que falte solo afecta a las rutas que lo usan: la app arranca igual y falla en esas solicitudes
 if not os.path.exists(credential_path):
     logger.error(f"Archivo de credenciales no encontrado: {credential_path}")
-    raise FileNotFoundError(f"Archivo de credenciales no encontrado: {credential_path}")
 
-# Verificar archivos SSL
-ssl_files = ['cert.pem', 'key.pem']
-for ssl_file in ssl_files:
-    ssl_file_path = os.path.join('/home/cris/voz_robotica', ssl_file)
+# Verificar archivos SSL (sin ellos el servidor de desarrollo arranca en HTTP)
+SSL_FILES = [os.path.join('/home/cris/voz_robotica', ssl_file) for ssl_file in ['cert.pem', 'key.pem']]
+for ssl_file_path in SSL_FILES:
     if not os.path.exists(ssl_file_path):
         logger.error(f"Archivo SSL no encontrado: {ssl_file_path}")
-        raise FileNotFoundError(f"Archivo SSL no encontrado: {ssl_file_path}")
 
 # Mapa de voces de la UI a voces de Google Cloud Text-to-Speech
 VOICE_MAP = {
@@ -50,9 +46,6 @@ OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 
 if not OPENAI_API_KEY or not OPENWEATHER_API_KEY:
     logger.error("Faltan claves API en el archivo .env")
-    raise ValueError("Faltan claves API en el archivo .env")
-
-openai.api_key = OPENAI_API_KEY
 
 # Ruta para servir archivos de la UI holográfica
 @app.route('/iURi3D/<path:filename>')
@@ -90,7 +83,9 @@ def transcribe():
             logger.error("El archivo de audio es demasiado pequeño")
             return jsonify({"error": "El audio es muy corto. ¡Habla un poco más!"}), 400
 
-        client = speech.SpeechClient()
+        # Las librerías de Google y OpenAI se importan en el primer uso, no al arrancar
+        from google.cloud import speech
+        client = get_speech_client(credential_path)
         audio = speech.RecognitionAudio(content=audio_content)
         config = speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
@@ -160,6 +155,7 @@ def ask_ai():
         # Respuesta conversacional con OpenAI para otros casos
         else:
             try:
+                import openai
                 client = openai.OpenAI(api_key=OPENAI_API_KEY)
                 response = client.chat.completions.create(
                     model="gpt-3.5-turbo",
@@ -198,15 +194,33 @@ def speak():
             logger.error(f"Voz no soportada: {voice}")
             return jsonify({"error": f"Voz no soportada: {voice}"}), 400
 
+        # Formato de salida entre los que ofrece Google Text-to-Speech (MP3 si el cliente no pide otro)
+        try:
+            output_format = negotiate_tts_format(data.get('format'), request.headers.get('Accept'), GOOGLE_TTS_FORMATS, default="mp3-32k")
+        except ValueError as e:
+            logger.error(str(e))
+            return jsonify({"error": str(e)}), 400
+        audio_format = TTS_FORMATS[output_format]
+        download_name = f"response.{audio_format.extension}"
+
         voice_config = VOICE_MAP[voice]
+        cache_key = tts_cache_key(voice_config['name'], voice_config['language_code'], text, output_format)
+        cached_audio = tts_cache.get(cache_key)
+        if cached_audio is not None:
+            logger.debug(f"Audio servido desde la caché TTS ({cache_key[:12]})")
+            return audio_response(cached_audio, audio_format.mimetype, download_name, etag=cache_key, cache_status="HIT")
+
+        from google.cloud import texttospeech
         client = texttospeech.TextToSpeechClient()
         synthesis_input = texttospeech.SynthesisInput(text=text)
         voice_params = texttospeech.VoiceSelectionParams(
             language_code=voice_config['language_code'],
             name=voice_config['name']
         )
+        # Google entrega los WAV ya con cabecera; en MP3 la tasa de bits es fija y solo cambia la frecuencia
         audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
+            audio_encoding=texttospeech.AudioEncoding[audio_format.google_encoding],
+            sample_rate_hertz=audio_format.sample_rate
         )
 
         response = client.synthesize_speech(
@@ -215,16 +229,11 @@ def speak():
             audio_config=audio_config
         )
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-            temp_file.write(response.audio_content)
-            temp_file_path = temp_file.name
-
-        return send_file(temp_file_path, mimetype='audio/mpeg', as_attachment=True, download_name='response.mp3')
+        tts_cache.put(cache_key, response.audio_content)
+        return audio_response(response.audio_content, audio_format.mimetype, download_name, etag=cache_key, cache_status="MISS")
 
     except Exception as e:
         logger.error(f"Error al generar audio: {str(e)}")
-        if 'temp_file_path' in locals():
-            os.unlink(temp_file_path)
         return jsonify({"error": f"Error al generar audio: {str(e)}"}), 500
 
 # Ruta para la URL raíz
@@ -235,7 +244,8 @@ def home():
 # Iniciar el servidor Flask
 if __name__ == '__main__':
     try:
-        app.run(host='0.0.0.0', port=8080, debug=True, ssl_context=('/home/cris/voz_robotica/cert.pem', '/home/cris/voz_robotica/key.pem'))
+        ssl_context = tuple(SSL_FILES) if all(os.path.exists(path) for path in SSL_FILES) else None
+        app.run(host='0.0.0.0', port=8080, debug=True, ssl_context=ssl_context)
     except Exception as e:
         logger.error(f"Error al iniciar el servidor: {str(e)}")
         raise
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+
+# appv2 se importa en las pruebas: sin scraper de fondo ni carga anticipada de modelos
+os.environ.setdefault("SCRAPE_ACTIVITIES", "0")
+os.environ.setdefault("STARTUP_MODE", "lazy")
+os.environ.setdefault("STARTUP_WARMUP_DELAY", "3600")
@@ -0,0 +1,32 @@
+import pytest
+
+from app.modules.ai_query import classify
+
+
+@pytest.mark.parametrize("text", [
+    "What is the capital of Ukraine?",
+    "How does the brain work?",
+    "Who trained the team?",
+])
+def test_rain_matches_whole_words_only(text):
+    assert "climate" not in classify(text)
+
+
+def test_trail_does_not_match_trailer():
+    assert "activity" not in classify("Qual o melhor trailer do filme?")
+
+
+def test_papa_is_accent_sensitive():
+    assert "pope" not in classify("Mi papá está en casa")
+    assert "pope" in classify("Quem é o papa atual?")
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Will it rain tomorrow?", "climate"),
+    ("Como está o clima hoje?", "climate"),
+    ("Quero fazer trilhas em Maricá", "activity"),
+    ("Quais são as notícias de hoje?", "news"),
+    ("¿Qué hora es?", "time"),
+])
+def test_keywords_still_match(text, intent):
+    assert intent in classify(text)
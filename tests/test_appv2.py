@@ -0,0 +1,65 @@
+import pytest
+
+import appv2
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("llamada a OpenWeatherMap")
+
+    monkeypatch.setattr(appv2.openweather_api, "get", no_network)
+
+
+@pytest.mark.parametrize("text, city", [
+    ("tempo em Rezende", "Resende"),
+    ("qual o tempo em Niteroy hoje?", "Niterói"),
+    ("tiempo en saquaremma", "Saquarema"),
+    ("Como está o clima hoje?", "Maricá"),
+])
+def test_extract_city_resolves_misspelled_places_offline(offline, text, city):
+    assert appv2.extract_city(text) == city
+
+
+def test_extract_city_geocodes_the_whole_place_phrase(monkeypatch):
+    asked = []
+
+    def geocode_city(city):
+        asked.append(city)
+        return [{"name": "Xyzville", "lat": 0, "lon": 0, "country": "BR"}]
+
+    monkeypatch.setattr(appv2, "geocode_city", geocode_city)
+    assert appv2.extract_city("qual o tempo em Xyzville Grande hoje?") == "Xyzville"
+    assert asked == ["Xyzville Grande"]
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        yield b"audio"
+
+    def close(self):
+        self.closed = True
+
+
+def test_converse_finishes_the_tts_flight_when_the_client_leaves_before_the_body(monkeypatch):
+    from app.modules.speech_synthesis import stream_audio_response, tts_flight
+
+    upstream = FakeUpstream()
+    key = "converse-disconnect"
+    call, leader = tts_flight.begin(key)
+    assert leader
+
+    monkeypatch.setattr(appv2, "transcribe_upload", lambda audio, language=None: ({"text": "oi"}, 200))
+    monkeypatch.setattr(appv2, "answer_question", lambda data: ({"response": "olá"}, 200))
+    monkeypatch.setattr(appv2, "synthesize_speech", lambda data: stream_audio_response(
+        upstream, "audio/wav", "response.wav", on_close=lambda: tts_flight.finish(key, call)))
+
+    response = appv2.app.test_client().post("/converse", data={"voice": "pt-BR-YaraNeural"})
+    response.close()
+
+    assert upstream.closed
+    assert call.done.is_set()
+    assert tts_flight.begin(key)[1]
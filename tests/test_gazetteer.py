@@ -0,0 +1,39 @@
+import pytest
+
+from app.modules.gazetteer import find_place_in_text, resolve_place
+
+
+def test_recognition_aliases_are_not_scanned_in_sentences():
+    assert find_place_in_text("Eu direi que vai chover em Niterói?").name == "Niterói"
+    assert find_place_in_text("Posso nadar no rio hoje?") is None
+    assert find_place_in_text("green park") is None
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("direi", "Grimsby"),
+    ("rio", "Rio de Janeiro"),
+    ("Marica", "Maricá"),
+    ("Saquaremma", "Saquarema"),
+])
+def test_whole_candidates_still_resolve(name, expected):
+    assert resolve_place(name).name == expected
+
+
+def test_short_names_are_not_fuzzy_matched():
+    assert resolve_place("Maria") is None
+
+
+@pytest.mark.parametrize("word", ["rua", "ra", "ré", "mae", "maçã", "mar"])
+def test_short_words_are_not_phonetic_matches(word):
+    assert resolve_place(word) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("tempo em Rezende", "Resende"),
+    ("tiempo en saquaremma", "Saquarema"),
+    ("onde fica a rua principal", None),
+    ("quero comer uma maçã", None),
+])
+def test_misspelled_places_in_sentences(text, expected):
+    place = find_place_in_text(text)
+    assert (place.name if place else None) == expected
@@ -0,0 +1,40 @@
+import pytest
+
+from app.modules import startup
+from app.modules.news import NewsCache
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(startup, "INSTANCE_LOCK_DIR", str(tmp_path))
+    return str(tmp_path / "news.json")
+
+
+def fetch_counter(calls):
+    def fetch(query):
+        calls.append(query)
+        return [{"title": f"{query} {len(calls)}"}]
+    return fetch
+
+
+def test_other_workers_read_the_shared_snapshot(snapshot):
+    calls = []
+    leader, other = NewsCache(snapshot_path=snapshot), NewsCache(snapshot_path=snapshot)
+    leader.refresh("regional", "Maricá", fetch_counter(calls))
+    articles, freshness = other.get("regional", "Maricá", fetch_counter(calls))
+    assert articles == [{"title": "Maricá 1"}]
+    assert calls == ["Maricá"]
+    assert not freshness["stale"]
+
+
+def test_refresh_if_older_skips_profiles_refreshed_by_another_worker(snapshot):
+    calls = []
+    leader, other = NewsCache(snapshot_path=snapshot), NewsCache(snapshot_path=snapshot)
+    assert leader.refresh_if_older("regional", "Maricá", fetch_counter(calls), max_age=3000)
+    assert not other.refresh_if_older("regional", "Maricá", fetch_counter(calls), max_age=3000)
+    assert calls == ["Maricá"]
+
+
+def test_stale_threshold_is_the_configured_interval(snapshot):
+    cache = NewsCache(refresh_interval=3600, snapshot_path=snapshot)
+    assert cache.refresh_interval == 3600
@@ -0,0 +1,25 @@
+from app.modules.speech_synthesis import stream_audio_response, tts_flight
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        yield b"audio"
+
+    def close(self):
+        self.closed = True
+
+
+def test_closing_an_unread_stream_closes_upstream_and_finishes_the_flight():
+    upstream = FakeUpstream()
+    call, leader = tts_flight.begin("unread")
+    assert leader
+
+    response = stream_audio_response(upstream, "audio/wav", "response.wav", on_close=lambda: tts_flight.finish("unread", call))
+    response.close()
+
+    assert upstream.closed
+    assert call.done.is_set()
+    assert tts_flight.begin("unread")[1]
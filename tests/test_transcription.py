@@ -0,0 +1,45 @@
+import struct
+
+import pytest
+
+from app.modules.recognition import PRECOMPILED_FORMATS
+from app.modules.transcription import sniff_audio, can_passthrough, stream_transcripts
+
+
+def ogg_page(granule, payload):
+    # Cabecera de página Ogg: versión, tipo, posición granular, serie, secuencia, CRC (sin comprobar), segmentos
+    return b"OggS" + struct.pack("<BBqIIIB", 0, 0, granule, 1, 0, 0, 1) + bytes([len(payload)]) + payload
+
+
+def ogg_opus(seconds, channels=1, pre_skip=312):
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, channels, pre_skip, 48000, 0, 0)
+    return ogg_page(0, head) + ogg_page(0, b"OpusTags") + ogg_page(pre_skip + seconds * 48000, b"\x00" * 40)
+
+
+def test_default_config_passes_ogg_opus_through():
+    sniffed = sniff_audio(ogg_opus(3))
+    assert sniffed.encoding == "OGG_OPUS"
+    assert sniffed.duration_ms == 3000
+    assert can_passthrough(sniffed)
+    assert ("OGG_OPUS", 48000) in PRECOMPILED_FORMATS
+
+
+def test_stereo_opus_is_transcoded():
+    assert not can_passthrough(sniff_audio(ogg_opus(3, channels=2)))
+
+
+def test_wav_is_transcoded():
+    assert not can_passthrough(sniff_audio(b"RIFF\x00\x00\x00\x00WAVEfmt " + b"\x00" * 64))
+
+
+def test_streaming_recognize_gets_the_timeout():
+    speech = pytest.importorskip("google.cloud.speech")
+
+    class FakeClient:
+        def streaming_recognize(self, config, requests, timeout=None):
+            self.timeout = timeout
+            return []
+
+    client = FakeClient()
+    list(stream_transcripts(client, speech.RecognitionConfig(), [b"\x00"], timeout=7.5))
+    assert client.timeout == 7.5
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from app.modules.vad import trim_silence
+
+SAMPLE_RATE = 16000
+
+
+def tone(seconds, amplitude):
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * 220 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))
+
+
+def noise(seconds, amplitude, seed=0):
+    return np.random.default_rng(seed).normal(0, amplitude, int(SAMPLE_RATE * seconds))
+
+
+def pcm(*parts):
+    return np.clip(np.concatenate(parts), -32768, 32767).astype("<i2").tobytes()
+
+
+@pytest.mark.parametrize("amplitude", [800, 3000])
+def test_noisy_silence_is_rejected(amplitude):
+    result = trim_silence(pcm(noise(4, amplitude)))
+    assert result.pcm == b""
+
+
+def test_short_speech_in_long_silence_is_kept():
+    result = trim_silence(pcm(noise(6, 300), tone(0.4, 6000), noise(3, 300, seed=1)))
+    assert result.speech_ms >= 300
+    assert result.output_ms < 1500
+
+
+def test_speech_over_background_noise_is_trimmed_to_the_speech():
+    speech = tone(1.5, 6000) + noise(1.5, 600, seed=1)
+    result = trim_silence(pcm(noise(2, 600), speech, noise(2, 600, seed=2)))
+    assert 1400 <= result.speech_ms <= 1600
+    assert result.output_ms < 2500